@@ -0,0 +1,92 @@
+"""
+Benchmark the compiled template engine against recursive interpolation.
+
+Renders the per-registry registry config, compose service, Traefik router and
+Traefik service from config.sample.yaml for a synthetic fleet of registries,
+once with the historical path (deep copy + interpolate_strings on every tree)
+and once with templates compiled a single time up front.
+
+Usage:
+    python benchmarks/bench_templates.py [--sizes 10,100,1000,10000]
+"""
+
+import argparse
+import copy
+import time
+
+import yaml
+
+from multi_registry_cache import functions
+
+
+def make_registries(count):
+    """Return ``count`` synthetic cache registries."""
+    return [
+        {
+            'name': f'mirror{i}',
+            'type': 'cache',
+            'url': f'https://mirror{i}.example.com',
+            'username': 'user',
+            'password': 'pass',
+            'ttl': '720h',
+        }
+        for i in range(count)
+    ]
+
+
+def interpolate_path(config, registries):
+    """Render every registry the way generate did before compiled templates."""
+    for db, registry in enumerate(registries):
+        functions.create_registry_config(copy.deepcopy(config['registry']['baseConfig']), registry, db)
+        functions.create_docker_service(registry, config['docker']['perRegistry']['compose'])
+        functions.create_traefik_router(registry, config['traefik']['perRegistry']['router'])
+        functions.create_traefik_service(registry, config['traefik']['perRegistry']['service'])
+
+
+def compiled_path(config, registries):
+    """Render every registry with templates compiled once."""
+    registry_template = functions.compile_template(config['registry']['baseConfig'])
+    compose_template = functions.compile_template(config['docker']['perRegistry']['compose'])
+    router_template = functions.compile_template(config['traefik']['perRegistry']['router'])
+    service_template = functions.compile_template(config['traefik']['perRegistry']['service'])
+    for db, registry in enumerate(registries):
+        functions.create_registry_config(registry_template, registry, db)
+        functions.create_docker_service(registry, compose_template)
+        functions.create_traefik_router(registry, router_template)
+        functions.create_traefik_service(registry, service_template)
+
+
+def best_of(func, repeat, *args):
+    """Return the best wall-clock time of ``repeat`` runs of ``func(*args)``."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--config', default='config.sample.yaml', help='Config file providing the templates')
+    parser.add_argument('--sizes', default='10,100,1000,10000', help='Comma-separated registry counts')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement (best is kept)')
+    args = parser.parse_args()
+
+    with open(args.config, 'r', encoding='UTF-8') as file:
+        config = yaml.safe_load(file)
+
+    # Rich still renders text when quiet, so drop console output entirely:
+    # only the template rendering is being measured here
+    functions.console.print = lambda *args, **kwargs: None
+
+    print(f"{'registries':>10}  {'interpolate (s)':>15}  {'compiled (s)':>12}  {'speedup':>7}")
+    for size in (int(value) for value in args.sizes.split(',')):
+        registries = make_registries(size)
+        old = best_of(interpolate_path, args.repeat, config, registries)
+        new = best_of(compiled_path, args.repeat, config, registries)
+        print(f"{size:>10}  {old:>15.4f}  {new:>12.4f}  {old / new:>6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark YAML emission of large compose.yaml/traefik.yaml documents.
+
+Builds a synthetic fleet from config.sample.yaml and writes the compose and
+Traefik documents three ways: a single pure-Python ``yaml.dump``, a single
+libyaml ``yaml.dump``, and the streaming emitter used by ``write_yaml_file``.
+Reports wall-clock time and memory for each. Every method runs in its own
+process, whose maximum resident set size (``ru_maxrss``) is read once the
+documents are built and again after the dump, so libyaml's C allocations are
+counted too. A dump that stays below the first value does not raise the peak.
+
+Usage:
+    python benchmarks/bench_yaml.py [--sizes 1000,10000]
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+from multi_registry_cache import functions
+
+
+class _PurePythonDumper(yaml.Dumper):
+    """Pure-Python dumper, the historical write_yaml_file behaviour."""
+
+    def ignore_aliases(self, data):
+        return True
+
+
+def make_documents(config, count):
+    """
+    Return the compose and Traefik documents for ``count`` synthetic registries.
+
+    Parameters
+    ----------
+    config : dict
+        The parsed config providing base configs and per-registry templates.
+    count : int
+        Number of registries.
+
+    Returns
+    -------
+    tuple of (dict, dict)
+        The compose and Traefik documents.
+    """
+    compose = functions.compile_template(config['docker']['perRegistry']['compose'])
+    router = functions.compile_template(config['traefik']['perRegistry']['router'])
+    service = functions.compile_template(config['traefik']['perRegistry']['service'])
+
+    docker_config = {**config['docker']['baseConfig'], 'services': dict(config['docker']['baseConfig']['services'])}
+    traefik_config = {**config['traefik']['baseConfig'], 'http': {'routers': {}, 'services': {}}}
+    for i in range(count):
+        registry = {'name': f'mirror{i}', 'type': 'cache', 'url': f'https://mirror{i}.example.com'}
+        docker_config['services'][registry['name']] = compose.render(registry)
+        traefik_config['http']['routers'][registry['name']] = router.render(registry)
+        traefik_config['http']['services'][registry['name']] = service.render(registry)
+    return docker_config, traefik_config
+
+
+def dump_pure_python(documents, directory):
+    """Dump each document at once with the pure-Python dumper."""
+    for index, document in enumerate(documents):
+        with open(os.path.join(directory, f'{index}.yaml'), 'w', encoding='UTF-8') as file:
+            yaml.dump(document, file, Dumper=_PurePythonDumper)
+
+
+def dump_libyaml(documents, directory):
+    """Dump each document at once with the libyaml dumper."""
+    for index, document in enumerate(documents):
+        with open(os.path.join(directory, f'{index}.yaml'), 'w', encoding='UTF-8') as file:
+            yaml.dump(document, file, Dumper=functions._NoAliasDumper)
+
+
+def dump_streamed(documents, directory):
+    """Stream each document with the emitter used by write_yaml_file."""
+    for index, document in enumerate(documents):
+        with open(os.path.join(directory, f'{index}.yaml'), 'w', encoding='UTF-8') as file:
+            functions.stream_yaml(document, file)
+
+
+METHODS = {'pure-python': dump_pure_python, 'libyaml': dump_libyaml, 'streamed': dump_streamed}
+
+
+def _max_rss():
+    """Return the maximum resident set size of this process, in bytes."""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def measure(config, size, method):
+    """Return the wall-clock time of dumping ``size`` registries with ``method``, and the maximum RSS (bytes) before and after."""
+    documents = make_documents(config, size)
+    with tempfile.TemporaryDirectory() as directory:
+        before = _max_rss()
+        start = time.perf_counter()
+        METHODS[method](documents, directory)
+        elapsed = time.perf_counter() - start
+        return elapsed, before, _max_rss()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--config', default='config.sample.yaml', help='Config file providing the templates')
+    parser.add_argument('--sizes', default='1000,10000', help='Comma-separated registry counts')
+    parser.add_argument('--child', nargs=2, metavar=('METHOD', 'SIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        # One measurement in a fresh process, whose maximum RSS only grows with this run
+        with open(args.config, 'r', encoding='UTF-8') as file:
+            config = functions.load_yaml(file)
+        print(*measure(config, int(args.child[1]), args.child[0]))
+        return
+
+    print(f"libyaml available: {yaml.__with_libyaml__}")
+    print(f"{'registries':>10}  {'method':<12}  {'time (s)':>8}  {'before (MiB)':>12}  {'peak (MiB)':>10}")
+    for size in (int(value) for value in args.sizes.split(',')):
+        for method in METHODS:
+            output = subprocess.run(
+                [sys.executable, __file__, '--config', args.config, '--child', method, str(size)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            elapsed, before, peak = (float(value) for value in output.split())
+            print(f"{size:>10}  {method:<12}  {elapsed:>8.3f}  {before / 2 ** 20:>12.1f}  {peak / 2 ** 20:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
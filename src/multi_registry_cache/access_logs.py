@@ -0,0 +1,350 @@
+"""
+Traefik access-log analyzer for the multi-registry cache environment.
+
+Streams Traefik access logs (CLF or JSON, optionally gzip-rotated) and reports
+per registry the number of requests, the bytes served and the latency
+percentiles of manifest and blob requests.
+
+Usage:
+    Called via the CLI: multi-registry-cache analyze-logs [--config config.yaml] LOGFILE...
+"""
+
+import gzip
+import json
+import math
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from rich.table import Table
+from rich.text import Text
+
+from multi_registry_cache import functions, inventory
+from multi_registry_cache.functions import ENDPOINT_RULES, console
+
+# Requests whose router does not belong to a registry of config.yaml
+OTHER = '(other)'
+REQUEST_KINDS = ('manifests', 'blobs', 'other')
+DEFAULT_RELATIVE_ACCURACY = 0.01
+# Log files are read through a buffer of this size, one line at a time
+READ_BUFFER_SIZE = 1 << 20
+
+# Traefik's CLF: <client> - <user> [<time>] "<method> <path> <proto>" <status> <size> "<referer>"
+# "<user agent>" <request count> "<router>" "<server URL>" <duration>ms
+_CLF_LINE = re.compile(
+    rb'^\S+ \S+ \S+ \[[^\]]*\] "\S+ (?P<path>\S+)[^"]*" (?P<status>\d{3}) (?P<size>\d+|-) '
+    rb'"[^"]*" "[^"]*" \S+ "(?P<router>[^"]*)" "[^"]*" (?P<duration>\d+)ms'
+)
+
+
+class LatencySketch:
+    """
+    Mergeable quantile sketch with a bounded relative error.
+
+    Values are counted in logarithmic buckets (as in DDSketch): any quantile
+    is returned within `relative_accuracy` of the exact value, memory only
+    grows with the logarithm of the value range, and two sketches are merged
+    by adding their bucket counts.
+    """
+
+    __slots__ = ('relative_accuracy', 'count', 'zero_count', 'buckets', '_gamma', '_log_gamma')
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.count = 0
+        self.zero_count = 0
+        self.buckets = {}
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+
+    def add(self, value):
+        """Count one value; values <= 0 are kept in a bucket of their own."""
+        self.count += 1
+        if value <= 0:
+            self.zero_count += 1
+        else:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            self.buckets[key] = self.buckets.get(key, 0) + 1
+
+    def merge(self, other):
+        """
+        Add the values counted by another sketch.
+
+        Raises
+        ------
+        ValueError
+            If the sketches do not have the same relative accuracy.
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracies")
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def quantile(self, q):
+        """Return the approximate q-quantile (0 <= q <= 1), or None if the sketch is empty."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return 2 * self._gamma ** key / (self._gamma + 1)
+        return 2 * self._gamma ** max(self.buckets) / (self._gamma + 1)
+
+
+def request_kind(path):
+    """
+    Classify a registry API request path.
+
+    Parameters
+    ----------
+    path : str
+        The request path, possibly with a query string.
+
+    Returns
+    -------
+    str
+        'manifests' for manifests and tag lists, 'blobs' for blobs, 'other'
+        for everything else (``/v2/``, uploads, catalog...).
+    """
+    path = path.split('?', 1)[0]
+    if '/manifests/' in path or path.endswith('/tags/list'):
+        return 'manifests'
+    if '/blobs/' in path and '/blobs/uploads/' not in path:
+        return 'blobs'
+    return 'other'
+
+
+def registry_for_router(router, registry_names):
+    """
+    Map a Traefik router name back to its registry.
+
+    Parameters
+    ----------
+    router : str
+        The router name as logged, e.g. ``dockerhub@file`` or ``dockerhub-blobs@file``.
+    registry_names : set of str
+        The registry names from config.yaml.
+
+    Returns
+    -------
+    str
+        The registry name, or OTHER if the router is not generated for a registry.
+    """
+    name = router.split('@', 1)[0]
+    if name in registry_names:
+        return name
+    # Endpoint routers are named {name}-manifests / {name}-blobs
+    base, _, endpoint = name.rpartition('-')
+    if endpoint in ENDPOINT_RULES and base in registry_names:
+        return base
+    return OTHER
+
+
+def parse_line(line):
+    """
+    Parse one Traefik access log line, in JSON or CLF.
+
+    Parameters
+    ----------
+    line : bytes
+        The log line.
+
+    Returns
+    -------
+    tuple of (str, str, int, int, float) or None
+        The router name, request path, status, response size in bytes and
+        duration in milliseconds, or None if the line cannot be parsed.
+    """
+    if line.startswith(b'{'):
+        try:
+            entry = json.loads(line)
+            return (
+                entry.get('RouterName', ''),
+                entry['RequestPath'],
+                int(entry['DownstreamStatus']),
+                int(entry.get('DownstreamContentSize', 0)),
+                entry['Duration'] / 1e6,
+            )
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    match = _CLF_LINE.match(line)
+    if match is None:
+        return None
+    size = match['size']
+    return (
+        match['router'].decode('utf-8', 'replace'),
+        match['path'].decode('utf-8', 'replace'),
+        int(match['status']),
+        0 if size == b'-' else int(size),
+        float(match['duration']),
+    )
+
+
+def empty_stats():
+    """Return the statistics of a registry that served no request."""
+    return {
+        'requests': 0,
+        'bytes': 0,
+        'errors': 0,
+        'latency': {kind: LatencySketch() for kind in REQUEST_KINDS},
+    }
+
+
+def analyze_file(path, registry_names):
+    """
+    Analyze one access log file in constant memory.
+
+    Parameters
+    ----------
+    path : str
+        Path of the log file; files ending with ``.gz`` are decompressed on the fly.
+    registry_names : set of str
+        The registry names from config.yaml.
+
+    Returns
+    -------
+    dict
+        'registries' (mapping of registry name to its statistics, see
+        `empty_stats`), 'lines' and 'skipped' (unparsable lines).
+    """
+    registries = {}
+    # A log only names a handful of routers: map each of them once
+    router_registries = {}
+    lines = skipped = 0
+    if path.endswith('.gz'):
+        file = gzip.open(path, 'rb')
+    else:
+        file = open(path, 'rb', buffering=READ_BUFFER_SIZE)
+    with file:
+        for line in file:
+            lines += 1
+            parsed = parse_line(line)
+            if parsed is None:
+                skipped += 1
+                continue
+            router, request_path, status, size, duration = parsed
+            name = router_registries.get(router)
+            if name is None:
+                name = router_registries[router] = registry_for_router(router, registry_names)
+            stats = registries.get(name)
+            if stats is None:
+                stats = registries[name] = empty_stats()
+            stats['requests'] += 1
+            stats['bytes'] += size
+            if status >= 500:
+                stats['errors'] += 1
+            stats['latency'][request_kind(request_path)].add(duration)
+    return {'registries': registries, 'lines': lines, 'skipped': skipped}
+
+
+def merge_results(result, other):
+    """
+    Merge the result of `analyze_file` for another file into `result`.
+
+    Returns
+    -------
+    dict
+        `result`, updated in place.
+    """
+    result['lines'] += other['lines']
+    result['skipped'] += other['skipped']
+    for name, other_stats in other['registries'].items():
+        stats = result['registries'].setdefault(name, empty_stats())
+        for key in ('requests', 'bytes', 'errors'):
+            stats[key] += other_stats[key]
+        for kind, sketch in other_stats['latency'].items():
+            stats['latency'][kind].merge(sketch)
+    return result
+
+
+def analyze_logs(config_path="config.yaml", paths=(), jobs=1):
+    """
+    Analyze Traefik access logs and print a per-registry report.
+
+    Parameters
+    ----------
+    config_path : str
+        Path to the config.yaml file, used to map routers to registries.
+        Defaults to "config.yaml".
+    paths : iterable of str
+        Access log files, e.g. ``access.log access.log.1 access.log.2.gz``.
+    jobs : int
+        Number of files analyzed in parallel, each in its own process.
+        Defaults to 1.
+
+    Returns
+    -------
+    dict
+        'registries' (mapping of registry name to 'requests', 'bytes',
+        'errors' (5xx) and 'latency', a LatencySketch in milliseconds per
+        request kind), 'lines' and 'skipped'.
+    """
+    try:
+        with open(config_path, 'r', encoding='UTF-8') as file:
+            base_config = functions.load_yaml(file)
+            console.print(Text("Config loaded successfully", style="bold green"))
+    except FileNotFoundError:
+        console.print(Text(f"Error: {config_path} not found", style="bold red"))
+        raise
+    try:
+        registry_names = {registry['name'] for registry in inventory.load_registries(base_config, config_path)}
+    except ValueError as e:
+        console.print(Text(f"Error: {e}", style="bold red"))
+        raise
+
+    paths = list(paths)
+    result = {'registries': {}, 'lines': 0, 'skipped': 0}
+    try:
+        if jobs > 1 and len(paths) > 1:
+            with ProcessPoolExecutor(max_workers=min(jobs, len(paths))) as executor:
+                for file_result in executor.map(analyze_file, paths, [registry_names] * len(paths)):
+                    merge_results(result, file_result)
+        else:
+            for path in paths:
+                merge_results(result, analyze_file(path, registry_names))
+    except OSError as e:
+        console.print(Text(f"Error reading access log: {e}", style="bold red"))
+        raise
+
+    _print_report(result)
+    if result['skipped']:
+        console.print(Text(f"{result['skipped']} of {result['lines']} line(s) could not be parsed", style="bold yellow"))
+    return result
+
+
+def _print_report(result):
+    """Print the per-registry report, busiest registry first."""
+    table = Table(title="Traefik access logs")
+    columns = ("Registry", "Requests", "Served", "Manifest p50", "Manifest p99", "Blob p50", "Blob p99", "5xx")
+    for column in columns:
+        table.add_column(column, justify="left" if column == "Registry" else "right")
+    registries = sorted(result['registries'].items(), key=lambda item: (-item[1]['bytes'], item[0]))
+    for name, stats in registries:
+        manifests, blobs = stats['latency']['manifests'], stats['latency']['blobs']
+        table.add_row(
+            name,
+            str(stats['requests']),
+            functions.format_bytes(stats['bytes']),
+            _format_duration(manifests.quantile(0.5)),
+            _format_duration(manifests.quantile(0.99)),
+            _format_duration(blobs.quantile(0.5)),
+            _format_duration(blobs.quantile(0.99)),
+            str(stats['errors']),
+        )
+    console.print(table)
+
+
+def _format_duration(milliseconds):
+    """Format a duration in milliseconds, or '-' for None."""
+    if milliseconds is None:
+        return "-"
+    if milliseconds >= 1000:
+        return f"{milliseconds / 1000:.2f} s"
+    return f"{milliseconds:.0f} ms"
+
@@ -1,9 +1,11 @@
 """
 CLI entry point for the multi-registry cache configuration generator.
 
-Provides two subcommands:
+Provides four subcommands:
 - setup: Interactive wizard to create a config.yaml
 - generate: Generate Docker Compose, Traefik, and registry config files
+- warm: Pull images through the caches to pre-populate them
+- analyze-logs: Report per-registry traffic and latency from Traefik access logs
 """
 
 import sys
@@ -26,6 +28,8 @@ _multi-registry-cache() {
     commands=(
         'setup:Interactive wizard to create a config.yaml file'
         'generate:Generate Docker Compose, Traefik, and registry config files'
+        'warm:Pull images through the caches to pre-populate them'
+        'analyze-logs:Report per-registry traffic and latency from Traefik access logs'
         'completion:Print shell completion script'
     )
 
@@ -48,8 +52,38 @@ _multi-registry-cache() {
                     _arguments \\
                         '(-c --config)'{-c,--config}'[Config file path]:path:_files' \\
                         '(-o --output-dir)'{-o,--output-dir}'[Output directory]:dir:_directories' \\
+                        '(-f --force)'{-f,--force}'[Ignore the manifest and render every registry]' \\
+                        '(-j --jobs)'{-j,--jobs}'[Number of parallel workers]:jobs:' \\
+                        '--check[Fail if existing Redis assignments would change]' \\
+                        '(-w --watch)'{-w,--watch}'[Regenerate when the config or its registry sources change]' \\
+                        '--debounce[Seconds without a change that end a burst of saves]:seconds:' \\
+                        '--dry-run[Print the docker compose command instead of running it]' \\
                         '(-h --help)'{-h,--help}'[Show help]'
                     ;;
+                warm)
+                    _arguments \\
+                        '(-c --config)'{-c,--config}'[Config file path]:path:_files' \\
+                        '(-f --file)'{-f,--file}'[File listing image references]:path:_files' \\
+                        '--state[Resume state file]:path:_files' \\
+                        '(-n --concurrency)'{-n,--concurrency}'[Concurrent requests per cache]:concurrency:' \\
+                        '*--registry-concurrency[Concurrent requests for one cache (NAME=N)]:limit:' \\
+                        '--max-connections[Concurrent requests over all caches]:connections:' \\
+                        '*--platform[Platform of multi-arch images to warm]:platform:' \\
+                        '--endpoint[URL to connect to instead of the cache hostnames]:url:' \\
+                        '--insecure[Do not verify TLS certificates]' \\
+                        '--timeout[Socket timeout in seconds]:seconds:' \\
+                        '--restart[Ignore the state of a previous run]' \\
+                        '--tier[Tier whose caches are warmed]:tier:' \\
+                        '(-h --help)'{-h,--help}'[Show help]' \\
+                        '*:image:'
+                    ;;
+                analyze-logs)
+                    _arguments \\
+                        '(-c --config)'{-c,--config}'[Config file path]:path:_files' \\
+                        '(-j --jobs)'{-j,--jobs}'[Number of files analyzed in parallel]:jobs:' \\
+                        '(-h --help)'{-h,--help}'[Show help]' \\
+                        '*:log file:_files'
+                    ;;
                 completion)
                     _arguments \\
                         '1:shell:(zsh bash fish)'
@@ -68,7 +102,7 @@ _multi_registry_cache() {
     COMPREPLY=()
     cur="${COMP_WORDS[COMP_CWORD]}"
     prev="${COMP_WORDS[COMP_CWORD-1]}"
-    commands="setup generate completion"
+    commands="setup generate warm analyze-logs completion"
 
     if [[ ${COMP_CWORD} -eq 1 ]]; then
         COMPREPLY=( $(compgen -W "${commands}" -- "${cur}") )
@@ -80,7 +114,13 @@ _multi_registry_cache() {
             COMPREPLY=( $(compgen -W "--config -c --help -h" -- "${cur}") )
             ;;
         generate)
-            COMPREPLY=( $(compgen -W "--config -c --output-dir -o --help -h" -- "${cur}") )
+            COMPREPLY=( $(compgen -W "--config -c --output-dir -o --force -f --jobs -j --check --watch -w --debounce --dry-run --help -h" -- "${cur}") )
+            ;;
+        warm)
+            COMPREPLY=( $(compgen -W "--config -c --file -f --state --concurrency -n --registry-concurrency --max-connections --platform --endpoint --insecure --timeout --restart --tier --help -h" -- "${cur}") )
+            ;;
+        analyze-logs)
+            COMPREPLY=( $(compgen -f -W "--config -c --jobs -j --help -h" -- "${cur}") )
             ;;
         completion)
             COMPREPLY=( $(compgen -W "zsh bash fish" -- "${cur}") )
@@ -95,10 +135,33 @@ _FISH_COMPLETION = """\
 complete -c multi-registry-cache -f
 complete -c multi-registry-cache -n '__fish_use_subcommand' -a setup -d 'Interactive wizard to create a config.yaml file'
 complete -c multi-registry-cache -n '__fish_use_subcommand' -a generate -d 'Generate Docker Compose, Traefik, and registry config files'
+complete -c multi-registry-cache -n '__fish_use_subcommand' -a warm -d 'Pull images through the caches to pre-populate them'
+complete -c multi-registry-cache -n '__fish_use_subcommand' -a analyze-logs -d 'Report per-registry traffic and latency from Traefik access logs'
 complete -c multi-registry-cache -n '__fish_use_subcommand' -a completion -d 'Print shell completion script'
 complete -c multi-registry-cache -n '__fish_seen_subcommand_from setup' -s c -l config -d 'Output config file path' -r
 complete -c multi-registry-cache -n '__fish_seen_subcommand_from generate' -s c -l config -d 'Config file path' -r
 complete -c multi-registry-cache -n '__fish_seen_subcommand_from generate' -s o -l output-dir -d 'Output directory' -r -a '(__fish_complete_directories)'
+complete -c multi-registry-cache -n '__fish_seen_subcommand_from generate' -s f -l force -d 'Ignore the manifest and render every registry'
+complete -c multi-registry-cache -n '__fish_seen_subcommand_from generate' -s j -l jobs -d 'Number of parallel workers' -r
+complete -c multi-registry-cache -n '__fish_seen_subcommand_from generate' -l check -d 'Fail if existing Redis assignments would change'
+complete -c multi-registry-cache -n '__fish_seen_subcommand_from generate' -s w -l watch -d 'Regenerate when the config or its registry sources change'
+complete -c multi-registry-cache -n '__fish_seen_subcommand_from generate' -l debounce -d 'Seconds without a change that end a burst of saves' -r
+complete -c multi-registry-cache -n '__fish_seen_subcommand_from generate' -l dry-run -d 'Print the docker compose command instead of running it'
+complete -c multi-registry-cache -n '__fish_seen_subcommand_from warm' -s c -l config -d 'Config file path' -r
+complete -c multi-registry-cache -n '__fish_seen_subcommand_from warm' -s f -l file -d 'File listing image references' -r
+complete -c multi-registry-cache -n '__fish_seen_subcommand_from warm' -l state -d 'Resume state file' -r
+complete -c multi-registry-cache -n '__fish_seen_subcommand_from warm' -s n -l concurrency -d 'Concurrent requests per cache' -r
+complete -c multi-registry-cache -n '__fish_seen_subcommand_from warm' -l registry-concurrency -d 'Concurrent requests for one cache (NAME=N)' -r
+complete -c multi-registry-cache -n '__fish_seen_subcommand_from warm' -l max-connections -d 'Concurrent requests over all caches' -r
+complete -c multi-registry-cache -n '__fish_seen_subcommand_from warm' -l platform -d 'Platform of multi-arch images to warm' -r
+complete -c multi-registry-cache -n '__fish_seen_subcommand_from warm' -l endpoint -d 'URL to connect to instead of the cache hostnames' -r
+complete -c multi-registry-cache -n '__fish_seen_subcommand_from warm' -l insecure -d 'Do not verify TLS certificates'
+complete -c multi-registry-cache -n '__fish_seen_subcommand_from warm' -l timeout -d 'Socket timeout in seconds' -r
+complete -c multi-registry-cache -n '__fish_seen_subcommand_from warm' -l restart -d 'Ignore the state of a previous run'
+complete -c multi-registry-cache -n '__fish_seen_subcommand_from warm' -l tier -d 'Tier whose caches are warmed' -r
+complete -c multi-registry-cache -n '__fish_seen_subcommand_from analyze-logs' -s c -l config -d 'Config file path' -r
+complete -c multi-registry-cache -n '__fish_seen_subcommand_from analyze-logs' -s j -l jobs -d 'Number of files analyzed in parallel' -r
+complete -c multi-registry-cache -n '__fish_seen_subcommand_from analyze-logs' -F
 complete -c multi-registry-cache -n '__fish_seen_subcommand_from completion' -a 'zsh bash fish'
 """
 
@@ -123,11 +186,94 @@ def setup(
 def generate(
     config: str = typer.Option("config.yaml", "--config", "-c", help="Config file path"),
     output_dir: str = typer.Option("compose", "--output-dir", "-o", help="Output directory for generated files"),
+    force: bool = typer.Option(False, "--force", "-f", help="Ignore the manifest and render every registry again"),
+    jobs: int = typer.Option(1, "--jobs", "-j", min=1, help="Number of parallel workers rendering and writing registry configs"),
+    check: bool = typer.Option(False, "--check", help="Only check that existing Redis assignments would be kept; write nothing"),
+    watch: bool = typer.Option(False, "--watch", "-w", help="Keep running, regenerate when the config or its registry sources change and recreate the affected services"),
+    debounce: float = typer.Option(0.5, "--debounce", min=0, help="With --watch, seconds without a change that end a burst of saves"),
+    dry_run: bool = typer.Option(False, "--dry-run", help="With --watch, print the docker compose command instead of running it"),
 ):
     """Generate Docker Compose, Traefik, and registry config files from a config.yaml."""
     from multi_registry_cache.generate import generate as run_generate
+    from multi_registry_cache.redis_topology import AllocationChangedError
+
+    if watch:
+        if check:
+            raise typer.BadParameter("cannot be combined with --watch", param_hint="--check")
+        from multi_registry_cache.watch import dry_run_reload
+        from multi_registry_cache.watch import watch as run_watch
+
+        try:
+            run_watch(
+                config_path=config, output_dir=output_dir, force=force, jobs=jobs,
+                reload=dry_run_reload if dry_run else None, debounce=debounce,
+            )
+        except KeyboardInterrupt:
+            pass
+        return
+    if dry_run:
+        raise typer.BadParameter("only applies to --watch", param_hint="--dry-run")
+
+    try:
+        run_generate(config_path=config, output_dir=output_dir, force=force, jobs=jobs, check=check)
+    except AllocationChangedError:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def warm(
+    images: list[str] = typer.Argument(None, help="Image references, e.g. nginx:1.27 or ghcr.io/owner/app:1.2"),
+    config: str = typer.Option("config.yaml", "--config", "-c", help="Config file path"),
+    file: str = typer.Option(None, "--file", "-f", help="File listing image references, one per line"),
+    state: str = typer.Option(".warm-state.json", "--state", help="Resume state file, removed after a complete run"),
+    concurrency: int = typer.Option(4, "--concurrency", "-n", min=1, help="Concurrent requests per cache"),
+    registry_concurrency: list[str] = typer.Option(None, "--registry-concurrency", help="Concurrent requests for one cache, as NAME=N (repeatable)"),
+    max_connections: int = typer.Option(16, "--max-connections", min=1, help="Concurrent requests over all caches"),
+    platform: list[str] = typer.Option(None, "--platform", help="Platform of multi-arch images to warm, e.g. linux/amd64 (repeatable; default: all)"),
+    endpoint: str = typer.Option(None, "--endpoint", help="URL to connect to instead of the cache hostnames, e.g. http://127.0.0.1"),
+    insecure: bool = typer.Option(False, "--insecure", help="Do not verify TLS certificates"),
+    timeout: float = typer.Option(300.0, "--timeout", min=1, help="Socket timeout in seconds"),
+    restart: bool = typer.Option(False, "--restart", help="Ignore the state of a previous run"),
+    tier: str = typer.Option(None, "--tier", help="With tiers, the tier whose caches are warmed (default: the only tier)"),
+):
+    """Pull images through the caches to pre-populate them."""
+    from multi_registry_cache.warm import WarmError
+    from multi_registry_cache.warm import warm as run_warm
+
+    images = list(images or [])
+    if file is not None:
+        with open(file, 'r', encoding='UTF-8') as lines:
+            images.extend(line.split('#', 1)[0].strip() for line in lines if line.split('#', 1)[0].strip())
+    if not images:
+        raise typer.BadParameter("no image given", param_hint="IMAGES")
+
+    limits = {}
+    for limit in registry_concurrency or []:
+        name, _, value = limit.partition('=')
+        if not value.isdigit() or int(value) < 1:
+            raise typer.BadParameter(f"expected NAME=N, got {limit!r}", param_hint="--registry-concurrency")
+        limits[name] = int(value)
+
+    try:
+        run_warm(
+            config_path=config, images=images, state_path=state, concurrency=concurrency,
+            registry_concurrency=limits, max_connections=max_connections, platforms=platform or None,
+            endpoint=endpoint, insecure=insecure, timeout=timeout, restart=restart, tier=tier,
+        )
+    except WarmError:
+        raise typer.Exit(code=1)
+
+
+@app.command("analyze-logs")
+def analyze_logs(
+    logs: list[str] = typer.Argument(..., help="Traefik access log files, plain or .gz (e.g. rotated files)"),
+    config: str = typer.Option("config.yaml", "--config", "-c", help="Config file path"),
+    jobs: int = typer.Option(1, "--jobs", "-j", min=1, help="Number of files analyzed in parallel"),
+):
+    """Report per-registry traffic and latency from Traefik access logs."""
+    from multi_registry_cache.access_logs import analyze_logs as run_analyze_logs
 
-    run_generate(config_path=config, output_dir=output_dir)
+    run_analyze_logs(config_path=config, paths=logs, jobs=jobs)
 
 
 @app.command()
@@ -0,0 +1,200 @@
+"""
+HTTP/3 and TLS settings of the Traefik HTTPS entry point.
+
+``traefik.http3`` enables HTTP/3 on the HTTPS entry point and publishes the
+matching UDP port on the traefik Compose service, so clients can reuse QUIC
+connections (with 0-RTT resumption) instead of paying a TCP and TLS handshake
+for every layer connection. ``traefik.tls`` sets the default TLS options
+(minimum version, curve preferences) and the key type of the ACME
+certificates.
+"""
+
+from multi_registry_cache.functions import deep_merge
+
+DEFAULT_ENTRYPOINT = 'websecure'
+TLS_VERSIONS = ('VersionTLS10', 'VersionTLS11', 'VersionTLS12', 'VersionTLS13')
+CURVES = ('X25519', 'CurveP256', 'CurveP384', 'CurveP521')
+KEY_TYPES = ('EC256', 'EC384', 'RSA2048', 'RSA4096', 'RSA8192')
+TLS_KEYS = ('minVersion', 'curvePreferences', 'keyType')
+
+
+def validate_http3(settings):
+    """
+    Validate the ``traefik.http3`` setting.
+
+    Parameters
+    ----------
+    settings : bool or dict
+        ``true`` to enable HTTP/3 on the ``websecure`` entry point, or a mapping
+        with the ``entryPoint`` to use.
+
+    Returns
+    -------
+    str or None
+        The name of the entry point, or None if HTTP/3 is disabled.
+
+    Raises
+    ------
+    ValueError
+        If the setting is not a boolean or a mapping with only ``entryPoint``.
+    """
+    if isinstance(settings, bool):
+        return DEFAULT_ENTRYPOINT if settings else None
+    if not isinstance(settings, dict):
+        raise ValueError(f"traefik.http3 must be true, false or a mapping, got {settings!r}")
+    unknown = sorted(set(settings) - {'entryPoint'})
+    if unknown:
+        raise ValueError(f"Unknown traefik.http3 setting(s): {', '.join(unknown)}")
+    entry_point = settings.get('entryPoint', DEFAULT_ENTRYPOINT)
+    if not isinstance(entry_point, str) or not entry_point:
+        raise ValueError(f"traefik.http3.entryPoint must be an entry point name, got {entry_point!r}")
+    return entry_point
+
+
+def address_port(address):
+    """Return the port of an entry point address such as ``:443`` or ``0.0.0.0:443/tcp``."""
+    port = str(address).rpartition(':')[2].split('/')[0]
+    if not port.isdigit():
+        raise ValueError(f"Cannot read the port of entry point address {address!r}")
+    return int(port)
+
+
+def _published_port(port_spec):
+    """
+    Parse a Compose port mapping.
+
+    Returns
+    -------
+    tuple of (str or None, int, str) or None
+        The published (host) part, which may include an IP, the container port
+        and the protocol, or None if the mapping cannot be read (e.g. a range).
+    """
+    if isinstance(port_spec, dict):
+        target = port_spec.get('target')
+        if not isinstance(target, int):
+            return None
+        published = port_spec.get('published')
+        return (None if published is None else str(published)), target, port_spec.get('protocol', 'tcp')
+    spec, _, protocol = str(port_spec).partition('/')
+    host, _, container = spec.rpartition(':')
+    if not container.isdigit():
+        return None
+    return (host or None), int(container), protocol or 'tcp'
+
+
+def enable_http3(traefik_config, traefik_service, entry_point):
+    """
+    Enable HTTP/3 on an entry point and publish its UDP port.
+
+    The UDP port is published on the same host port as the entry point's TCP
+    port, and Traefik advertises that host port in its ``Alt-Svc`` header.
+    Traefik v2 also needs ``experimental.http3``.
+
+    Parameters
+    ----------
+    traefik_config : dict
+        The Traefik base config, modified in place.
+    traefik_service : dict or None
+        The traefik Compose service, modified in place: a ``<port>/udp``
+        mapping is added to its ``ports`` unless present. None when the
+        service is not defined in ``docker.baseConfig``.
+    entry_point : str
+        The name of the HTTPS entry point.
+
+    Raises
+    ------
+    ValueError
+        If the entry point is not defined or its port cannot be read.
+    """
+    entry_points = traefik_config.get('entryPoints') or {}
+    if entry_point not in entry_points:
+        raise ValueError(f"traefik.http3 requires the {entry_point!r} entry point in traefik.baseConfig.entryPoints")
+    port = address_port(entry_points[entry_point].get('address', ''))
+
+    host_port = str(port)
+    if traefik_service is not None:
+        mappings = [_published_port(spec) for spec in traefik_service.get('ports') or []]
+        tcp = next((m for m in mappings if m is not None and m[1] == port and m[2] == 'tcp'), None)
+        if tcp is not None and tcp[0] is not None:
+            host_port = tcp[0]
+        if not any(m is not None and m[1] == port and m[2] == 'udp' for m in mappings):
+            traefik_service['ports'] = [*(traefik_service.get('ports') or []), f'{host_port}:{port}/udp']
+
+    http3 = {}
+    advertised = host_port.rpartition(':')[2]
+    if advertised.isdigit() and int(advertised) != port:
+        # Clients reach the entry point on another port than the one it listens on
+        http3['advertisedPort'] = int(advertised)
+    entry_points[entry_point] = {**entry_points[entry_point], 'http3': http3}
+
+    image = str((traefik_service or {}).get('image', ''))
+    if image.startswith('traefik:v2') or image.startswith('traefik:2'):
+        traefik_config['experimental'] = {**(traefik_config.get('experimental') or {}), 'http3': True}
+
+
+def validate_tls(settings):
+    """
+    Validate the ``traefik.tls`` settings.
+
+    Parameters
+    ----------
+    settings : dict
+        ``minVersion``, ``curvePreferences`` (list) and ``keyType``.
+
+    Returns
+    -------
+    dict
+        The settings.
+
+    Raises
+    ------
+    ValueError
+        If a key is unknown or a value is not supported by Traefik.
+    """
+    if not isinstance(settings, dict):
+        raise ValueError(f"traefik.tls must be a mapping, got {settings!r}")
+    unknown = sorted(set(settings) - set(TLS_KEYS))
+    if unknown:
+        raise ValueError(f"Unknown traefik.tls setting(s): {', '.join(unknown)}")
+    if 'minVersion' in settings and settings['minVersion'] not in TLS_VERSIONS:
+        raise ValueError(f"traefik.tls.minVersion must be one of {', '.join(TLS_VERSIONS)}, got {settings['minVersion']!r}")
+    if 'curvePreferences' in settings:
+        curves = settings['curvePreferences']
+        if not isinstance(curves, list) or not curves or any(curve not in CURVES for curve in curves):
+            raise ValueError(f"traefik.tls.curvePreferences must be a list of {', '.join(CURVES)}, got {curves!r}")
+    if 'keyType' in settings and settings['keyType'] not in KEY_TYPES:
+        raise ValueError(f"traefik.tls.keyType must be one of {', '.join(KEY_TYPES)}, got {settings['keyType']!r}")
+    return settings
+
+
+def apply_tls(traefik_config, settings):
+    """
+    Apply the ``traefik.tls`` settings to the Traefik base config.
+
+    ``minVersion`` and ``curvePreferences`` are merged into the ``default``
+    TLS options, used by every router without its own. ``keyType`` is set on
+    every ACME certificate resolver.
+
+    Parameters
+    ----------
+    traefik_config : dict
+        The Traefik base config, modified in place.
+    settings : dict
+        The validated settings.
+
+    Returns
+    -------
+    list of str
+        The names of the certificate resolvers given the key type.
+    """
+    options = {key: settings[key] for key in ('minVersion', 'curvePreferences') if key in settings}
+    if options:
+        traefik_config['tls'] = deep_merge(traefik_config.get('tls') or {}, {'options': {'default': options}})
+
+    resolvers = []
+    if 'keyType' in settings:
+        for name, resolver in (traefik_config.get('certificatesResolvers') or {}).items():
+            if isinstance(resolver, dict) and isinstance(resolver.get('acme'), dict):
+                resolver['acme'] = {**resolver['acme'], 'keyType': settings['keyType']}
+                resolvers.append(name)
+    return resolvers
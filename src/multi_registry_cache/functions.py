@@ -5,15 +5,47 @@ This module provides all functions needed to set up a multi-registry environment
 configuration files for Docker Compose, Registry and Traefik.
 """
 
+import filecmp
 import os
 import secrets
+import shutil
 
 import yaml
 from rich.console import Console
 from rich.text import Text
 
+# Prefer the libyaml bindings, which are much faster, when PyYAML was built with them
+try:
+    from yaml import CDumper as _BaseDumper
+    from yaml import CSafeLoader as _SafeLoader
+except ImportError:
+    from yaml import Dumper as _BaseDumper
+    from yaml import SafeLoader as _SafeLoader
+
 console = Console()
 
+# Health check added to the Traefik service of registries with several replicas
+REPLICA_HEALTH_CHECK = {'path': '/v2/', 'interval': '10s', 'timeout': '3s'}
+
+# Path rules (Traefik v2 syntax) of the routers generate can add next to each registry's router
+ENDPOINT_RULES = {
+    'manifests': "Path(`/v2/{repository:.+}/manifests/{reference}`) || Path(`/v2/{repository:.+}/tags/list`)",
+    'blobs': "PathPrefix(`/v2/{repository:.+}/blobs/`)",
+}
+ENDPOINT_OPTIONS = ('compress', 'forwardingTimeouts')
+
+# Distribution storage middlewares that redirect blob downloads to a CDN, with their required options
+STORAGE_MIDDLEWARES = {
+    'cloudfront': ('baseurl', 'privatekey', 'keypairid'),
+    'redirect': ('baseurl',),
+}
+# Storage drivers that cannot redirect clients: blobs always stream through the registry
+NON_REDIRECTING_DRIVERS = ('inmemory', 'filesystem')
+
+# Mappings nested up to this depth are emitted entry by entry when streaming YAML,
+# e.g. compose.yaml > services > <service> or traefik.yaml > http > routers > <router>
+STREAM_DEPTH = 3
+
 
 def interpolate_strings(obj, variables):
     """
@@ -41,6 +73,132 @@ def interpolate_strings(obj, variables):
         return obj
 
 
+class CompiledTemplate:
+    """
+    A template tree compiled once and rendered for many registries.
+
+    Compilation records which string leaves contain ``{placeholder}`` fields.
+    Subtrees without any placeholder are returned as-is by :meth:`render`
+    and therefore shared between every rendered result, so only the
+    variable slots are formatted for each registry.
+
+    Parameters
+    ----------
+    obj : dict or list or str
+        The template to compile.
+    """
+
+    __slots__ = ('source', '_render')
+
+    def __init__(self, obj):
+        self.source = obj
+        self._render = _compile_node(obj)
+
+    @property
+    def is_static(self):
+        """bool: True when the template contains no placeholder at all."""
+        return self._render is None
+
+    def render(self, variables):
+        """
+        Render the template with the given variables.
+
+        Parameters
+        ----------
+        variables : dict
+            A dictionary of variables to substitute using Python's str.format_map.
+
+        Returns
+        -------
+        dict or list or str
+            The rendered object. Placeholder-free subtrees are shared with the
+            template source and must not be mutated by the caller.
+        """
+        if self._render is None:
+            return self.source
+        return self._render(variables)
+
+
+def _compile_node(obj):
+    """
+    Compile a template node into a render function.
+
+    Parameters
+    ----------
+    obj : dict or list or str
+        The template node to compile.
+
+    Returns
+    -------
+    callable or None
+        A function taking the variables dict and returning the rendered node,
+        or None when the node contains no placeholder and can be shared as-is.
+    """
+    if isinstance(obj, str):
+        # Strings without braces are left untouched by str.format_map
+        if '{' in obj or '}' in obj:
+            return obj.format_map
+        return None
+    elif isinstance(obj, dict):
+        slots = [(key, value, _compile_node(value)) for key, value in obj.items()]
+        if all(render is None for _, _, render in slots):
+            return None
+
+        def render_dict(variables):
+            return {key: value if render is None else render(variables) for key, value, render in slots}
+        return render_dict
+    elif isinstance(obj, list):
+        slots = [(elem, _compile_node(elem)) for elem in obj]
+        if all(render is None for _, render in slots):
+            return None
+
+        def render_list(variables):
+            return [elem if render is None else render(variables) for elem, render in slots]
+        return render_list
+    else:
+        return None
+
+
+def compile_template(obj):
+    """
+    Compile a template so it can be rendered cheaply for every registry.
+
+    Parameters
+    ----------
+    obj : dict or list or str or CompiledTemplate
+        The template to compile. Already compiled templates are returned unchanged.
+
+    Returns
+    -------
+    CompiledTemplate
+        The compiled template.
+    """
+    if isinstance(obj, CompiledTemplate):
+        return obj
+    return CompiledTemplate(obj)
+
+
+def render_template(template, variables):
+    """
+    Render a raw or compiled template with the given variables.
+
+    Parameters
+    ----------
+    template : dict or list or str or CompiledTemplate
+        The template to render.
+    variables : dict
+        A dictionary of variables to substitute using Python's str.format_map.
+
+    Returns
+    -------
+    dict or list or str
+        The rendered object.
+    """
+    if isinstance(template, CompiledTemplate):
+        return template.render(variables)
+    return interpolate_strings(template, variables)
+
+
 def create_docker_service(registry, custom=None):
     """
     Create a Docker Compose service definition for a registry.
@@ -49,7 +207,7 @@ def create_docker_service(registry, custom=None):
     ----------
     registry : dict
         A dictionary containing the registry information (name, url, etc.).
-    custom : dict, optional
+    custom : dict or CompiledTemplate, optional
         A dictionary of customizations to apply to the docker service.
 
     Returns
@@ -60,11 +218,8 @@ def create_docker_service(registry, custom=None):
     if custom is None:
         custom = {}
 
-    obj = {}
-    obj.update(custom)
-
     console.print(Text("Docker service created for the registry", style="green"))
-    return interpolate_strings(obj, registry)
+    return render_template(custom, registry)
 
 
 def create_traefik_router(registry, custom=None):
@@ -75,7 +230,7 @@ def create_traefik_router(registry, custom=None):
     ----------
     registry : dict
         A dictionary containing the registry information.
-    custom : dict, optional
+    custom : dict or CompiledTemplate, optional
         A dictionary of custom router properties.
 
     Returns
@@ -86,14 +241,11 @@ def create_traefik_router(registry, custom=None):
     if custom is None:
         custom = {}
 
-    obj = {}
-    obj.update(custom)
-
     console.print(Text("Traefik router object created", style="green"))
-    return interpolate_strings(obj, registry)
+    return render_template(custom, registry)
 
 
-def create_traefik_service(registry, custom=None):
+def create_traefik_service(registry, custom=None, backends=None, servers_transport=None):
     """
     Create a Traefik service object with a load balancer pointing to the registry.
 
@@ -101,8 +253,15 @@ def create_traefik_service(registry, custom=None):
     ----------
     registry : dict
         A dictionary containing the registry information.
-    custom : dict, optional
+    custom : dict or CompiledTemplate, optional
         A dictionary of custom configuration options.
+    backends : list of str, optional
+        The Compose service names of the registry replicas. When given, the
+        ``loadBalancer.servers`` template is rendered once per backend, with
+        ``{name}`` set to the backend name, and a health check is added unless
+        the template defines one.
+    servers_transport : str, optional
+        The name of the Traefik serversTransport the load balancer must use.
 
     Returns
     -------
@@ -112,59 +271,522 @@ def create_traefik_service(registry, custom=None):
     if custom is None:
         custom = {}
 
-    obj = {}
-    obj.update(custom)
+    service = render_template(custom, registry)
+    if servers_transport is not None and isinstance(service, dict) and isinstance(service.get('loadBalancer'), dict):
+        service = {**service, 'loadBalancer': {**service['loadBalancer'], 'serversTransport': servers_transport}}
+    if backends is not None and isinstance(service, dict) and isinstance(service.get('loadBalancer'), dict):
+        source = custom.source if isinstance(custom, CompiledTemplate) else custom
+        server_templates = source['loadBalancer'].get('servers') or []
+        load_balancer = dict(service['loadBalancer'])
+        load_balancer['servers'] = [
+            interpolate_strings(server, {**registry, 'name': backend})
+            for backend in backends
+            for server in server_templates
+        ]
+        # Take replicas that stop answering out of the round robin
+        load_balancer.setdefault('healthCheck', dict(REPLICA_HEALTH_CHECK))
+        service = {**service, 'loadBalancer': load_balancer}
+        if 'sticky' in load_balancer:
+            console.print(Text(
+                f"Sticky sessions are enabled for {registry['name']}: clients stay on one replica",
+                style="yellow"
+            ))
 
     console.print(Text("Traefik service object created", style="green"))
-    return interpolate_strings(obj, registry)
+    return service
+
+
+def create_traefik_servers_transport(registry, custom=None, override=None):
+    """
+    Create a Traefik serversTransport for the connections to a registry.
+
+    Parameters
+    ----------
+    registry : dict
+        A dictionary containing the registry information.
+    custom : dict or CompiledTemplate, optional
+        The serversTransport template shared by all registries.
+    override : dict, optional
+        Registry-specific settings, deep-merged over the rendered template.
+
+    Returns
+    -------
+    dict
+        The interpolated serversTransport definition.
+
+    Raises
+    ------
+    ValueError
+        If the transport settings have the wrong type.
+    """
+    if custom is None:
+        custom = {}
+    if override is not None and not isinstance(override, dict):
+        raise ValueError(f"transport must be a mapping, got {override!r}")
+
+    transport = render_template(custom, registry)
+    if override:
+        transport = deep_merge(transport, interpolate_strings(override, registry))
+
+    max_idle = transport.get('maxIdleConnsPerHost')
+    if max_idle is not None and (isinstance(max_idle, bool) or not isinstance(max_idle, int) or max_idle < 0):
+        raise ValueError(f"maxIdleConnsPerHost must be a non-negative integer, got {max_idle!r}")
+    if not isinstance(transport.get('disableHTTP2', False), bool):
+        raise ValueError(f"disableHTTP2 must be true or false, got {transport['disableHTTP2']!r}")
+    if not isinstance(transport.get('forwardingTimeouts', {}), dict):
+        raise ValueError(f"forwardingTimeouts must be a mapping, got {transport['forwardingTimeouts']!r}")
+
+    console.print(Text("Traefik serversTransport object created", style="green"))
+    return transport
+
+
+def validate_endpoint_routers(settings):
+    """
+    Validate the ``traefik.endpointRouters`` settings.
+
+    Parameters
+    ----------
+    settings : dict
+        Mapping of endpoint ('manifests' or 'blobs') to its options: ``compress``
+        (bool) and ``forwardingTimeouts`` (mapping). An endpoint is enabled
+        when present, even with no options.
+
+    Returns
+    -------
+    dict
+        The settings, with None values replaced by empty options.
+
+    Raises
+    ------
+    ValueError
+        If an endpoint or option is unknown, has the wrong type, or if
+        compression is requested for blobs.
+    """
+    if not isinstance(settings, dict):
+        raise ValueError(f"endpointRouters must be a mapping, got {settings!r}")
+
+    endpoints = {}
+    for endpoint, options in settings.items():
+        if endpoint not in ENDPOINT_RULES:
+            raise ValueError(f"Unknown endpoint router {endpoint!r}, expected one of {', '.join(ENDPOINT_RULES)}")
+        options = options or {}
+        if not isinstance(options, dict):
+            raise ValueError(f"endpointRouters.{endpoint} must be a mapping, got {options!r}")
+        unknown = sorted(set(options) - set(ENDPOINT_OPTIONS))
+        if unknown:
+            raise ValueError(f"Unknown endpointRouters.{endpoint} option(s): {', '.join(unknown)}")
+        if not isinstance(options.get('compress', False), bool):
+            raise ValueError(f"endpointRouters.{endpoint}.compress must be true or false, got {options['compress']!r}")
+        if endpoint == 'blobs' and options.get('compress'):
+            # Layers are already compressed: gzip would only burn CPU and break streaming
+            raise ValueError("endpointRouters.blobs.compress is not supported, blobs are already compressed")
+        if not isinstance(options.get('forwardingTimeouts', {}), dict):
+            raise ValueError(f"endpointRouters.{endpoint}.forwardingTimeouts must be a mapping")
+        endpoints[endpoint] = options
+    return endpoints
+
+
+def create_endpoint_routers(name, router, service, endpoints, transport=None, base_middlewares=None):
+    """
+    Create the routers dedicated to the manifest and blob endpoints of a registry.
+
+    Each router is a copy of the registry router, restricted to the endpoint
+    paths. The registry router keeps serving every other request (``/v2/``,
+    uploads, catalog...), as Traefik prefers the longer, more specific rules.
+
+    Parameters
+    ----------
+    name : str
+        The registry name, used to name the generated objects.
+    router : dict
+        The rendered registry router.
+    service : dict
+        The rendered registry Traefik service.
+    endpoints : dict
+        The validated ``traefik.endpointRouters`` settings.
+    transport : dict, optional
+        The registry serversTransport, used as the base of endpoint transports.
+    base_middlewares : dict, optional
+        The middlewares defined in ``traefik.baseConfig.http.middlewares``, used
+        to drop compress and buffering middlewares from the blobs router.
 
+    Returns
+    -------
+    dict
+        The Traefik objects to merge into the ``http`` section, keyed by kind
+        ('routers', 'services', 'middlewares', 'serversTransports').
+    """
+    if base_middlewares is None:
+        base_middlewares = {}
+
+    fragments = {'routers': {}, 'services': {}, 'middlewares': {}, 'serversTransports': {}}
+    for endpoint, options in endpoints.items():
+        endpoint_name = f'{name}-{endpoint}'
+        endpoint_router = dict(router)
+        endpoint_router['rule'] = f"({router['rule']}) && ({ENDPOINT_RULES[endpoint]})"
+        if 'priority' in router:
+            endpoint_router['priority'] = router['priority'] + 1
+        middlewares = list(router.get('middlewares') or [])
+
+        if endpoint == 'blobs':
+            # Stream blobs as they come: no buffering of multi-GB bodies, no compression
+            middlewares = [
+                middleware for middleware in middlewares
+                if not {'compress', 'buffering'} & set(base_middlewares.get(middleware.split('@')[0]) or {})
+            ]
+        if options.get('compress'):
+            compress_name = f'{name}-compress'
+            fragments['middlewares'][compress_name] = {'compress': {}}
+            middlewares.append(compress_name)
+        if middlewares:
+            endpoint_router['middlewares'] = middlewares
+        else:
+            endpoint_router.pop('middlewares', None)
+
+        if options.get('forwardingTimeouts') and isinstance(service.get('loadBalancer'), dict):
+            # Timeouts belong to a serversTransport, hence a service of the endpoint's own
+            fragments['serversTransports'][endpoint_name] = deep_merge(
+                transport or {}, {'forwardingTimeouts': options['forwardingTimeouts']}
+            )
+            fragments['services'][endpoint_name] = {
+                **service, 'loadBalancer': {**service['loadBalancer'], 'serversTransport': endpoint_name}
+            }
+            endpoint_router['service'] = endpoint_name
+
+        fragments['routers'][endpoint_name] = endpoint_router
+
+    console.print(Text("Traefik endpoint routers created", style="green"))
+    return {kind: objects for kind, objects in fragments.items() if objects}
+
+
+def deep_merge(base, override):
+    """
+    Recursively merge two dictionaries without mutating either of them.
 
-def create_registry_config(config, registry, db):
+    Parameters
+    ----------
+    base : dict
+        The base dictionary.
+    override : dict
+        The dictionary whose values take precedence. Nested dictionaries are
+        merged, any other value replaces the base value.
+
+    Returns
+    -------
+    dict
+        The merged dictionary.
+    """
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def replica_names(registry):
+    """
+    Return the Compose service names of a registry's replicas.
+
+    Parameters
+    ----------
+    registry : dict
+        The registry information, with an optional ``replicas`` count.
+
+    Returns
+    -------
+    list of str
+        ``[name]`` for a single replica, otherwise ``[name-1, ..., name-N]``.
+    """
+    replicas = registry.get('replicas', 1)
+    if replicas == 1:
+        return [registry['name']]
+    return [f"{registry['name']}-{index}" for index in range(1, replicas + 1)]
+
+
+def resolve_storage_redirect(settings, override=None):
+    """
+    Resolve and validate the ``storageRedirect`` settings of a registry.
+
+    Parameters
+    ----------
+    settings : bool or dict or None
+        The global ``storageRedirect`` section. ``true`` and ``false`` are
+        short for ``{enabled: true}`` and ``{enabled: false}``.
+    override : bool or dict, optional
+        The registry's own ``storageRedirect``: a boolean replaces the global
+        settings, a mapping is merged over them.
+
+    Returns
+    -------
+    dict or None
+        ``enabled`` (bool) and ``cdn`` (the storage middleware, with ``name``
+        and ``options``, or None), or None when neither is set.
+
+    Raises
+    ------
+    ValueError
+        If a setting is unknown, has the wrong type, or a CDN middleware
+        lacks one of its required options.
+    """
+    resolved = None
+    for section in (settings, override):
+        if section is None:
+            continue
+        if isinstance(section, bool):
+            resolved = {'enabled': section}
+            continue
+        if not isinstance(section, dict):
+            raise ValueError(f"storageRedirect must be true, false or a mapping, got {section!r}")
+        resolved = deep_merge(resolved or {}, section)
+    if resolved is None:
+        return None
+
+    unknown = sorted(set(resolved) - {'enabled', 'cdn'})
+    if unknown:
+        raise ValueError(f"Unknown storageRedirect setting(s): {', '.join(unknown)}")
+    enabled = resolved.get('enabled', True)
+    if not isinstance(enabled, bool):
+        raise ValueError(f"storageRedirect.enabled must be true or false, got {enabled!r}")
+
+    cdn = resolved.get('cdn')
+    if cdn is not None:
+        if not isinstance(cdn, dict) or cdn.get('name') not in STORAGE_MIDDLEWARES:
+            raise ValueError(f"storageRedirect.cdn.name must be one of {', '.join(STORAGE_MIDDLEWARES)}, got {cdn!r}")
+        unknown = sorted(set(cdn) - {'name', 'options'})
+        if unknown:
+            raise ValueError(f"Unknown storageRedirect.cdn setting(s): {', '.join(unknown)}")
+        options = cdn.get('options') or {}
+        if not isinstance(options, dict):
+            raise ValueError(f"storageRedirect.cdn.options must be a mapping, got {options!r}")
+        missing = [option for option in STORAGE_MIDDLEWARES[cdn['name']] if not options.get(option)]
+        if missing:
+            raise ValueError(f"storageRedirect.cdn {cdn['name']} requires option(s): {', '.join(missing)}")
+        cdn = {'name': cdn['name'], 'options': options}
+    return {'enabled': enabled, 'cdn': cdn}
+
+
+def create_registry_config(config, registry, db, addr=None, storage_redirect=None):
     """
     Create a registry configuration by merging base config with registry-specific values.
 
     For cache-type registries, sets the proxy remote URL, credentials, and TTL.
     For regular registries, removes the proxy block entirely.
     Assigns an auto-incrementing Redis database number.
+    With storage redirects, sets ``storage.redirect`` and adds the CDN
+    storage middleware.
 
     Parameters
     ----------
-    config : dict
-        The base registry configuration to update (will be mutated).
+    config : dict or CompiledTemplate
+        The base registry configuration template. It is never mutated.
     registry : dict
         The registry information (name, type, url, username, password, ttl).
     db : int
         The Redis database number to assign to this registry.
+    addr : str, optional
+        The Redis address to use instead of the one from the base config,
+        when registries are spread across several Redis shards.
+    storage_redirect : dict, optional
+        The settings returned by `resolve_storage_redirect`.
 
     Returns
     -------
     dict
         The fully interpolated registry configuration.
     """
-    if registry['type'] == 'cache':
-        config['proxy']['remoteurl'] = registry['url']
-        if 'username' in registry and 'password' in registry:
-            config['proxy']['username'] = registry['username']
-            config['proxy']['password'] = registry['password']
-        if 'ttl' in registry:
-            config['proxy']['ttl'] = registry['ttl']
-    elif 'proxy' in config:
-        del config['proxy']
+    interpolated = render_template(config, registry)
+
+    if isinstance(interpolated, dict):
+        # Copy the top level so shared template subtrees are never mutated below
+        interpolated = dict(interpolated)
+
+        if registry['type'] == 'cache':
+            proxy = dict(interpolated['proxy'] or {})
+            proxy['remoteurl'] = interpolate_strings(registry['url'], registry)
+            if 'username' in registry and 'password' in registry:
+                proxy['username'] = interpolate_strings(registry['username'], registry)
+                proxy['password'] = interpolate_strings(registry['password'], registry)
+            if 'ttl' in registry:
+                proxy['ttl'] = interpolate_strings(registry['ttl'], registry)
+            interpolated['proxy'] = proxy
+        elif 'proxy' in interpolated:
+            del interpolated['proxy']
 
-    interpolated = interpolate_strings(config, registry)
-
-    if isinstance(interpolated, dict) and 'redis' in interpolated:
         redis_config = interpolated.get('redis')
         if isinstance(redis_config, dict):
-            redis_config['db'] = int(db)
+            interpolated['redis'] = {**redis_config, 'db': int(db)}
+            if addr is not None:
+                interpolated['redis']['addr'] = addr
+
+        if storage_redirect is not None:
+            # Clients then fetch blobs from the object storage (or the CDN) instead of through the registry
+            interpolated['storage'] = {
+                **(interpolated.get('storage') or {}),
+                'redirect': {'disable': not storage_redirect['enabled']},
+            }
+            if storage_redirect['enabled'] and storage_redirect['cdn'] is not None:
+                cdn = interpolate_strings(storage_redirect['cdn'], registry)
+                middleware = dict(interpolated.get('middleware') or {})
+                middleware['storage'] = [
+                    entry for entry in middleware.get('storage') or [] if entry.get('name') != cdn['name']
+                ] + [cdn]
+                interpolated['middleware'] = middleware
 
     console.print(Text("Registry configuration created", style="green"))
     return interpolated
 
 
+class _NoAliasDumper(_BaseDumper):
+    """YAML dumper that never emits anchors, as rendered templates share subtrees."""
+
+    def ignore_aliases(self, data):
+        return True
+
+
+def load_yaml(stream):
+    """
+    Parse a YAML document with the safe loader, using libyaml when available.
+
+    Parameters
+    ----------
+    stream : str or file
+        The YAML document or an open file containing it.
+
+    Returns
+    -------
+    object
+        The parsed document.
+    """
+    return yaml.load(stream, Loader=_SafeLoader)
+
+
+def dump_yaml(data):
+    """
+    Serialize data to a YAML string.
+
+    Parameters
+    ----------
+    data : dict
+        The data to serialize.
+
+    Returns
+    -------
+    str
+        The YAML document.
+    """
+    return yaml.dump(data, Dumper=_NoAliasDumper)
+
+
+def stream_yaml(data, stream):
+    """
+    Serialize data to a YAML stream one mapping entry at a time.
+
+    ``yaml.dump`` represents the whole document as a node graph before emitting
+    anything. Here mappings up to ``STREAM_DEPTH`` levels deep are emitted
+    entry by entry, and only the value of each entry is represented at once,
+    which keeps memory bounded for documents with thousands of services or
+    routers. The output is identical to :func:`dump_yaml`. The data itself is
+    not streamed: it is a complete document, built by the caller.
+
+    Parameters
+    ----------
+    data : dict
+        The data to serialize.
+    stream : file
+        An open text file to write to.
+    """
+    dumper = _NoAliasDumper(stream)
+    try:
+        dumper.emit(yaml.StreamStartEvent())
+        dumper.emit(yaml.DocumentStartEvent(explicit=False))
+        _emit_streamed(dumper, data, 0)
+        dumper.emit(yaml.DocumentEndEvent(explicit=False))
+        dumper.emit(yaml.StreamEndEvent())
+    finally:
+        dumper.dispose()
+
+
+def _emit_streamed(dumper, data, depth):
+    """
+    Emit the events for a value, streaming mappings shallower than ``STREAM_DEPTH``.
+
+    Parameters
+    ----------
+    dumper : _NoAliasDumper
+        The dumper to emit to.
+    data : object
+        The value to emit.
+    depth : int
+        The nesting depth of the value in the document.
+    """
+    if not isinstance(data, dict) or depth >= STREAM_DEPTH:
+        for event in _node_events(dumper, dumper.represent_data(data)):
+            dumper.emit(event)
+        # Drop what the representer kept around, as Representer.represent() does
+        dumper.represented_objects = {}
+        dumper.object_keeper = []
+        dumper.alias_key = None
+        return
+
+    # Same key order as yaml.dump's default sort_keys=True
+    try:
+        keys = sorted(data)
+    except TypeError:
+        keys = list(data)
+
+    dumper.emit(yaml.MappingStartEvent(None, None, True, flow_style=False))
+    for key in keys:
+        _emit_streamed(dumper, key, STREAM_DEPTH)
+        _emit_streamed(dumper, data[key], depth + 1)
+    dumper.emit(yaml.MappingEndEvent())
+
+
+def _node_events(dumper, node):
+    """
+    Yield the serialization events of a represented node, without anchors.
+
+    Parameters
+    ----------
+    dumper : _NoAliasDumper
+        The dumper whose resolver decides implicit tags.
+    node : yaml.Node
+        The node to serialize.
+
+    Yields
+    ------
+    yaml.Event
+        The events describing the node.
+    """
+    if isinstance(node, yaml.ScalarNode):
+        detected_tag = dumper.resolve(yaml.ScalarNode, node.value, (True, False))
+        default_tag = dumper.resolve(yaml.ScalarNode, node.value, (False, True))
+        implicit = (node.tag == detected_tag), (node.tag == default_tag)
+        yield yaml.ScalarEvent(None, node.tag, implicit, node.value, style=node.style)
+    elif isinstance(node, yaml.SequenceNode):
+        implicit = node.tag == dumper.resolve(yaml.SequenceNode, node.value, True)
+        yield yaml.SequenceStartEvent(None, node.tag, implicit, flow_style=node.flow_style)
+        for item in node.value:
+            yield from _node_events(dumper, item)
+        yield yaml.SequenceEndEvent()
+    elif isinstance(node, yaml.MappingNode):
+        implicit = node.tag == dumper.resolve(yaml.MappingNode, node.value, True)
+        yield yaml.MappingStartEvent(None, node.tag, implicit, flow_style=node.flow_style)
+        for key, value in node.value:
+            yield from _node_events(dumper, key)
+            yield from _node_events(dumper, value)
+        yield yaml.MappingEndEvent()
+
+
 def write_yaml_file(filename, data):
     """
-    Write data to a YAML file.
+    Stream data to a YAML file, leaving it untouched if the content is identical.
+
+    The document is streamed to a temporary file next to ``filename``, which
+    is then copied over it only if the bytes differ. The file is rewritten in
+    place rather than replaced, so it keeps its inode: a container that
+    bind-mounts the single file (e.g. traefik.yaml) sees the new content.
 
     Parameters
     ----------
@@ -172,15 +794,42 @@ def write_yaml_file(filename, data):
         The path of the file to write to.
     data : dict
         The data to serialize as YAML.
+
+    Returns
+    -------
+    bool
+        True if the file was written, False if its content was already identical.
     """
-    with open(filename, 'w', encoding='UTF-8') as file:
-        yaml.dump(data, file)
+    directory, basename = os.path.split(os.path.abspath(filename))
+    temp_name = os.path.join(directory, f'.{basename}.{secrets.token_hex(4)}.tmp')
+    try:
+        with open(temp_name, 'x', encoding='UTF-8') as file:
+            stream_yaml(data, file)
+    except BaseException:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        raise
+
+    if os.path.exists(filename) and filecmp.cmp(temp_name, filename, shallow=False):
+        os.remove(temp_name)
+        console.print(Text(f"{filename} unchanged", style="dim"))
+        return False
+
+    try:
+        with open(temp_name, 'rb') as source, open(filename, 'wb') as target:
+            shutil.copyfileobj(source, target)
+    finally:
+        os.remove(temp_name)
     console.print(Text(f"Data written to {filename}", style="green"))
+    return True
 
 
 def write_to_file(filename, data):
     """
-    Write plain text data to a file.
+    Write plain text data to a file, leaving it untouched if the content is identical.
+
+    Skipping identical writes keeps file mtimes stable, so watchers such as
+    Traefik's file provider do not reload needlessly.
 
     Parameters
     ----------
@@ -188,10 +837,45 @@ def write_to_file(filename, data):
         The path of the file to write to.
     data : str
         The text content to write.
+
+    Returns
+    -------
+    bool
+        True if the file was written, False if its content was already identical.
     """
+    try:
+        with open(filename, 'r', encoding='UTF-8', newline='') as file:
+            if file.read() == data:
+                console.print(Text(f"{filename} unchanged", style="dim"))
+                return False
+    except (FileNotFoundError, UnicodeDecodeError):
+        pass
+
     with open(filename, 'w', encoding='UTF-8') as file:
         file.write(data)
     console.print(Text(f"Data written to {filename}", style="green"))
+    return True
+
+
+def format_bytes(size):
+    """
+    Format a byte count with a binary unit.
+
+    Parameters
+    ----------
+    size : int or float
+        The number of bytes.
+
+    Returns
+    -------
+    str
+        The size, e.g. "512 B" or "1.5 GiB".
+    """
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
 
 
 def write_http_secret(output_dir="compose"):
@@ -10,44 +10,126 @@ Usage:
 
 import copy
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-import yaml
 from rich.text import Text
 
-from multi_registry_cache import functions
+from multi_registry_cache import (
+    entrypoints, functions, inventory, manifest, metrics, placement, protection, redis_topology, resources,
+    storage_tuning, tiers, upstreams
+)
 from multi_registry_cache.functions import console
 
+# Directory mode of the Traefik file provider
+TRAEFIK_DYNAMIC_DIR = 'traefik.d'
+TRAEFIK_DYNAMIC_MOUNT = '/etc/traefik/traefik.d'
+TRAEFIK_BASE_FILE = '_base.yaml'
+# Sections of the Traefik configuration read by the file provider; everything else is static
+TRAEFIK_DYNAMIC_KEYS = ('http', 'tcp', 'udp', 'tls')
 
-def generate(config_path="config.yaml", output_dir="compose"):
+
+def generate(config_path="config.yaml", output_dir="compose", force=False, jobs=1, check=False, state=None):
     """
     Generate all configuration files from a config.yaml.
 
     Reads the configuration, then for each registry creates:
     - An individual registry config YAML in the output directory
     - A Docker Compose service entry
-    - Traefik router and service entries
-    - A Redis configuration with the correct number of databases
+    - Traefik router and service entries, in traefik.yaml or, with
+      ``traefik.dynamicDirectory``, in one traefik.d/ file per registry
+    - A Redis configuration per shard with the correct number of databases
+    - With a ``metrics`` section, a Prometheus scrape config (prometheus.yaml)
     - An HTTP secret in the .env file
 
+    A manifest of input and output hashes is kept in the output directory, so
+    registries whose config entry and shared templates are unchanged are not
+    rendered again, and files whose content is unchanged are not rewritten.
+    Redis shard/database assignments are persisted there as well, so a
+    registry is never renumbered when others are inserted or removed.
+
     Parameters
     ----------
     config_path : str
         Path to the config.yaml file. Defaults to "config.yaml".
     output_dir : str
         Directory where generated files will be written. Defaults to "compose".
+    force : bool
+        Ignore the manifest and render every registry again. Defaults to False.
+    jobs : int
+        Number of worker threads rendering and writing per-registry configs.
+        Redis databases, merge order and the reported error do not depend on
+        it. Defaults to 1.
+    check : bool
+        Only verify that existing Redis shard/database assignments would be
+        kept, without writing anything. Defaults to False.
+    state : dict, optional
+        State kept in memory between runs by a long-running caller (see
+        `watch.watch`): the previous manifest, and with it the rendered
+        registry fragments, is read from it instead of the output directory,
+        and the new manifest is stored in it.
+
+    Returns
+    -------
+    list of str
+        The sorted names of the Compose services that must be recreated with
+        ``docker compose up -d`` for the new configuration to take effect
+        (always empty in check mode).
+
+    Raises
+    ------
+    redis_topology.AllocationChangedError
+        In check mode, if an existing Redis assignment would change.
     """
     # Load configuration from config.yaml file
     try:
         with open(config_path, 'r', encoding='UTF-8') as file:
-            base_config = yaml.safe_load(file)
+            base_config = functions.load_yaml(file)
             console.print(Text("Config loaded successfully", style="bold green"))
     except FileNotFoundError:
         console.print(Text(f"Error: {config_path} not found", style="bold red"))
         raise
 
+    # Inline registries, then the registry sources (registries.d/, JSONL, CSV)
+    try:
+        registries = inventory.load_registries(base_config, config_path)
+    except (ValueError, OSError) as e:
+        console.print(Text(f"Error: {e}", style="bold red"))
+        raise
+
+    if 'tiers' in base_config:
+        return _generate_tiers(base_config, registries, output_dir, force, jobs, check, state)
+    return _generate_bundle(base_config, registries, output_dir, force, jobs, check, state)
+
+
+def _generate_bundle(base_config, registries, output_dir, force=False, jobs=1, check=False, state=None):
+    """Generate the files of one site: one Docker host, or one bundle per node with a ``nodes`` section."""
+    if 'nodes' in base_config:
+        return _generate_nodes(base_config, registries, output_dir, force, jobs, check, state)
+    return _generate_stack(base_config, registries, output_dir, force, jobs, check, state)
+
+
+def _generate_stack(base_config, registries, output_dir, force=False, jobs=1, check=False, state=None):
+    """
+    Generate the files of one Docker host.
+
+    Parameters
+    ----------
+    base_config : dict
+        The loaded config.yaml. Its sections are modified.
+    registries : list of dict
+        The registries served by this host.
+    output_dir : str
+        Directory where generated files will be written.
+    force, jobs, check, state
+        See `generate`.
+
+    Returns
+    -------
+    list of str
+        The sorted names of the Compose services to recreate.
+    """
     # Extract configuration sections from the loaded config
     try:
-        registries = base_config['registries']
         docker_config = base_config['docker']['baseConfig']
         docker_perregistry = base_config['docker']['perRegistry']
         traefik_config = base_config['traefik']['baseConfig']
@@ -57,6 +139,138 @@ def generate(config_path="config.yaml", output_dir="compose"):
         console.print(Text(f"Error: Missing key in config file - {e}", style="bold red"))
         raise
 
+    # Redis topology: the single 'redis' service, or several shards
+    redis_settings = base_config.get('redis') or {}
+    shard_count = redis_settings.get('shards', 1)
+    if not isinstance(shard_count, int) or shard_count < 1:
+        console.print(Text(f"Error: redis.shards must be a positive integer, got {shard_count!r}", style="bold red"))
+        raise ValueError(f"Invalid redis.shards: {shard_count!r}")
+    shards = redis_topology.shard_names(shard_count)
+    sharded = shard_count > 1
+    redis_tuning = None
+    if redis_settings.get('tuning'):
+        try:
+            redis_tuning = redis_topology.validate_tuning(redis_settings['tuning'])
+        except ValueError as e:
+            console.print(Text(f"Error: {e}", style="bold red"))
+            raise
+    if sharded:
+        try:
+            base_redis_service = docker_config['services'].pop(redis_topology.DEFAULT_REDIS_SERVICE)
+        except KeyError:
+            console.print(Text("Error: redis.shards requires a 'redis' service in docker.baseConfig.services", style="bold red"))
+            raise
+        docker_config['services'].update(redis_topology.create_shard_services(base_redis_service, shards))
+
+    # Connection pool and timeouts of the registries' Redis client
+    if redis_settings.get('client'):
+        try:
+            registry_config = functions.deep_merge(registry_config, {
+                'redis': redis_topology.validate_client(redis_settings['client'])
+            })
+        except ValueError as e:
+            console.print(Text(f"Error: {e}", style="bold red"))
+            raise
+
+    registry_compose = docker_perregistry['compose']
+
+    # Optional metrics stack: registry debug listeners, Traefik metrics and redis_exporter
+    metrics_settings = None
+    if 'metrics' in base_config:
+        try:
+            metrics_settings = metrics.validate_metrics(base_config['metrics'])
+            registry_config = metrics.registry_debug_config(registry_config, metrics_settings)
+        except ValueError as e:
+            console.print(Text(f"Error: {e}", style="bold red"))
+            raise
+        metrics.add_traefik_metrics(traefik_config, metrics_settings)
+        docker_config['services'][metrics.REDIS_EXPORTER_SERVICE] = metrics.create_redis_exporter_service(
+            docker_config['services'].get(shards[0], {}), metrics_settings
+        )
+
+    # Keep every known registry on its previous Redis shard and database
+    previous_allocation = redis_topology.load_allocation(output_dir)
+    allocation, allocation_changes = redis_topology.allocate_databases(registries, shards, previous_allocation)
+    for name, (old_shard, old_db), (new_shard, new_db) in allocation_changes:
+        console.print(Text(
+            f"Redis assignment of {name} changes from {old_shard} db {old_db} to {new_shard} db {new_db}",
+            style="bold yellow"
+        ))
+    if check:
+        if allocation_changes:
+            console.print(Text("Error: regenerating would change existing Redis assignments", style="bold red"))
+            raise redis_topology.AllocationChangedError(
+                f"{len(allocation_changes)} existing Redis assignment(s) would change"
+            )
+        console.print(Text("Existing Redis assignments are unchanged", style="bold green"))
+        return []
+
+    # Optional routers dedicated to the manifest and blob endpoints
+    endpoint_routers = None
+    if base_config['traefik'].get('endpointRouters') is not None:
+        try:
+            endpoint_routers = functions.validate_endpoint_routers(base_config['traefik']['endpointRouters'])
+        except ValueError as e:
+            console.print(Text(f"Error: {e}", style="bold red"))
+            raise
+
+    # Optional in-flight, rate limit and retry middlewares in front of every registry
+    if base_config['traefik'].get('protection') is not None:
+        try:
+            default_protection = protection.resolve_protection(base_config['traefik']['protection'])
+        except ValueError as e:
+            console.print(Text(f"Error: {e}", style="bold red"))
+            raise
+        for endpoint in endpoint_routers or {}:
+            missing = [
+                kind for kind in protection.MIDDLEWARES
+                if kind in default_protection['registry'] and kind not in protection.SHARED_MIDDLEWARES
+                and kind not in default_protection.get(endpoint, {})
+            ]
+            if missing:
+                console.print(Text(
+                    f"The {endpoint} routers do not share the registry {' and '.join(missing)}: "
+                    f"set traefik.protection.{endpoint} to limit them",
+                    style="bold yellow"
+                ))
+
+    # Optional redirects of blob downloads to the object storage or a CDN
+    if base_config.get('storageRedirect') is not None:
+        try:
+            functions.resolve_storage_redirect(base_config['storageRedirect'])
+        except ValueError as e:
+            console.print(Text(f"Error: {e}", style="bold red"))
+            raise
+
+    # Optional HTTP/3 and TLS settings of the HTTPS entry point, kept consistent with the traefik ports
+    try:
+        http3_entry_point = entrypoints.validate_http3(base_config['traefik'].get('http3', False))
+        if http3_entry_point is not None:
+            entrypoints.enable_http3(
+                traefik_config, docker_config['services'].get(metrics.TRAEFIK_SERVICE), http3_entry_point
+            )
+        if base_config['traefik'].get('tls') is not None:
+            tls_settings = entrypoints.validate_tls(base_config['traefik']['tls'])
+            if entrypoints.apply_tls(traefik_config, tls_settings) == [] and 'keyType' in tls_settings:
+                console.print(Text(
+                    "traefik.tls.keyType is set but traefik.baseConfig has no ACME certificate resolver",
+                    style="bold yellow"
+                ))
+    except ValueError as e:
+        console.print(Text(f"Error: {e}", style="bold red"))
+        raise
+
+    # Optional directory mode: static traefik.yaml, and one dynamic file per registry in traefik.d/
+    dynamic_directory = base_config['traefik'].get('dynamicDirectory', False)
+    if not isinstance(dynamic_directory, bool):
+        console.print(Text(f"Error: traefik.dynamicDirectory must be true or false, got {dynamic_directory!r}", style="bold red"))
+        raise ValueError(f"Invalid traefik.dynamicDirectory: {dynamic_directory!r}")
+    if dynamic_directory and metrics.TRAEFIK_SERVICE in docker_config['services']:
+        traefik_service = docker_config['services'][metrics.TRAEFIK_SERVICE]
+        volume = f'./{TRAEFIK_DYNAMIC_DIR}:{TRAEFIK_DYNAMIC_MOUNT}:ro'
+        if volume not in (traefik_service.get('volumes') or []):
+            traefik_service['volumes'] = [*(traefik_service.get('volumes') or []), volume]
+
     # Create output directory to store the configuration files if it does not exist
     acme_dir = os.path.join(output_dir, 'acme')
     if not os.path.exists(output_dir):
@@ -66,55 +280,168 @@ def generate(config_path="config.yaml", output_dir="compose"):
         os.makedirs(acme_dir, exist_ok=True)
         console.print(Text("Output directory already exists", style="bold yellow"))
 
-    # Initialize Redis database count for registries
-    count_redis_db = 0
+    # Compile the per-registry templates once; each registry then only renders its placeholders
+    traefik_transport = base_config['traefik'].get('transport')
+    templates = {
+        'registry': functions.compile_template(registry_config),
+        'compose': functions.compile_template(registry_compose),
+        'router': functions.compile_template(traefik_perregistry['router']),
+        'service': functions.compile_template(traefik_perregistry['service']),
+        'transport': functions.compile_template(traefik_transport) if traefik_transport is not None else None,
+        'endpoints': endpoint_routers,
+        'middlewares': traefik_config['http'].get('middlewares') or {},
+        'storageTuning': base_config.get('storageTuning'),
+        'storageRedirect': base_config.get('storageRedirect'),
+        'protection': base_config['traefik'].get('protection'),
+    }
 
-    # Iterate over each registry to create configuration files
+    # Load the previous manifest; a change in any shared template invalidates every registry
+    if force:
+        previous_manifest = manifest.empty_manifest()
+    elif state is not None and 'manifest' in state:
+        previous_manifest = state['manifest']
+    else:
+        previous_manifest = manifest.load_manifest(output_dir)
+    new_manifest = manifest.empty_manifest()
+    new_manifest['templates'] = manifest.hash_data([
+        registry_config,
+        registry_compose,
+        traefik_perregistry['router'],
+        traefik_perregistry['service'],
+        traefik_transport,
+        endpoint_routers,
+        templates['middlewares'],
+        templates['storageTuning'],
+        templates['storageRedirect'],
+        templates['protection'],
+    ])
+    templates_changed = previous_manifest['templates'] != new_manifest['templates']
+    recreate = set()
+
+    # Base services (traefik, redis, ...) must be recreated when their own definition changes
+    new_manifest['baseServices'] = {
+        service_name: manifest.hash_data(service)
+        for service_name, service in docker_config['services'].items()
+    }
+    for service_name, service_hash in new_manifest['baseServices'].items():
+        if previous_manifest.get('baseServices', {}).get(service_name) != service_hash:
+            recreate.add(service_name)
+
+    # Resolve Redis addresses and registry defaults up front, so the outcome
+    # does not depend on the order in which workers complete
+    redis_addr = (registry_config.get('redis') or {}).get('addr')
+    redis_port = redis_topology.redis_port(redis_addr)
+    pending = []
     for registry in registries:
         name = registry['name']
 
-        # Create registry configuration file
-        try:
-            # Backward compatibility with old config files without 'type' field
-            if 'type' not in registry:
-                registry['type'] = 'cache'
-                console.print(Text(f"No type specified for registry {name}, defaulting to cache", style="bold yellow"))
-
-            # Deep copy base registry config and create specific config for this registry
-            registry_config_copy = copy.deepcopy(registry_config)
-            registry_config_file = functions.create_registry_config(registry_config_copy, registry, count_redis_db)
-            functions.write_yaml_file(os.path.join(output_dir, f'{name}.yaml'), registry_config_file)
-            console.print(Text(f"Registry configuration file created for {name}", style="bold green"))
-        except Exception as e:
-            console.print(Text(f"Error creating registry configuration file for {name}: {e}", style="bold red"))
-            raise
+        # Backward compatibility with old config files without 'type' field
+        if 'type' not in registry:
+            registry['type'] = 'cache'
+            console.print(Text(f"No type specified for registry {name}, defaulting to cache", style="bold yellow"))
+
+        replicas = registry.get('replicas', 1)
+        if isinstance(replicas, bool) or not isinstance(replicas, int) or replicas < 1:
+            console.print(Text(f"Error: replicas of registry {name} must be a positive integer, got {replicas!r}", style="bold red"))
+            raise ValueError(f"Invalid replicas for registry {name}: {replicas!r}")
 
-        # Remove password before interpolating variables to avoid leaking sensitive data
         try:
-            if 'password' in registry:
-                registry.pop('password')
-        except KeyError:
-            console.print(Text(f"Error: Missing 'password' key in registry configuration for {name}", style="bold red"))
+            upstreams.resolve_upstreams(registry)
+        except ValueError as e:
+            console.print(Text(f"Error: {e}", style="bold red"))
             raise
 
-        # Create docker-compose and traefik configuration entries for this registry
+        if 'resources' not in base_config and ('profile' in registry or 'weight' in registry):
+            console.print(Text(f"Error: registry {name} has a profile or weight but there is no resources section", style="bold red"))
+            raise ValueError(f"Registry {name} has a profile or weight but there is no resources section")
+
+        shard, db = allocation[name]
+        addr = f'{shard}:{redis_port}' if sharded else None
+        pending.append((registry, db, addr, previous_manifest['registries'].get(name)))
+
+    # Upstream backends and replicas are named after their registry, endpoint routers too
+    try:
+        upstreams.validate_names(registries)
+    except ValueError as e:
+        console.print(Text(f"Error: {e}", style="bold red"))
+        raise
+
+    # Size the registry containers against the host budget, once their replicas are known
+    registry_limits = {}
+    if 'resources' in base_config:
         try:
-            docker_config['services'][name] = functions.create_docker_service(registry, docker_perregistry['compose'])
-            traefik_config['http']['routers'][name] = functions.create_traefik_router(registry, traefik_perregistry['router'])
-            traefik_config['http']['services'][name] = functions.create_traefik_service(registry, traefik_perregistry['service'])
-            console.print(Text(f"Docker-compose and traefik configuration created for {name}", style="bold green"))
-        except Exception as e:
-            console.print(Text(f"Error creating docker-compose and traefik configuration for {name}: {e}", style="bold red"))
+            registry_limits = resources.allocate_resources(
+                registries, resources.validate_resources(base_config['resources'])
+            )
+        except ValueError as e:
+            console.print(Text(f"Error: {e}", style="bold red"))
             raise
 
-        # Increment Redis database count for next registry
-        count_redis_db += 1
+    def run(registry, db, addr, previous_entry):
+        return _generate_registry(
+            registry, db, addr, output_dir, templates, previous_entry, not templates_changed,
+            registry_limits.get(registry['name'])
+        )
+
+    if jobs > 1:
+        executor = ThreadPoolExecutor(max_workers=jobs)
+        results = [executor.submit(run, *args) for args in pending]
+    else:
+        executor = None
+        results = (run(*args) for args in pending)
+
+    # Merge results in config order; the first failing registry in that order is reported
+    registry_http = {}
+    try:
+        for (registry, *_), result in zip(pending, results):
+            if executor is not None:
+                result = result.result()
+            name = registry['name']
+            if isinstance(result, _RegistryFailure):
+                console.print(Text(result.message, style="bold red"))
+                raise result.error
+
+            entry, changed = result
+            if changed:
+                recreate.update(entry['services'])
+            new_manifest['registries'][name] = entry
+            docker_config['services'].update(entry['services'])
+            registry_http[name] = _registry_http(name, entry)
+            if not dynamic_directory:
+                for kind, objects in registry_http[name].items():
+                    traefik_config['http'].setdefault(kind, {}).update(objects)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
 
     # Write final configuration files
     try:
         functions.write_yaml_file(os.path.join(output_dir, 'compose.yaml'), docker_config)
-        functions.write_yaml_file(os.path.join(output_dir, 'traefik.yaml'), traefik_config)
-        functions.write_to_file(os.path.join(output_dir, 'redis.conf'), f'databases {count_redis_db}')
+        if dynamic_directory:
+            traefik_static = _write_traefik_directory(output_dir, traefik_config, registry_http)
+        else:
+            functions.write_yaml_file(os.path.join(output_dir, 'traefik.yaml'), traefik_config)
+            traefik_static = {key: value for key, value in traefik_config.items() if key != 'http'}
+        if metrics_settings is not None:
+            redis_targets = [f'{shard}:{redis_port}' for shard in shards] if sharded or not redis_addr else [redis_addr]
+            functions.write_yaml_file(os.path.join(output_dir, metrics.PROMETHEUS_FILENAME), metrics.prometheus_config(
+                metrics_settings,
+                {registry['name']: upstreams.backend_names(registry) for registry in registries},
+                redis_targets,
+            ))
+        for shard, count in redis_topology.databases_per_shard(allocation, shards).items():
+            # An empty shard still needs a valid configuration
+            shard_registries = sum(1 for owner, _ in allocation.values() if owner == shard)
+            shard_conf = redis_topology.redis_conf(max(count, 1) if sharded else count, redis_tuning, shard_registries)
+            if functions.write_to_file(os.path.join(output_dir, f'{shard}.conf'), shard_conf):
+                recreate.add(shard)
+
+        # Routers and services are reloaded by Traefik's file provider, but its static
+        # configuration (entryPoints, providers, ...) is only read at startup
+        static_hash = manifest.hash_data(traefik_static)
+        new_manifest['traefikStatic'] = static_hash
+        if previous_manifest.get('traefikStatic') != static_hash:
+            recreate.add('traefik')
 
         # If docker-compose.yml exists, ask for confirmation before removing it
         docker_compose_path = os.path.join(output_dir, 'docker-compose.yml')
@@ -134,7 +461,432 @@ def generate(config_path="config.yaml", output_dir="compose"):
         # Write HTTP secret file
         functions.write_http_secret(output_dir)
 
+        redis_topology.save_allocation(output_dir, allocation)
+        manifest.save_manifest(output_dir, new_manifest)
+        if state is not None:
+            state['manifest'] = new_manifest
         console.print(Text("Configuration files written successfully", style="bold green"))
     except Exception as e:
         console.print(Text(f"Error writing configuration files: {e}", style="bold red"))
         raise
+
+    # Only report services that still exist in the generated compose.yaml
+    recreate = sorted(recreate & set(docker_config['services']))
+    removed = sorted(
+        {service for entry in previous_manifest['registries'].values() for service in entry['services']}
+        - {service for entry in new_manifest['registries'].values() for service in entry['services']}
+    )
+    if recreate:
+        console.print(Text(f"Services to recreate: docker compose up -d {' '.join(recreate)}", style="bold blue"))
+    else:
+        console.print(Text("No service needs to be recreated", style="bold blue"))
+    if removed:
+        console.print(Text(
+            f"Services removed from compose.yaml: {', '.join(removed)} (use docker compose up -d --remove-orphans)",
+            style="bold yellow"
+        ))
+    return recreate
+
+
+def _generate_tiers(base_config, registries, output_dir, force=False, jobs=1, check=False, state=None):
+    """
+    Generate one bundle per tier, edge tiers caching their upstream tier.
+
+    Parameters
+    ----------
+    base_config : dict
+        The loaded config.yaml, with its ``tiers`` section.
+    registries : list of dict
+        Every registry.
+    output_dir : str
+        Directory holding ``tiers/<tier>/``.
+    force, jobs, check, state
+        See `generate`.
+
+    Returns
+    -------
+    list of str
+        The services to recreate, prefixed with ``<tier>/``.
+    """
+    try:
+        tier_settings = tiers.validate_tiers(base_config['tiers'], [registry['name'] for registry in registries])
+        router_template = functions.compile_template(base_config['traefik']['perRegistry']['router'])
+        tier_registries = {
+            name: tiers.tier_registries(name, tier_settings, registries, router_template) for name in tier_settings
+        }
+    except (KeyError, ValueError) as e:
+        console.print(Text(f"Error: {e}", style="bold red"))
+        raise
+
+    recreate = []
+    for name, settings in tier_settings.items():
+        upstream = settings.get('upstream')
+        console.print(Text(
+            f"Tier {name}: {len(tier_registries[name])} registry(ies), caching "
+            f"{'tier ' + upstream if upstream else 'the upstream registries'}",
+            style="bold blue"
+        ))
+        tier_state = None if state is None else state.setdefault('tiers', {}).setdefault(name, {})
+        tier_recreate = _generate_bundle(
+            copy.deepcopy(base_config), tier_registries[name], os.path.join(output_dir, tiers.TIERS_DIR, name),
+            force, jobs, check, tier_state
+        )
+        recreate.extend(f'{name}/{service}' for service in tier_recreate)
+    return sorted(recreate)
+
+
+def _generate_nodes(base_config, registries, output_dir, force=False, jobs=1, check=False, state=None):
+    """
+    Place the registries on the nodes, then generate each node's bundle and the front Traefik.
+
+    Parameters
+    ----------
+    base_config : dict
+        The loaded config.yaml, with its ``nodes`` section.
+    registries : list of dict
+        Every registry.
+    output_dir : str
+        Directory holding the placement file, ``nodes/<node>/`` and ``front/``.
+    force, jobs, check, state
+        See `generate`.
+
+    Returns
+    -------
+    list of str
+        The services to recreate, as ``<node>/<service>`` and ``front/traefik``.
+
+    Raises
+    ------
+    redis_topology.AllocationChangedError
+        In check mode, if a registry would move to another node or Redis database.
+    """
+    try:
+        nodes = placement.validate_nodes(base_config['nodes'])
+        node_placement, moves = placement.plan_placement(registries, nodes, placement.load_placement(output_dir))
+        router_template = functions.compile_template(base_config['traefik']['perRegistry']['router'])
+        hosts = {
+            registry['name']: (
+                placement.registry_host(functions.render_template(router_template, registry)),
+                node_placement[registry['name']],
+            )
+            for registry in registries
+        }
+        traefik_config = base_config['traefik']['baseConfig']
+        entry_points = traefik_config.get('entryPoints') or {}
+        ports = [
+            entrypoints.address_port(entry_points[name].get('address', '')) if name in entry_points else None
+            for name in ('web', 'websecure')
+        ]
+        if ports == [None, None]:
+            raise ValueError("nodes require a web or websecure entry point in traefik.baseConfig.entryPoints")
+    except (KeyError, ValueError) as e:
+        console.print(Text(f"Error: {e}", style="bold red"))
+        raise
+    for name, old_node, new_node in moves:
+        console.print(Text(
+            f"Registry {name} moves from node {old_node} to {new_node}: its cache starts cold", style="bold yellow"
+        ))
+    if check and moves:
+        console.print(Text("Error: regenerating would move registries to other nodes", style="bold red"))
+        raise redis_topology.AllocationChangedError(f"{len(moves)} registry placement(s) would change")
+
+    recreate = []
+    for node in nodes:
+        node_registries = [registry for registry in registries if node_placement[registry['name']] == node]
+        console.print(Text(f"Node {node}: {len(node_registries)} registry(ies)", style="bold blue"))
+        # Each bundle modifies its own copy of the sections
+        node_state = None if state is None else state.setdefault('nodes', {}).setdefault(node, {})
+        node_recreate = _generate_stack(
+            copy.deepcopy(base_config), copy.deepcopy(node_registries),
+            os.path.join(output_dir, placement.NODES_DIR, node), force, jobs, check, node_state
+        )
+        recreate.extend(f'{node}/{service}' for service in node_recreate)
+    if check:
+        return []
+
+    try:
+        front_dir = os.path.join(output_dir, placement.FRONT_DIR)
+        os.makedirs(front_dir, exist_ok=True)
+        front_path = os.path.join(front_dir, 'traefik.yaml')
+        previous_front = {}
+        if os.path.exists(front_path):
+            with open(front_path, 'r', encoding='UTF-8') as file:
+                previous_front = functions.load_yaml(file) or {}
+        front = placement.front_traefik_config(traefik_config, hosts, nodes, *ports)
+        functions.write_yaml_file(front_path, front)
+        compose_changed = functions.write_yaml_file(
+            os.path.join(front_dir, 'compose.yaml'),
+            placement.front_compose_config(base_config['docker']['baseConfig']['services'][metrics.TRAEFIK_SERVICE])
+        )
+        # Routes are reloaded by the file provider, entry points only at startup
+        static_changed = any(
+            previous_front.get(key) != front.get(key) for key in set(previous_front) | set(front)
+            if key not in TRAEFIK_DYNAMIC_KEYS
+        )
+        if compose_changed or static_changed or not previous_front:
+            recreate.append(f'{placement.FRONT_DIR}/{metrics.TRAEFIK_SERVICE}')
+        placement.save_placement(output_dir, node_placement)
+    except Exception as e:
+        console.print(Text(f"Error writing the front configuration: {e}", style="bold red"))
+        raise
+
+    nodes_dir = os.path.join(output_dir, placement.NODES_DIR)
+    stale = sorted(set(os.listdir(nodes_dir)) - set(nodes))
+    if stale:
+        console.print(Text(f"Bundles of removed nodes left in {nodes_dir}: {', '.join(stale)}", style="bold yellow"))
+    return sorted(recreate)
+
+
+def _registry_http(name, entry):
+    """
+    Return the Traefik ``http`` objects of a registry.
+
+    Parameters
+    ----------
+    name : str
+        The registry name.
+    entry : dict
+        The registry's manifest entry.
+
+    Returns
+    -------
+    dict
+        Mapping of kind ('routers', 'services', ...) to the registry's objects of that kind.
+    """
+    http = {'routers': {name: entry['router']}, 'services': {name: entry['traefikService']}}
+    if entry.get('serversTransport') is not None:
+        http['serversTransports'] = {name: entry['serversTransport']}
+    http['services'].update(entry.get('upstreamServices') or {})
+    for kind, objects in entry.get('endpoints', {}).items():
+        http.setdefault(kind, {}).update(objects)
+    if entry.get('middlewares'):
+        http.setdefault('middlewares', {}).update(entry['middlewares'])
+    return http
+
+
+def _write_traefik_directory(output_dir, traefik_config, registry_http):
+    """
+    Write the Traefik configuration in directory mode.
+
+    ``traefik.yaml`` only keeps the static configuration, with a file
+    provider watching ``traefik.d/``. The dynamic sections of the base config
+    go to ``traefik.d/_base.yaml`` and each registry gets its own
+    ``traefik.d/{name}.yaml``, so changing a registry only rewrites its file.
+    Other YAML files in ``traefik.d/`` are removed: they belong to registries
+    that are no longer configured.
+
+    Parameters
+    ----------
+    output_dir : str
+        The output directory.
+    traefik_config : dict
+        The Traefik base config, without the registries.
+    registry_http : dict
+        Registry name to its ``http`` objects, see `_registry_http`.
+
+    Returns
+    -------
+    dict
+        The static configuration written to ``traefik.yaml``.
+    """
+    static = {key: value for key, value in traefik_config.items() if key not in TRAEFIK_DYNAMIC_KEYS}
+    providers = dict(static.get('providers') or {})
+    file_provider = {
+        key: value for key, value in (providers.get('file') or {}).items() if key not in ('filename', 'directory')
+    }
+    providers['file'] = {**file_provider, 'directory': TRAEFIK_DYNAMIC_MOUNT, 'watch': True}
+    static['providers'] = providers
+    functions.write_yaml_file(os.path.join(output_dir, 'traefik.yaml'), static)
+
+    dynamic_dir = os.path.join(output_dir, TRAEFIK_DYNAMIC_DIR)
+    os.makedirs(dynamic_dir, exist_ok=True)
+    # Compose service names cannot start with an underscore, so this never clashes with a registry
+    files = {TRAEFIK_BASE_FILE: {key: traefik_config[key] for key in TRAEFIK_DYNAMIC_KEYS if key in traefik_config}}
+    files.update({f'{name}.yaml': {'http': http} for name, http in registry_http.items()})
+    for filename, data in files.items():
+        functions.write_yaml_file(os.path.join(dynamic_dir, filename), data)
+
+    for filename in sorted(os.listdir(dynamic_dir)):
+        if filename.endswith(('.yaml', '.yml')) and filename not in files:
+            os.remove(os.path.join(dynamic_dir, filename))
+            console.print(Text(f"Removed {TRAEFIK_DYNAMIC_DIR}/{filename}", style="bold yellow"))
+    return static
+
+
+class _RegistryFailure:
+    """The error raised while generating one registry, with its user-facing message."""
+
+    __slots__ = ('message', 'error')
+
+    def __init__(self, message, error):
+        self.message = message
+        self.error = error
+
+
+def _generate_registry(registry, db, addr, output_dir, templates, previous_entry, reuse, limits=None):
+    """
+    Render and write the configuration of a single registry.
+
+    Safe to run concurrently for different registries. Errors are returned
+    rather than raised, so the caller can report them in config order.
+
+    Parameters
+    ----------
+    registry : dict
+        The registry entry. Its password is removed once the registry config is written.
+    db : int
+        The Redis database number assigned to this registry.
+    addr : str or None
+        The Redis shard address assigned to this registry, or None to keep the base config's.
+    output_dir : str
+        Directory where the registry config file is written.
+    templates : dict
+        The compiled 'registry', 'compose', 'router' and 'service' templates, the
+        'transport' template or None when no serversTransport is generated, the
+        validated 'endpoints' routers settings or None, the base Traefik
+        'middlewares', and the 'storageTuning', 'storageRedirect' and
+        'protection' settings or None.
+    previous_entry : dict or None
+        The registry entry from the previous manifest.
+    reuse : bool
+        Whether the previous entry may be reused when the registry is unchanged.
+    limits : dict, optional
+        The resource limits of each replica, from `resources.allocate_resources`.
+
+    Returns
+    -------
+    tuple of (dict, bool) or _RegistryFailure
+        The new manifest entry and whether the registry services (one per
+        replica) must be recreated, or the failure that occurred.
+    """
+    name = registry['name']
+    registry_upstreams = upstreams.resolve_upstreams(registry)
+    backends = upstreams.backend_names(registry)
+    if registry_upstreams is None:
+        config_paths = {name: os.path.join(output_dir, f'{name}.yaml')}
+    else:
+        # One config file per upstream, the rest of the config is shared
+        config_paths = {
+            upstream['backend']: os.path.join(output_dir, f"{upstream['backend']}.yaml") for upstream in registry_upstreams
+        }
+    inputs = {'registry': registry, 'db': db, 'addr': addr}
+    if limits is not None:
+        # A registry's share of the budget also depends on the other registries
+        inputs['limits'] = limits
+    input_hash = manifest.hash_data(inputs)
+
+    if reuse and manifest.is_registry_current(previous_entry, input_hash, list(config_paths.values())):
+        # Nothing changed for this registry: reuse the fragments recorded in the manifest
+        console.print(Text(f"Registry {name} unchanged, reusing previous output", style="dim"))
+        return previous_entry, False
+
+    # Create registry configuration file
+    try:
+        # Render the compiled base registry config for this registry
+        storage_redirect = functions.resolve_storage_redirect(
+            templates['storageRedirect'], registry.get('storageRedirect')
+        )
+        config_texts = []
+        config_changed = False
+        for upstream in registry_upstreams or [None]:
+            registry_config_file = functions.create_registry_config(
+                templates['registry'], registry if upstream is None else upstream['registry'], db, addr,
+                storage_redirect
+            )
+            registry_config_file = storage_tuning.tune_storage(
+                registry_config_file, templates['storageTuning'], registry.get('storageTuning')
+            )
+            if upstream is not None:
+                registry_config_file = upstreams.add_health_check(registry_config_file, upstream['health'])
+            config_texts.append(functions.dump_yaml(registry_config_file))
+            config_path = config_paths[name if upstream is None else upstream['backend']]
+            config_changed = functions.write_to_file(config_path, config_texts[-1]) or config_changed
+        console.print(Text(f"Registry configuration file created for {name}", style="bold green"))
+        if len(backends) > 1 and 'inmemory' in (registry_config_file.get('storage') or {}):
+            console.print(Text(
+                f"Registry {name} has {len(backends)} replicas with inmemory storage: replicas will not share their cache",
+                style="bold yellow"
+            ))
+        if storage_redirect is not None and storage_redirect['enabled']:
+            for driver in functions.NON_REDIRECTING_DRIVERS:
+                if driver in (registry_config_file.get('storage') or {}):
+                    console.print(Text(
+                        f"Registry {name} enables storageRedirect with {driver} storage: "
+                        "blobs cannot be redirected and keep streaming through the registry",
+                        style="bold yellow"
+                    ))
+    except Exception as e:
+        return _RegistryFailure(f"Error creating registry configuration file for {name}: {e}", e)
+
+    # Remove passwords before interpolating variables to avoid leaking sensitive data
+    registry.pop('password', None)
+    if registry_upstreams is not None:
+        registry['upstreams'] = [
+            {key: value for key, value in upstream.items() if key != 'password'} if isinstance(upstream, dict) else upstream
+            for upstream in registry['upstreams']
+        ]
+
+    # Create docker-compose and traefik configuration entries for this registry
+    try:
+        # Each registry gets its own serversTransport, named after its Traefik service
+        servers_transport = None
+        if templates['transport'] is not None or registry.get('transport'):
+            servers_transport = functions.create_traefik_servers_transport(
+                registry, templates['transport'], registry.get('transport')
+            )
+        docker_service = functions.create_docker_service(registry, templates['compose'])
+        if limits is not None:
+            docker_service = resources.apply_limits(docker_service, limits)
+        entry = {
+            'input': input_hash,
+            'output': manifest.hash_texts(config_texts),
+            # Replicas share the registry config file, hence its storage and Redis database
+            'services': dict.fromkeys(backends, docker_service),
+            'router': functions.create_traefik_router(registry, templates['router']),
+            'serversTransport': servers_transport,
+        }
+        if registry_upstreams is None:
+            entry['traefikService'] = functions.create_traefik_service(
+                registry, templates['service'], backends if len(backends) > 1 else None,
+                name if servers_transport is not None else None
+            )
+        else:
+            # Upstream backends only differ by their config file: same storage, same Redis database
+            entry['services'] = {}
+            for upstream in registry_upstreams:
+                backend_service = upstreams.create_backend_service(docker_service, name, upstream['backend'])
+                for backend in functions.replica_names({**registry, 'name': upstream['backend']}):
+                    entry['services'][backend] = backend_service
+            entry['traefikService'], entry['upstreamServices'] = upstreams.create_upstream_services(
+                registry, registry_upstreams, registry.get('upstreamMode', upstreams.DEFAULT_MODE),
+                templates['service'], name if servers_transport is not None else None
+            )
+        # Protection middlewares go on the registry router, endpoint routers inherit them
+        registry_protection = protection.resolve_protection(templates['protection'], registry.get('protection'))
+        protection_middlewares, chains = protection.create_protection(name, registry_protection)
+        if protection_middlewares:
+            entry['middlewares'] = protection_middlewares
+            entry['router'] = protection.attach_middlewares(entry['router'], chains['registry'])
+        endpoints = dict(templates['endpoints'] or {})
+        for endpoint in functions.ENDPOINT_RULES:
+            if endpoint in registry_protection:
+                # Separate limits need a router of their own
+                endpoints.setdefault(endpoint, {})
+        if endpoints:
+            entry['endpoints'] = functions.create_endpoint_routers(
+                name, entry['router'], entry['traefikService'], endpoints,
+                servers_transport, templates['middlewares']
+            )
+            # Endpoint routers get their own budgets instead of the registry's
+            for endpoint in endpoints:
+                router_name = f'{name}-{endpoint}'
+                entry['endpoints']['routers'][router_name] = protection.attach_middlewares(
+                    entry['endpoints']['routers'][router_name], chains[endpoint], chains['registry']
+                )
+        console.print(Text(f"Docker-compose and traefik configuration created for {name}", style="bold green"))
+    except Exception as e:
+        return _RegistryFailure(f"Error creating docker-compose and traefik configuration for {name}: {e}", e)
+
+    # The registry only reads its config file at startup
+    changed = config_changed or previous_entry is None or previous_entry.get('services') != entry['services']
+    return entry, changed
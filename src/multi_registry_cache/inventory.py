@@ -0,0 +1,237 @@
+"""
+Registry inventory split across files.
+
+Besides the inline ``registries`` list, config.yaml can list
+``registriesFrom`` sources: ``registries.d/``-style directories, JSON Lines
+files (one registry object per line) and CSV files (one registry per row, the
+header naming the fields). Machine-generated inventories of thousands of
+registries can then live outside config.yaml.
+
+Sources are read one record at a time, and their parsed registries are cached
+in ``.registries-cache.json`` next to config.yaml, keyed by path, mtime and
+size, so unchanged files are not parsed again on the next run.
+"""
+
+import csv
+import json
+import os
+
+from rich.text import Text
+
+from multi_registry_cache import functions
+from multi_registry_cache.functions import console
+
+CACHE_FILENAME = '.registries-cache.json'
+CACHE_VERSION = 1
+YAML_EXTENSIONS = ('.yaml', '.yml')
+SOURCE_EXTENSIONS = YAML_EXTENSIONS + ('.jsonl', '.csv')
+# CSV cells are strings: these fields are converted, the others are kept as-is
+CSV_TYPES = {'replicas': int, 'weight': float}
+
+
+def _read_yaml(path):
+    """Read a YAML fragment: a list of registries or a single registry."""
+    with open(path, 'r', encoding='UTF-8') as file:
+        data = functions.load_yaml(file)
+    if data is None:
+        return []
+    if isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list) or not all(isinstance(registry, dict) for registry in data):
+        raise ValueError(f"{path} must contain a registry mapping or a list of them")
+    return data
+
+
+def _read_jsonl(path):
+    """Read a JSON Lines file, one registry object per line."""
+    registries = []
+    with open(path, 'r', encoding='UTF-8') as file:
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                registry = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{number}: invalid JSON: {e.msg}") from e
+            if not isinstance(registry, dict):
+                raise ValueError(f"{path}:{number}: expected a JSON object, got {type(registry).__name__}")
+            registries.append(registry)
+    return registries
+
+
+def _read_csv(path):
+    """Read a CSV file with a header row; empty cells are left out."""
+    registries = []
+    with open(path, 'r', encoding='UTF-8', newline='') as file:
+        for number, row in enumerate(csv.DictReader(file), start=2):
+            if None in row:
+                raise ValueError(f"{path}:{number}: more cells than header fields")
+            registry = {}
+            for key, value in row.items():
+                if value is None or value == '':
+                    continue
+                try:
+                    registry[key] = CSV_TYPES[key](value) if key in CSV_TYPES else value
+                except ValueError as e:
+                    raise ValueError(f"{path}:{number}: invalid {key} {value!r}") from e
+            if registry:
+                registries.append(registry)
+    return registries
+
+
+def read_source_file(path):
+    """
+    Parse one inventory file.
+
+    Parameters
+    ----------
+    path : str
+        A ``.yaml``/``.yml``, ``.jsonl`` or ``.csv`` file.
+
+    Returns
+    -------
+    list of dict
+        The registries of the file, in file order.
+
+    Raises
+    ------
+    ValueError
+        If the extension is not supported or a record is invalid.
+    """
+    if path.endswith(YAML_EXTENSIONS):
+        return _read_yaml(path)
+    if path.endswith('.jsonl'):
+        return _read_jsonl(path)
+    if path.endswith('.csv'):
+        return _read_csv(path)
+    raise ValueError(f"Unsupported registry source {path}, expected one of {', '.join(SOURCE_EXTENSIONS)}")
+
+
+def source_files(path):
+    """
+    List the inventory files of a source.
+
+    Parameters
+    ----------
+    path : str
+        A file, or a directory whose inventory files are read in name order.
+
+    Returns
+    -------
+    list of str
+        The files to read.
+    """
+    if not os.path.isdir(path):
+        return [path]
+    return [
+        os.path.join(path, name) for name in sorted(os.listdir(path))
+        if name.endswith(SOURCE_EXTENSIONS) and not name.startswith('.')
+    ]
+
+
+def load_cache(cache_path):
+    """Load the parse cache, or an empty one if it is missing, unreadable or from another version."""
+    try:
+        with open(cache_path, 'r', encoding='UTF-8') as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get('version') != CACHE_VERSION:
+        return {}
+    return cache.get('files') or {}
+
+
+def source_paths(base_config, config_path="config.yaml"):
+    """
+    Return the paths of the ``registriesFrom`` sources.
+
+    Parameters
+    ----------
+    base_config : dict
+        The loaded config.yaml.
+    config_path : str
+        Path of config.yaml, against whose directory relative sources are
+        resolved.
+
+    Returns
+    -------
+    list of str
+        The source files and directories, in config order.
+
+    Raises
+    ------
+    ValueError
+        If ``registriesFrom`` is neither a path nor a list of paths.
+    """
+    sources = base_config.get('registriesFrom') or []
+    if isinstance(sources, str):
+        sources = [sources]
+    if not isinstance(sources, list):
+        raise ValueError(f"registriesFrom must be a path or a list of paths, got {sources!r}")
+    base_dir = os.path.dirname(os.path.abspath(config_path))
+    return [os.path.join(base_dir, str(source)) for source in sources]
+
+
+def load_registries(base_config, config_path="config.yaml", use_cache=True):
+    """
+    Return every registry: the inline ``registries``, then the ``registriesFrom`` sources.
+
+    Parameters
+    ----------
+    base_config : dict
+        The loaded config.yaml.
+    config_path : str
+        Path of config.yaml. Relative sources are resolved against its
+        directory, which also holds the parse cache.
+    use_cache : bool
+        Read and update the parse cache. Defaults to True.
+
+    Returns
+    -------
+    list of dict
+        The registries, in config order.
+
+    Raises
+    ------
+    ValueError
+        If a source is missing or invalid, or two registries share a name.
+    """
+    registries = list(base_config.get('registries') or [])
+    sources = source_paths(base_config, config_path)
+
+    if sources:
+        base_dir = os.path.dirname(os.path.abspath(config_path))
+        cache_path = os.path.join(base_dir, CACHE_FILENAME)
+        cache = load_cache(cache_path) if use_cache else {}
+        files = {}
+        parsed = 0
+        for path in sources:
+            if not os.path.exists(path):
+                raise ValueError(f"Registry source {path} not found")
+            for filename in source_files(path):
+                stat = os.stat(filename)
+                key = os.path.abspath(filename)
+                entry = cache.get(key)
+                if not entry or entry.get('mtime') != stat.st_mtime_ns or entry.get('size') != stat.st_size:
+                    entry = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'registries': read_source_file(filename)}
+                    parsed += 1
+                files[key] = entry
+                registries.extend(entry['registries'])
+        console.print(Text(
+            f"{len(files)} registry source file(s) loaded, {parsed} parsed, {len(files) - parsed} from cache",
+            style="green"
+        ))
+        if use_cache and files != cache:
+            # Only the files of the current sources are kept, so removed files leave the cache
+            functions.write_to_file(
+                cache_path, json.dumps({'version': CACHE_VERSION, 'files': files}, separators=(',', ':'))
+            )
+
+    names = set()
+    for registry in registries:
+        if not isinstance(registry, dict) or not registry.get('name'):
+            raise ValueError(f"Every registry needs a name, got {registry!r}")
+        if registry['name'] in names:
+            raise ValueError(f"Duplicate registry name {registry['name']!r}")
+        names.add(registry['name'])
+    return registries
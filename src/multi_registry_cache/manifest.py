@@ -0,0 +1,186 @@
+"""
+Content-hash manifest used to make generate incremental.
+
+The manifest is stored as ``.manifest.json`` in the output directory. It records
+a hash of the shared per-registry templates, and for every registry a hash of its
+inputs (config entry and Redis DB), a hash of its rendered ``<name>.yaml`` and the
+rendered Compose/Traefik fragments, so unchanged registries can be reused without
+being rendered again.
+"""
+
+import hashlib
+import json
+import os
+
+from rich.text import Text
+
+from multi_registry_cache.functions import console, write_to_file
+
+MANIFEST_FILENAME = '.manifest.json'
+MANIFEST_VERSION = 2
+
+
+def empty_manifest():
+    """
+    Return a new, empty manifest.
+
+    Returns
+    -------
+    dict
+        A manifest with no template hash or registries recorded.
+    """
+    return {'version': MANIFEST_VERSION, 'templates': None, 'registries': {}}
+
+
+def hash_data(obj):
+    """
+    Hash a JSON-serializable object independently of dict ordering.
+
+    Parameters
+    ----------
+    obj : object
+        The object to hash.
+
+    Returns
+    -------
+    str
+        The hex SHA-256 digest of the canonical JSON representation.
+    """
+    payload = json.dumps(obj, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('UTF-8')).hexdigest()
+
+
+def hash_text(text):
+    """
+    Hash a text content as it would be written to disk.
+
+    Parameters
+    ----------
+    text : str
+        The text to hash.
+
+    Returns
+    -------
+    str
+        The hex SHA-256 digest of the UTF-8 encoded text.
+    """
+    return hashlib.sha256(text.encode('UTF-8')).hexdigest()
+
+
+def hash_texts(texts):
+    """
+    Hash the contents of the config files of a registry.
+
+    Parameters
+    ----------
+    texts : list of str
+        The contents, in file order.
+
+    Returns
+    -------
+    str
+        `hash_text` of a single content, otherwise the hash of the list of
+        their hashes.
+    """
+    if len(texts) == 1:
+        return hash_text(texts[0])
+    return hash_data([hash_text(text) for text in texts])
+
+
+def hash_file(filename):
+    """
+    Hash the content of a file.
+
+    Parameters
+    ----------
+    filename : str
+        The path of the file to hash.
+
+    Returns
+    -------
+    str or None
+        The hex SHA-256 digest of the file bytes, or None if the file does not exist.
+    """
+    try:
+        with open(filename, 'rb') as file:
+            return hashlib.sha256(file.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def load_manifest(output_dir):
+    """
+    Load the manifest from the output directory.
+
+    A missing, unreadable, or outdated manifest is treated as empty, which
+    makes generate render everything again.
+
+    Parameters
+    ----------
+    output_dir : str
+        The directory containing the manifest.
+
+    Returns
+    -------
+    dict
+        The loaded manifest.
+    """
+    path = os.path.join(output_dir, MANIFEST_FILENAME)
+    try:
+        with open(path, 'r', encoding='UTF-8') as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        return empty_manifest()
+    except (OSError, ValueError) as e:
+        console.print(Text(f"Ignoring unreadable manifest {path}: {e}", style="bold yellow"))
+        return empty_manifest()
+
+    if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+        console.print(Text(f"Ignoring manifest {path} from another version", style="bold yellow"))
+        return empty_manifest()
+    return manifest
+
+
+def save_manifest(output_dir, manifest):
+    """
+    Write the manifest to the output directory, unless it is unchanged.
+
+    Parameters
+    ----------
+    output_dir : str
+        The directory where the manifest is written.
+    manifest : dict
+        The manifest to write.
+    """
+    path = os.path.join(output_dir, MANIFEST_FILENAME)
+    write_to_file(path, json.dumps(manifest, indent=2, sort_keys=True) + '\n')
+
+
+def is_registry_current(entry, input_hash, config_path):
+    """
+    Check whether a registry recorded in the manifest can be reused as-is.
+
+    Parameters
+    ----------
+    entry : dict or None
+        The registry entry from the previous manifest.
+    input_hash : str
+        The hash of the registry's current inputs.
+    config_path : str or list of str
+        The path of the registry's rendered ``<name>.yaml``, or of each of its
+        config files when it has several upstreams.
+
+    Returns
+    -------
+    bool
+        True if the inputs are unchanged and the rendered file on disk still
+        matches what was recorded.
+    """
+    if not entry or entry.get('input') != input_hash:
+        return False
+    paths = [config_path] if isinstance(config_path, str) else config_path
+    hashes = [hash_file(path) for path in paths]
+    if None in hashes:
+        return False
+    output = hashes[0] if len(hashes) == 1 else hash_data(hashes)
+    return output == entry.get('output')
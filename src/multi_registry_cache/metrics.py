@@ -0,0 +1,203 @@
+"""
+Metrics stack for the multi-registry cache environment.
+
+When config.yaml has a ``metrics`` section, every registry exposes Prometheus
+metrics on its debug listener, Traefik exposes its own on a dedicated entry
+point (labelled per router and service), a redis_exporter service is added to
+compose.yaml, and a Prometheus scrape configuration listing all of these
+targets is written to ``prometheus.yaml`` in the output directory.
+"""
+
+from multi_registry_cache.functions import deep_merge
+
+PROMETHEUS_FILENAME = 'prometheus.yaml'
+REDIS_EXPORTER_SERVICE = 'redis-exporter'
+REDIS_EXPORTER_PORT = 9121
+TRAEFIK_SERVICE = 'traefik'
+TRAEFIK_METRICS_ENTRYPOINT = 'metrics'
+
+DEFAULT_METRICS = {
+    'registryPort': 5001,
+    'traefikPort': 8082,
+    'redisExporterImage': 'oliver006/redis_exporter:v1.62.0',
+    'scrapeInterval': '15s',
+}
+
+
+def validate_metrics(settings):
+    """
+    Validate the ``metrics`` section and fill in its defaults.
+
+    Parameters
+    ----------
+    settings : dict or None
+        The ``metrics`` section of config.yaml; an empty section enables
+        metrics with the defaults.
+
+    Returns
+    -------
+    dict
+        The settings, with every key of DEFAULT_METRICS set.
+
+    Raises
+    ------
+    ValueError
+        If a key is unknown, a port is not a valid TCP port, or the registry
+        and Traefik metrics ports are the registry's API port.
+    """
+    settings = settings or {}
+    if not isinstance(settings, dict):
+        raise ValueError(f"metrics must be a mapping, got {settings!r}")
+    unknown = sorted(set(settings) - set(DEFAULT_METRICS))
+    if unknown:
+        raise ValueError(f"Unknown metrics setting(s): {', '.join(unknown)}")
+
+    metrics = {**DEFAULT_METRICS, **settings}
+    for key in ('registryPort', 'traefikPort'):
+        port = metrics[key]
+        if isinstance(port, bool) or not isinstance(port, int) or not 0 < port < 65536:
+            raise ValueError(f"metrics.{key} must be a TCP port, got {port!r}")
+    return metrics
+
+
+def registry_debug_config(registry_config, metrics):
+    """
+    Enable the Prometheus endpoint of the registry's debug listener.
+
+    Parameters
+    ----------
+    registry_config : dict
+        The ``registry.baseConfig`` template. It is not modified.
+    metrics : dict
+        The validated metrics settings.
+
+    Returns
+    -------
+    dict
+        The template with ``http.debug`` listening on ``registryPort`` and
+        serving Prometheus metrics on ``/metrics``.
+
+    Raises
+    ------
+    ValueError
+        If ``registryPort`` is the port of the registry API (``http.addr``).
+    """
+    api_addr = str((registry_config.get('http') or {}).get('addr', ':5000'))
+    if api_addr.rpartition(':')[2] == str(metrics['registryPort']):
+        raise ValueError(f"metrics.registryPort {metrics['registryPort']} is already used by the registry API")
+    return deep_merge(registry_config, {
+        'http': {
+            'debug': {
+                'addr': f":{metrics['registryPort']}",
+                'prometheus': {'enabled': True, 'path': '/metrics'},
+            },
+        },
+    })
+
+
+def add_traefik_metrics(traefik_config, metrics):
+    """
+    Expose Traefik's Prometheus metrics with router and service labels.
+
+    Traefik serves them on a dedicated ``metrics`` entry point, which is not
+    published on the host. A ``metrics`` section already present in
+    ``traefik.baseConfig`` is kept.
+
+    Parameters
+    ----------
+    traefik_config : dict
+        The Traefik base config, modified in place.
+    metrics : dict
+        The validated metrics settings.
+    """
+    traefik_config.setdefault('entryPoints', {}).setdefault(
+        TRAEFIK_METRICS_ENTRYPOINT, {'address': f":{metrics['traefikPort']}"}
+    )
+    traefik_config.setdefault('metrics', {
+        'prometheus': {
+            'entryPoint': TRAEFIK_METRICS_ENTRYPOINT,
+            'addRoutersLabels': True,
+            'addServicesLabels': True,
+            'addEntryPointsLabels': True,
+        },
+    })
+
+
+def create_redis_exporter_service(redis_service, metrics):
+    """
+    Create the redis_exporter Compose service.
+
+    The exporter is scraped in multi-target mode (``/scrape?target=...``), so a
+    single service covers every Redis shard.
+
+    Parameters
+    ----------
+    redis_service : dict
+        A Redis service definition, whose networks the exporter joins.
+    metrics : dict
+        The validated metrics settings.
+
+    Returns
+    -------
+    dict
+        The exporter service definition.
+    """
+    service = {
+        'image': metrics['redisExporterImage'],
+        'restart': 'always',
+    }
+    if 'networks' in redis_service:
+        service['networks'] = list(redis_service['networks'])
+    return service
+
+
+def prometheus_config(metrics, registry_backends, redis_targets):
+    """
+    Build the Prometheus scrape configuration of the whole stack.
+
+    Targets are Compose service names, so Prometheus must run on the same
+    Docker network as the registries.
+
+    Parameters
+    ----------
+    metrics : dict
+        The validated metrics settings.
+    registry_backends : dict
+        Mapping of registry name to its Compose services (one per replica).
+    redis_targets : list of str
+        The ``host:port`` of every Redis shard.
+
+    Returns
+    -------
+    dict
+        The content of prometheus.yaml.
+    """
+    return {
+        'global': {'scrape_interval': metrics['scrapeInterval']},
+        'scrape_configs': [
+            {
+                'job_name': 'registry',
+                'static_configs': [
+                    {
+                        'targets': [f"{backend}:{metrics['registryPort']}" for backend in backends],
+                        'labels': {'registry': name},
+                    }
+                    for name, backends in registry_backends.items()
+                ],
+            },
+            {
+                'job_name': 'traefik',
+                'static_configs': [{'targets': [f"{TRAEFIK_SERVICE}:{metrics['traefikPort']}"]}],
+            },
+            {
+                'job_name': 'redis',
+                'metrics_path': '/scrape',
+                'static_configs': [{'targets': [f'redis://{target}' for target in redis_targets]}],
+                'relabel_configs': [
+                    {'source_labels': ['__address__'], 'target_label': '__param_target'},
+                    {'source_labels': ['__param_target'], 'target_label': 'instance'},
+                    {'target_label': '__address__', 'replacement': f'{REDIS_EXPORTER_SERVICE}:{REDIS_EXPORTER_PORT}'},
+                ],
+            },
+        ],
+    }
@@ -0,0 +1,300 @@
+"""
+Placement of the registries on several cache hosts.
+
+With a ``nodes`` section, every registry is placed on one node, within the
+node's ``capacity``, from the registry's expected ``load``. generate then
+writes one bundle per node (compose.yaml, traefik.yaml, registry configs,
+Redis configuration) in ``nodes/<node>/``, and a front Traefik in ``front/``
+that routes each registry hostname to its node.
+
+Placements are persisted in ``node-placement.json``: a registry only moves
+when its node is removed or over capacity, so the caches of the others stay
+warm. New and moved registries go, largest load first, to the node with the
+most free capacity.
+"""
+
+import json
+import os
+import re
+
+from rich.text import Text
+
+from multi_registry_cache.functions import console, write_to_file
+
+PLACEMENT_FILENAME = 'node-placement.json'
+PLACEMENT_VERSION = 1
+NODES_DIR = 'nodes'
+FRONT_DIR = 'front'
+DEFAULT_LOAD = 1
+NODE_KEYS = ('name', 'address', 'capacity')
+# Node names become directory names
+_NODE_NAME = re.compile(r'^[a-zA-Z0-9][a-zA-Z0-9_.-]*$')
+_HOST_RULE = re.compile(r"Host\(\s*`([^`]+)`")
+
+
+def _positive_number(value, where):
+    """Check that a value is a positive number."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ValueError(f"{where} must be a positive number, got {value!r}")
+    return value
+
+
+def validate_nodes(nodes):
+    """
+    Validate the ``nodes`` section.
+
+    Parameters
+    ----------
+    nodes : list of dict
+        The nodes, each with a ``name``, the ``address`` the front Traefik
+        reaches it on, and its ``capacity`` in load units.
+
+    Returns
+    -------
+    dict
+        Node name to its settings, in config order.
+
+    Raises
+    ------
+    ValueError
+        If the section is empty, a key is unknown or missing, or a name is
+        invalid or duplicated.
+    """
+    if not isinstance(nodes, list) or not nodes:
+        raise ValueError(f"nodes must be a non-empty list, got {nodes!r}")
+    validated = {}
+    for node in nodes:
+        if not isinstance(node, dict):
+            raise ValueError(f"Every node must be a mapping, got {node!r}")
+        unknown = sorted(set(node) - set(NODE_KEYS))
+        if unknown:
+            raise ValueError(f"Unknown node key(s): {', '.join(unknown)}")
+        missing = [key for key in NODE_KEYS if key not in node]
+        if missing:
+            raise ValueError(f"Node {node.get('name', '?')} requires {', '.join(missing)}")
+        name = node['name']
+        if not isinstance(name, str) or not _NODE_NAME.match(name) or name == FRONT_DIR:
+            raise ValueError(f"Invalid node name {name!r}")
+        if name in validated:
+            raise ValueError(f"Duplicate node name {name!r}")
+        if not isinstance(node['address'], str) or not node['address']:
+            raise ValueError(f"address of node {name} must be a host name or IP address, got {node['address']!r}")
+        _positive_number(node['capacity'], f'capacity of node {name}')
+        validated[name] = node
+    return validated
+
+
+def registry_load(registry):
+    """
+    Return the expected load of a registry.
+
+    Raises
+    ------
+    ValueError
+        If ``load`` is not a positive number.
+    """
+    return _positive_number(registry.get('load', DEFAULT_LOAD), f"load of registry {registry['name']}")
+
+
+def load_placement(output_dir):
+    """
+    Load the persisted placements from the output directory.
+
+    Returns
+    -------
+    dict
+        Registry name to node name; empty if there is no placement file yet.
+
+    Raises
+    ------
+    ValueError
+        If the file is not a supported placement file.
+    """
+    path = os.path.join(output_dir, PLACEMENT_FILENAME)
+    try:
+        with open(path, 'r', encoding='UTF-8') as file:
+            state = json.load(file)
+    except FileNotFoundError:
+        return {}
+
+    if not isinstance(state, dict) or state.get('version') != PLACEMENT_VERSION:
+        console.print(Text(f"Error: unsupported node placement file {path}", style="bold red"))
+        raise ValueError(f"Unsupported node placement file: {path}")
+    return dict(state.get('registries', {}))
+
+
+def save_placement(output_dir, placement):
+    """Persist the placements to the output directory, unless unchanged."""
+    state = {'version': PLACEMENT_VERSION, 'registries': placement}
+    write_to_file(os.path.join(output_dir, PLACEMENT_FILENAME), json.dumps(state, indent=2, sort_keys=True) + '\n')
+
+
+def plan_placement(registries, nodes, previous=None):
+    """
+    Place every registry on a node.
+
+    Parameters
+    ----------
+    registries : list of dict
+        The registries, with their optional ``load`` and ``node`` (to pin a
+        registry to a node).
+    nodes : dict
+        The nodes returned by `validate_nodes`.
+    previous : dict, optional
+        The previous placements, registry name to node name.
+
+    Returns
+    -------
+    tuple of (dict, list)
+        Registry name to node name, and the ``(name, old_node, new_node)``
+        of every registry that moved.
+
+    Raises
+    ------
+    ValueError
+        If a registry pins an unknown node, or the registries do not fit.
+    """
+    previous = previous or {}
+    loads = {registry['name']: registry_load(registry) for registry in registries}
+    used = dict.fromkeys(nodes, 0)
+    placement = {}
+    pinned = set()
+
+    for registry in registries:
+        name = registry['name']
+        if 'node' in registry:
+            if registry['node'] not in nodes:
+                raise ValueError(f"Registry {name} is pinned to unknown node {registry['node']!r}")
+            placement[name] = registry['node']
+            pinned.add(name)
+        elif previous.get(name) in nodes:
+            placement[name] = previous[name]
+        else:
+            continue
+        used[placement[name]] += loads[name]
+
+    # Relieve overloaded nodes, largest registries first: fewer of them have to move
+    for node, settings in nodes.items():
+        movable = sorted(
+            (name for name, owner in placement.items() if owner == node and name not in pinned),
+            key=lambda name: (-loads[name], name)
+        )
+        for name in movable:
+            if used[node] <= settings['capacity']:
+                break
+            del placement[name]
+            used[node] -= loads[name]
+        if used[node] > settings['capacity']:
+            raise ValueError(
+                f"Registries pinned to node {node} need {used[node]:g} load units, more than its capacity "
+                f"{settings['capacity']:g}"
+            )
+
+    unplaced = sorted((name for name in loads if name not in placement), key=lambda name: (-loads[name], name))
+    for name in unplaced:
+        node = max(nodes, key=lambda node: nodes[node]['capacity'] - used[node])
+        if nodes[node]['capacity'] - used[node] < loads[name]:
+            raise ValueError(
+                f"Nodes capacity exceeded: registry {name} needs {loads[name]:g} load units, "
+                f"at most {nodes[node]['capacity'] - used[node]:g} are free on a node"
+            )
+        placement[name] = node
+        used[node] += loads[name]
+
+    moves = [
+        (name, previous[name], placement[name])
+        for name in sorted(placement) if name in previous and previous[name] != placement[name]
+    ]
+    return {registry['name']: placement[registry['name']] for registry in registries}, moves
+
+
+def registry_host(router):
+    """
+    Return the host of a rendered registry router.
+
+    Raises
+    ------
+    ValueError
+        If the router rule has no ``Host(`...`)`` matcher.
+    """
+    match = _HOST_RULE.search(router.get('rule', ''))
+    if match is None:
+        raise ValueError(f"No Host(`...`) in router rule {router.get('rule')!r}")
+    return match.group(1)
+
+
+def front_traefik_config(traefik_config, hosts, nodes, http_port, https_port):
+    """
+    Build the configuration of the front Traefik.
+
+    Plain HTTP requests are routed on their Host header, and TLS connections
+    are passed through on their SNI, so certificates stay on the nodes.
+
+    Parameters
+    ----------
+    traefik_config : dict
+        The Traefik base config of the nodes: the front keeps its file
+        provider, logs and ``web``/``websecure`` entry points.
+    hosts : dict
+        Registry name to ``(host, node)``.
+    nodes : dict
+        The nodes returned by `validate_nodes`.
+    http_port : int or None
+        The port of the nodes' ``web`` entry point, or None if there is none.
+    https_port : int or None
+        The port of the nodes' ``websecure`` entry point, or None if there is none.
+
+    Returns
+    -------
+    dict
+        The front traefik.yaml.
+    """
+    entry_points = traefik_config.get('entryPoints') or {}
+    front = {key: traefik_config[key] for key in ('providers', 'log', 'accessLog') if key in traefik_config}
+    front['entryPoints'] = {
+        name: {'address': entry_points[name]['address']}
+        for name, port in (('web', http_port), ('websecure', https_port)) if port is not None
+    }
+    http = {'routers': {}, 'services': {}}
+    tcp = {'routers': {}, 'services': {}}
+    for node, settings in nodes.items():
+        if http_port is not None:
+            http['services'][node] = {'loadBalancer': {
+                'passHostHeader': True, 'servers': [{'url': f"http://{settings['address']}:{http_port}"}],
+            }}
+        if https_port is not None:
+            tcp['services'][node] = {'loadBalancer': {'servers': [{'address': f"{settings['address']}:{https_port}"}]}}
+    for name, (host, node) in hosts.items():
+        if http_port is not None:
+            http['routers'][name] = {'rule': f'Host(`{host}`)', 'entryPoints': ['web'], 'service': node}
+        if https_port is not None:
+            tcp['routers'][name] = {
+                'rule': f'HostSNI(`{host}`)', 'entryPoints': ['websecure'], 'service': node, 'tls': {'passthrough': True},
+            }
+    if http['routers']:
+        front['http'] = http
+    if tcp['routers']:
+        front['tcp'] = tcp
+    return front
+
+
+def front_compose_config(traefik_service):
+    """
+    Build the compose.yaml of the front Traefik.
+
+    Parameters
+    ----------
+    traefik_service : dict
+        The traefik service of ``docker.baseConfig``. Only its volumes
+        mounting ``traefik.yaml`` are kept: the front holds no certificate.
+
+    Returns
+    -------
+    dict
+        The front compose.yaml.
+    """
+    service = {key: value for key, value in traefik_service.items() if key not in ('networks', 'volumes', 'environment')}
+    volumes = [volume for volume in traefik_service.get('volumes') or [] if 'traefik.yaml' in str(volume)]
+    if volumes:
+        service['volumes'] = volumes
+    return {'services': {'traefik': service}}
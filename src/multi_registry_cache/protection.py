@@ -0,0 +1,199 @@
+"""
+Upstream protection middlewares of the registry routers.
+
+When a CI fan-out hits a cold cache, every request goes through to the
+registry and then to the upstream. ``traefik.protection`` (the defaults) and
+the ``protection`` of a registry cap this with Traefik middlewares attached to
+the registry router: ``inFlightReq`` limits concurrent requests,
+``rateLimit`` limits the request rate, and ``retry`` retries requests the
+registry did not answer (e.g. while a replica restarts).
+
+The ``manifests`` and ``blobs`` sections set the limits of the manifest and
+blob endpoints, which then get their own routers (see
+``traefik.endpointRouters``). Traefik keeps a separate counter per router, so
+endpoint routers never share the registry's ``inFlightReq`` and
+``rateLimit``: they only get the budgets set in their own section, and the
+registry limits cover the requests left on the registry router. Only
+``retry``, which counts nothing, is shared.
+"""
+
+import re
+
+from multi_registry_cache.functions import ENDPOINT_RULES, deep_merge
+
+MIDDLEWARES = ('inFlightReq', 'rateLimit', 'retry')
+MIDDLEWARE_OPTIONS = {
+    'inFlightReq': ('amount', 'sourceCriterion'),
+    'rateLimit': ('average', 'burst', 'period', 'sourceCriterion'),
+    'retry': ('attempts', 'initialInterval'),
+}
+# The option set by a plain number, e.g. ``inFlightReq: 64``
+SHORTHAND_OPTIONS = {'inFlightReq': 'amount', 'rateLimit': 'average', 'retry': 'attempts'}
+# Traefik groups requests by client IP by default: group them by Host, i.e. per registry router
+DEFAULT_SOURCE_CRITERION = {'requestHost': True}
+# Middlewares without a budget, which endpoint routers share with the registry router
+SHARED_MIDDLEWARES = ('retry',)
+
+_DURATION = re.compile(r'^(\d+(\.\d+)?(ns|us|µs|ms|s|m|h))+$')
+
+
+def _positive_int(value, where):
+    """Check that a value is a positive integer."""
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(f"{where} must be a positive integer, got {value!r}")
+    return value
+
+
+def _middleware(kind, settings, where):
+    """Validate the settings of one middleware and return its Traefik definition, or None if disabled."""
+    if settings is False or settings is None:
+        return None
+    if not isinstance(settings, dict):
+        settings = {SHORTHAND_OPTIONS[kind]: settings}
+    unknown = sorted(set(settings) - set(MIDDLEWARE_OPTIONS[kind]))
+    if unknown:
+        raise ValueError(f"Unknown {where} option(s): {', '.join(unknown)}")
+    if SHORTHAND_OPTIONS[kind] not in settings:
+        raise ValueError(f"{where} requires {SHORTHAND_OPTIONS[kind]}")
+
+    options = dict(settings)
+    for key in ('amount', 'average', 'burst', 'attempts'):
+        if key in options:
+            _positive_int(options[key], f'{where}.{key}')
+    for key in ('period', 'initialInterval'):
+        if key in options and (not isinstance(options[key], str) or not _DURATION.match(options[key])):
+            raise ValueError(f"{where}.{key} must be a duration such as 1s or 100ms, got {options[key]!r}")
+    if 'sourceCriterion' in options and not isinstance(options['sourceCriterion'], dict):
+        raise ValueError(f"{where}.sourceCriterion must be a mapping, got {options['sourceCriterion']!r}")
+
+    if kind in ('inFlightReq', 'rateLimit'):
+        options.setdefault('sourceCriterion', DEFAULT_SOURCE_CRITERION)
+    if kind == 'rateLimit':
+        # Traefik's default burst of 1 would reject parallel pulls of the same image
+        options.setdefault('burst', options['average'])
+        if options['burst'] < options['average']:
+            raise ValueError(f"{where}.burst must be at least average, got {options['burst']!r}")
+    return {kind: options}
+
+
+def resolve_protection(settings=None, override=None):
+    """
+    Validate the protection settings of a registry.
+
+    Parameters
+    ----------
+    settings : dict, optional
+        The ``traefik.protection`` defaults.
+    override : dict, optional
+        The registry's own ``protection``, deep-merged over `settings`. A
+        middleware set to ``false`` is disabled.
+
+    Returns
+    -------
+    dict
+        Mapping of 'registry', 'manifests' and 'blobs' to their Traefik
+        middleware definitions, keyed by middleware kind. 'manifests' and
+        'blobs' are only present when they override a limit.
+
+    Raises
+    ------
+    ValueError
+        If a middleware or option is unknown, or a value is invalid.
+    """
+    for section in (settings, override):
+        if section is not None and not isinstance(section, dict):
+            raise ValueError(f"protection must be a mapping, got {section!r}")
+    merged = deep_merge(settings or {}, override or {})
+    unknown = sorted(set(merged) - set(MIDDLEWARES) - set(ENDPOINT_RULES))
+    if unknown:
+        raise ValueError(f"Unknown protection setting(s): {', '.join(unknown)}")
+
+    resolved = {'registry': {}}
+    for kind in MIDDLEWARES:
+        middleware = _middleware(kind, merged.get(kind), f'protection.{kind}')
+        if middleware is not None:
+            resolved['registry'][kind] = middleware
+    for endpoint in ENDPOINT_RULES:
+        section = merged.get(endpoint)
+        if section is None:
+            continue
+        if not isinstance(section, dict):
+            raise ValueError(f"protection.{endpoint} must be a mapping, got {section!r}")
+        unknown = sorted(set(section) - set(MIDDLEWARES))
+        if unknown:
+            raise ValueError(f"Unknown protection.{endpoint} middleware(s): {', '.join(unknown)}")
+        # None when the endpoint disables a registry-wide middleware
+        resolved[endpoint] = {
+            kind: _middleware(kind, value, f'protection.{endpoint}.{kind}') for kind, value in section.items()
+        }
+    return resolved
+
+
+def create_protection(name, protection):
+    """
+    Create the protection middlewares of a registry.
+
+    Parameters
+    ----------
+    name : str
+        The registry name, used to name the middlewares.
+    protection : dict
+        The settings returned by `resolve_protection`.
+
+    Returns
+    -------
+    tuple of (dict, dict)
+        The middleware definitions keyed by name, and the middleware chain of
+        each router: 'registry' and every endpoint. An endpoint chain has the
+        limits of its own section and the shared ``retry``. Chains are ordered
+        so retries stay inside the limits.
+    """
+    middlewares = {}
+    chains = {'registry': []}
+    for kind in MIDDLEWARES:
+        if kind in protection['registry']:
+            middleware_name = f'{name}-{kind.lower()}'
+            middlewares[middleware_name] = protection['registry'][kind]
+            chains['registry'].append(middleware_name)
+    for endpoint in ENDPOINT_RULES:
+        section = protection.get(endpoint) or {}
+        chains[endpoint] = []
+        for kind in MIDDLEWARES:
+            if kind in section:
+                if section[kind] is None:
+                    continue
+                middleware_name = f'{name}-{endpoint}-{kind.lower()}'
+                middlewares[middleware_name] = section[kind]
+                chains[endpoint].append(middleware_name)
+            elif kind in SHARED_MIDDLEWARES and kind in protection['registry']:
+                chains[endpoint].append(f'{name}-{kind.lower()}')
+    return middlewares, chains
+
+
+def attach_middlewares(router, names, replaced=()):
+    """
+    Append middlewares to a router.
+
+    Parameters
+    ----------
+    router : dict
+        The router definition. It is not modified.
+    names : list of str
+        The middlewares to append.
+    replaced : iterable of str, optional
+        Middlewares removed from the router first, e.g. the registry chain
+        inherited by an endpoint router.
+
+    Returns
+    -------
+    dict
+        The router with the middlewares.
+    """
+    middlewares = [middleware for middleware in router.get('middlewares') or [] if middleware not in set(replaced)]
+    middlewares.extend(names)
+    router = dict(router)
+    if middlewares:
+        router['middlewares'] = middlewares
+    else:
+        router.pop('middlewares', None)
+    return router
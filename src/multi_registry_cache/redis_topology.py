@@ -0,0 +1,519 @@
+"""
+Redis topology for the registries' blob descriptor cache.
+
+By default every registry uses its own database of the single ``redis`` service.
+With ``redis.shards`` greater than one, several Redis services are generated and
+each new registry is assigned to a shard with consistent hashing on its name.
+
+Assignments are persisted in ``redis-allocation.json`` in the output directory:
+a registry keeps its shard and database across regenerations, even when other
+registries are inserted or removed, and freed databases are reused.
+"""
+
+import bisect
+import copy
+import hashlib
+import json
+import os
+import re
+
+from rich.text import Text
+
+from multi_registry_cache.functions import console, write_to_file
+
+DEFAULT_REDIS_SERVICE = 'redis'
+DEFAULT_REDIS_PORT = 6379
+
+# Points per shard on the hash ring; more points give a more even spread
+RING_POINTS_PER_SHARD = 64
+
+ALLOCATION_FILENAME = 'redis-allocation.json'
+ALLOCATION_VERSION = 1
+
+
+class AllocationChangedError(RuntimeError):
+    """Raised in check mode when regenerating would move a registry to another Redis database."""
+
+
+def shard_names(count):
+    """
+    Return the Redis service names for a number of shards.
+
+    Parameters
+    ----------
+    count : int
+        The number of shards.
+
+    Returns
+    -------
+    list of str
+        ``['redis', 'redis-1', 'redis-2', ...]``. The first shard keeps the
+        name of the single ``redis`` service, so going from one shard to
+        several keeps every registry on its database.
+    """
+    return [DEFAULT_REDIS_SERVICE, *(f'{DEFAULT_REDIS_SERVICE}-{index}' for index in range(1, count))]
+
+
+def _ring_hash(value):
+    """Return a stable 64-bit hash of a string, independent of PYTHONHASHSEED."""
+    return int.from_bytes(hashlib.sha1(value.encode('UTF-8')).digest()[:8], 'big')
+
+
+def build_hash_ring(shards):
+    """
+    Build a consistent hashing ring for the given shards.
+
+    Parameters
+    ----------
+    shards : list of str
+        The shard names.
+
+    Returns
+    -------
+    tuple of (list of int, list of str)
+        The sorted ring positions and the shard owning each position.
+    """
+    points = sorted(
+        (_ring_hash(f'{shard}#{index}'), shard)
+        for shard in shards
+        for index in range(RING_POINTS_PER_SHARD)
+    )
+    return [position for position, _ in points], [shard for _, shard in points]
+
+
+def shard_for(ring, name):
+    """
+    Return the shard owning a registry name on a hash ring.
+
+    Parameters
+    ----------
+    ring : tuple of (list of int, list of str)
+        The ring returned by :func:`build_hash_ring`.
+    name : str
+        The registry name.
+
+    Returns
+    -------
+    str
+        The shard name.
+    """
+    positions, owners = ring
+    index = bisect.bisect(positions, _ring_hash(name)) % len(positions)
+    return owners[index]
+
+
+def redis_port(base_addr):
+    """
+    Return the port of a Redis ``host:port`` address.
+
+    Parameters
+    ----------
+    base_addr : str or None
+        The address from ``registry.baseConfig.redis.addr``.
+
+    Returns
+    -------
+    int
+        The port, or the default Redis port if none is set.
+    """
+    if base_addr and ':' in str(base_addr):
+        return int(str(base_addr).rsplit(':', 1)[1])
+    return DEFAULT_REDIS_PORT
+
+
+def allocate_databases(registries, shards, previous=None):
+    """
+    Assign every registry to a shard and a database within that shard.
+
+    Registries found in ``previous`` keep their assignment as long as their
+    shard still exists. Other registries are placed, in config order, on the
+    shard chosen by consistent hashing and get its lowest free database, which
+    reuses the databases freed by removed registries.
+
+    Parameters
+    ----------
+    registries : list of dict
+        The registry entries.
+    shards : list of str
+        The shard names.
+    previous : dict, optional
+        The previous assignments, registry name to ``(shard, db)``.
+
+    Returns
+    -------
+    tuple of (dict, list)
+        The assignments (registry name to ``(shard, db)``) and the changed
+        assignments of previously known registries, as ``(name, old, new)``.
+    """
+    previous = previous or {}
+    ring = build_hash_ring(shards) if len(shards) > 1 else None
+    used = {shard: set() for shard in shards}
+    allocation = {}
+
+    # Keep existing assignments first so new registries cannot take their slot
+    for registry in registries:
+        name = registry['name']
+        old = previous.get(name)
+        if old is not None and name not in allocation and old[0] in used and old[1] not in used[old[0]]:
+            allocation[name] = old
+            used[old[0]].add(old[1])
+
+    changes = []
+    for registry in registries:
+        name = registry['name']
+        if name in allocation:
+            continue
+        shard = shards[0] if ring is None else shard_for(ring, name)
+        db = 0
+        while db in used[shard]:
+            db += 1
+        used[shard].add(db)
+        allocation[name] = (shard, db)
+        if name in previous:
+            changes.append((name, previous[name], allocation[name]))
+    return allocation, changes
+
+
+def databases_per_shard(allocation, shards):
+    """
+    Return the number of databases each shard must declare.
+
+    Parameters
+    ----------
+    allocation : dict
+        Registry name to ``(shard, db)``.
+    shards : list of str
+        The shard names.
+
+    Returns
+    -------
+    dict
+        Shard name to the highest assigned database plus one (0 if unused).
+    """
+    databases = {shard: 0 for shard in shards}
+    for shard, db in allocation.values():
+        databases[shard] = max(databases[shard], db + 1)
+    return databases
+
+
+def load_allocation(output_dir):
+    """
+    Load the persisted Redis assignments from the output directory.
+
+    Parameters
+    ----------
+    output_dir : str
+        The directory containing the allocation file.
+
+    Returns
+    -------
+    dict
+        Registry name to ``(shard, db)``; empty if there is no allocation file yet.
+    """
+    path = os.path.join(output_dir, ALLOCATION_FILENAME)
+    try:
+        with open(path, 'r', encoding='UTF-8') as file:
+            state = json.load(file)
+    except FileNotFoundError:
+        return {}
+
+    if not isinstance(state, dict) or state.get('version') != ALLOCATION_VERSION:
+        console.print(Text(f"Error: unsupported Redis allocation file {path}", style="bold red"))
+        raise ValueError(f"Unsupported Redis allocation file: {path}")
+    return {
+        name: (entry['shard'], int(entry['db']))
+        for name, entry in state.get('registries', {}).items()
+    }
+
+
+def save_allocation(output_dir, allocation):
+    """
+    Persist the Redis assignments to the output directory, unless unchanged.
+
+    Parameters
+    ----------
+    output_dir : str
+        The directory where the allocation file is written.
+    allocation : dict
+        Registry name to ``(shard, db)``.
+    """
+    state = {
+        'version': ALLOCATION_VERSION,
+        'registries': {name: {'shard': shard, 'db': db} for name, (shard, db) in allocation.items()},
+    }
+    path = os.path.join(output_dir, ALLOCATION_FILENAME)
+    write_to_file(path, json.dumps(state, indent=2, sort_keys=True) + '\n')
+
+
+def create_shard_services(base_service, shards):
+    """
+    Create one Compose service per shard from the base ``redis`` service.
+
+    References to ``./redis.conf`` in the base service are pointed at the
+    shard's own ``./<shard>.conf``.
+
+    Parameters
+    ----------
+    base_service : dict
+        The ``redis`` service from ``docker.baseConfig.services``.
+    shards : list of str
+        The shard names.
+
+    Returns
+    -------
+    dict
+        Shard name to Compose service definition.
+    """
+    services = {}
+    for shard in shards:
+        service = copy.deepcopy(base_service)
+        if isinstance(service.get('volumes'), list):
+            service['volumes'] = [
+                volume.replace('./redis.conf:', f'./{shard}.conf:') if isinstance(volume, str) else volume
+                for volume in service['volumes']
+            ]
+        services[shard] = service
+    return services
+
+
+# Connection settings of the registries' Redis client (Distribution's redis section)
+CLIENT_TIMEOUTS = ('dialtimeout', 'readtimeout', 'writetimeout')
+CLIENT_POOL_KEYS = ('maxidle', 'maxactive', 'idletimeout')
+_DURATION = re.compile(r'^(\d+(\.\d+)?(ns|us|µs|ms|s|m|h))+$')
+
+
+def validate_client(client):
+    """
+    Validate the ``redis.client`` section.
+
+    Parameters
+    ----------
+    client : dict
+        Connection pool (``pool.maxidle``, ``pool.maxactive``,
+        ``pool.idletimeout``) and timeout (``dialtimeout``, ``readtimeout``,
+        ``writetimeout``) settings, in Distribution's format.
+
+    Returns
+    -------
+    dict
+        The settings, to merge into the ``redis`` section of every registry config.
+
+    Raises
+    ------
+    ValueError
+        If a key is unknown or a value is invalid.
+    """
+    if not isinstance(client, dict):
+        raise ValueError("redis.client must be a mapping")
+    unknown = set(client) - set(CLIENT_TIMEOUTS) - {'pool'}
+    if unknown:
+        raise ValueError(f"Unknown redis.client key(s): {', '.join(sorted(unknown))}")
+    pool = client.get('pool') or {}
+    if not isinstance(pool, dict):
+        raise ValueError("redis.client.pool must be a mapping")
+    unknown = set(pool) - set(CLIENT_POOL_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown redis.client.pool key(s): {', '.join(sorted(unknown))}")
+
+    for key in ('maxidle', 'maxactive'):
+        value = pool.get(key, 0)
+        if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            raise ValueError(f"redis.client.pool.{key} must be a non-negative integer")
+    # maxactive 0 means no limit on the number of connections
+    if pool.get('maxactive') and pool.get('maxidle', 0) > pool['maxactive']:
+        raise ValueError("redis.client.pool.maxidle cannot be greater than maxactive")
+    durations = [(f'redis.client.{key}', client[key]) for key in CLIENT_TIMEOUTS if key in client]
+    if 'idletimeout' in pool:
+        durations.append(('redis.client.pool.idletimeout', pool['idletimeout']))
+    for key, value in durations:
+        if not isinstance(value, str) or not _DURATION.match(value):
+            raise ValueError(f"{key} must be a duration such as 10ms or 5m, got {value!r}")
+    return {key: value for key, value in client.items() if key != 'pool' or pool}
+
+
+# Defaults of the redis.tuning section
+DEFAULT_TUNING = {
+    'descriptorMemory': '64mb',
+    'baseMemory': '32mb',
+    'maxmemoryPolicy': 'allkeys-lfu',
+    'persistence': 'none',
+    'ioThreads': 1,
+    'lazyfree': True,
+    'hz': 10,
+}
+TUNING_KEYS = set(DEFAULT_TUNING) | {'maxmemory', 'lfuLogFactor', 'lfuDecayTime'}
+MAXMEMORY_POLICIES = {
+    'allkeys-lru', 'allkeys-lfu', 'allkeys-random',
+    'volatile-lru', 'volatile-lfu', 'volatile-random', 'volatile-ttl',
+    'noeviction',
+}
+PERSISTENCE_MODES = ('none', 'rdb', 'aof')
+
+_SIZE_UNITS = {'': 1, 'b': 1, 'k': 1000, 'kb': 1024, 'm': 1000 ** 2, 'mb': 1024 ** 2, 'g': 1000 ** 3, 'gb': 1024 ** 3}
+
+
+def parse_size(value):
+    """
+    Parse a memory size the way redis.conf does (``64mb``, ``1gb``, ``1048576``).
+
+    Parameters
+    ----------
+    value : str or int
+        The size to parse.
+
+    Returns
+    -------
+    int
+        The size in bytes.
+
+    Raises
+    ------
+    ValueError
+        If the size is not a non-negative integer with an optional Redis unit.
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid memory size: {value!r}")
+    if isinstance(value, int):
+        number, unit = value, ''
+    else:
+        text = str(value).strip().lower()
+        digits = text.rstrip('kmgb')
+        unit = text[len(digits):]
+        if not digits.isdigit() or unit not in _SIZE_UNITS:
+            raise ValueError(f"Invalid memory size: {value!r}")
+        number = int(digits)
+    if number < 0:
+        raise ValueError(f"Invalid memory size: {value!r}")
+    return number * _SIZE_UNITS[unit]
+
+
+def format_size(size):
+    """
+    Format a size in bytes with the largest exact binary Redis unit.
+
+    Parameters
+    ----------
+    size : int
+        The size in bytes.
+
+    Returns
+    -------
+    str
+        The size, e.g. ``352mb``.
+    """
+    for unit in ('gb', 'mb', 'kb'):
+        if size and size % _SIZE_UNITS[unit] == 0:
+            return f'{size // _SIZE_UNITS[unit]}{unit}'
+    return str(size)
+
+
+def validate_tuning(tuning):
+    """
+    Validate a ``redis.tuning`` section and fill in its defaults.
+
+    Parameters
+    ----------
+    tuning : dict
+        The tuning section from config.yaml.
+
+    Returns
+    -------
+    dict
+        The tuning settings with defaults applied and sizes parsed to bytes.
+
+    Raises
+    ------
+    ValueError
+        If a key is unknown, a value is invalid, or settings contradict each other.
+    """
+    if not isinstance(tuning, dict):
+        raise ValueError("redis.tuning must be a mapping")
+    unknown = set(tuning) - TUNING_KEYS
+    if unknown:
+        raise ValueError(f"Unknown redis.tuning key(s): {', '.join(sorted(unknown))}")
+    if 'maxmemory' in tuning and ('descriptorMemory' in tuning or 'baseMemory' in tuning):
+        raise ValueError("redis.tuning.maxmemory cannot be combined with descriptorMemory/baseMemory, which compute it")
+
+    settings = {**DEFAULT_TUNING, **tuning}
+    for key in ('descriptorMemory', 'baseMemory', 'maxmemory'):
+        if key in settings:
+            settings[key] = parse_size(settings[key])
+    if settings.get('maxmemory') == 0:
+        raise ValueError("redis.tuning.maxmemory must be greater than 0: an unbounded cache is the default")
+
+    policy = settings['maxmemoryPolicy']
+    if policy not in MAXMEMORY_POLICIES:
+        raise ValueError(f"Unknown redis.tuning.maxmemoryPolicy: {policy!r}")
+    if policy == 'noeviction':
+        raise ValueError("redis.tuning.maxmemoryPolicy noeviction makes Redis reject cache writes once maxmemory is reached")
+    if policy.startswith('volatile-'):
+        raise ValueError(f"redis.tuning.maxmemoryPolicy {policy} never evicts: blob descriptors are stored without a TTL")
+    if ('lfuLogFactor' in settings or 'lfuDecayTime' in settings) and not policy.endswith('-lfu'):
+        raise ValueError("redis.tuning.lfuLogFactor/lfuDecayTime require an lfu maxmemoryPolicy")
+
+    if settings['persistence'] not in PERSISTENCE_MODES:
+        raise ValueError(f"redis.tuning.persistence must be one of {', '.join(PERSISTENCE_MODES)}")
+    for key, low, high in (('ioThreads', 1, 128), ('hz', 1, 500), ('lfuLogFactor', 0, 255), ('lfuDecayTime', 0, 65535)):
+        if key in settings:
+            value = settings[key]
+            if isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+                raise ValueError(f"redis.tuning.{key} must be an integer between {low} and {high}")
+    if not isinstance(settings['lazyfree'], bool):
+        raise ValueError("redis.tuning.lazyfree must be true or false")
+    return settings
+
+
+def redis_conf(databases, tuning=None, registry_count=0):
+    """
+    Render the ``redis.conf`` of a shard.
+
+    Parameters
+    ----------
+    databases : int
+        The number of databases used on the shard.
+    tuning : dict, optional
+        Tuning settings returned by :func:`validate_tuning`.
+    registry_count : int
+        The number of registries using the shard, to size ``maxmemory``.
+
+    Returns
+    -------
+    str
+        The configuration file content.
+    """
+    lines = [f'databases {databases}']
+    if not tuning:
+        return '\n'.join(lines)
+
+    maxmemory = tuning.get('maxmemory')
+    if maxmemory is None:
+        maxmemory = tuning['baseMemory'] + registry_count * tuning['descriptorMemory']
+    lines += [
+        f'maxmemory {format_size(maxmemory)}',
+        f"maxmemory-policy {tuning['maxmemoryPolicy']}",
+    ]
+    if 'lfuLogFactor' in tuning:
+        lines.append(f"lfu-log-factor {tuning['lfuLogFactor']}")
+    if 'lfuDecayTime' in tuning:
+        lines.append(f"lfu-decay-time {tuning['lfuDecayTime']}")
+
+    # The blob descriptor cache can always be rebuilt from storage, so persistence is optional
+    if tuning['persistence'] == 'none':
+        lines += ['save ""', 'appendonly no']
+    elif tuning['persistence'] == 'rdb':
+        lines += ['save 3600 1 300 100 60 10000', 'appendonly no']
+    else:
+        lines += ['save ""', 'appendonly yes', 'appendfsync everysec']
+
+    if tuning['ioThreads'] > 1:
+        lines += [f"io-threads {tuning['ioThreads']}", 'io-threads-do-reads yes']
+
+    lazyfree = 'yes' if tuning['lazyfree'] else 'no'
+    lines += [
+        f'lazyfree-lazy-eviction {lazyfree}',
+        f'lazyfree-lazy-expire {lazyfree}',
+        f'lazyfree-lazy-server-del {lazyfree}',
+        f'lazyfree-lazy-user-del {lazyfree}',
+        f"hz {tuning['hz']}",
+    ]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,236 @@
+"""
+Container resource sizing for the registry services.
+
+With a ``resources`` section in config.yaml, every registry replica gets CPU
+and memory limits (``deploy.resources.limits``), a file descriptor limit
+(``ulimits.nofile``), and the matching ``GOMAXPROCS`` and ``GOMEMLIMIT``
+environment variables, so the Go runtime stays within the container limits.
+
+A registry either uses a named ``profile`` with fixed resources, or gets a
+share of what the profiles leave of the host ``budget``, proportional to its
+``weight`` (1 by default). Generation fails when the profiles oversubscribe
+the budget.
+"""
+
+import math
+
+from multi_registry_cache.redis_topology import parse_size
+from multi_registry_cache.upstreams import backend_names
+
+MIB = 1024 ** 2
+# Share of the memory limit given to GOMEMLIMIT: the Go heap is not the only memory of the process
+GOMEMLIMIT_RATIO = 0.9
+# Limits below these values would not let a registry serve anything
+MIN_CPUS = 0.1
+MIN_MEMORY = 64 * MIB
+MIN_NOFILE = 1024
+
+SETTINGS_KEYS = ('budget', 'profiles')
+LIMIT_KEYS = ('cpus', 'memory', 'nofile')
+
+
+def _validate_limits(limits, where, required=('cpus', 'memory')):
+    """Validate cpus/memory/nofile limits and parse the memory size to bytes."""
+    if not isinstance(limits, dict):
+        raise ValueError(f"{where} must be a mapping, got {limits!r}")
+    unknown = sorted(set(limits) - set(LIMIT_KEYS))
+    if unknown:
+        raise ValueError(f"Unknown {where} key(s): {', '.join(unknown)}")
+    missing = [key for key in required if key not in limits]
+    if missing:
+        raise ValueError(f"{where} requires {', '.join(missing)}")
+
+    parsed = {}
+    if 'cpus' in limits:
+        cpus = limits['cpus']
+        if isinstance(cpus, bool) or not isinstance(cpus, (int, float)) or cpus <= 0:
+            raise ValueError(f"{where}.cpus must be a positive number, got {cpus!r}")
+        parsed['cpus'] = float(cpus)
+    if 'memory' in limits:
+        parsed['memory'] = parse_size(limits['memory'])
+        if parsed['memory'] <= 0:
+            raise ValueError(f"{where}.memory must be greater than 0")
+    if 'nofile' in limits:
+        nofile = limits['nofile']
+        if isinstance(nofile, bool) or not isinstance(nofile, int) or nofile < MIN_NOFILE:
+            raise ValueError(f"{where}.nofile must be an integer of at least {MIN_NOFILE}, got {nofile!r}")
+        parsed['nofile'] = nofile
+    return parsed
+
+
+def validate_resources(settings):
+    """
+    Validate the ``resources`` section.
+
+    Parameters
+    ----------
+    settings : dict
+        ``budget`` (the ``cpus``, ``memory`` and optional ``nofile`` the
+        registries may use on the host) and optional ``profiles`` (mapping of
+        profile name to its ``cpus``, ``memory`` and optional ``nofile``).
+
+    Returns
+    -------
+    dict
+        The settings, memory sizes parsed to bytes.
+
+    Raises
+    ------
+    ValueError
+        If a key is unknown, a value is invalid, or a profile sets ``nofile``
+        while the budget does not.
+    """
+    if not isinstance(settings, dict):
+        raise ValueError(f"resources must be a mapping, got {settings!r}")
+    unknown = sorted(set(settings) - set(SETTINGS_KEYS))
+    if unknown:
+        raise ValueError(f"Unknown resources setting(s): {', '.join(unknown)}")
+    if 'budget' not in settings:
+        raise ValueError("resources requires a budget")
+
+    profiles = settings.get('profiles') or {}
+    if not isinstance(profiles, dict):
+        raise ValueError(f"resources.profiles must be a mapping, got {profiles!r}")
+    validated = {
+        'budget': _validate_limits(settings['budget'], 'resources.budget'),
+        'profiles': {
+            name: _validate_limits(limits, f'resources.profiles.{name}') for name, limits in profiles.items()
+        },
+    }
+    # Profile file descriptors are only checked against a budget
+    for name, limits in validated['profiles'].items():
+        if 'nofile' in limits and 'nofile' not in validated['budget']:
+            raise ValueError(f"resources.profiles.{name}.nofile requires resources.budget.nofile")
+    return validated
+
+
+def allocate_resources(registries, settings):
+    """
+    Size every registry replica against the host budget.
+
+    Registries with a ``profile`` get its limits. The rest of the budget is
+    shared by the other registries in proportion to their ``weight``.
+
+    Parameters
+    ----------
+    registries : list of dict
+        The registry entries, with their ``replicas``, ``profile`` or ``weight``.
+    settings : dict
+        The settings returned by `validate_resources`.
+
+    Returns
+    -------
+    dict
+        Registry name to the limits of each of its replicas: ``cpus``,
+        ``memory`` (bytes) and, when known, ``nofile``.
+
+    Raises
+    ------
+    ValueError
+        If a registry has an invalid weight or an unknown profile, or if the
+        registries need more than the budget.
+    """
+    budget, profiles = settings['budget'], settings['profiles']
+    limits = {}
+    weights = {}
+    used = dict.fromkeys(LIMIT_KEYS, 0)
+    for registry in registries:
+        name = registry['name']
+        # Every upstream of a registry runs its own replicas
+        replicas = len(backend_names(registry))
+        if 'profile' in registry and 'weight' in registry:
+            raise ValueError(f"Registry {name} cannot have both a profile and a weight")
+        if 'profile' in registry:
+            if registry['profile'] not in profiles:
+                raise ValueError(f"Registry {name} uses unknown resources profile {registry['profile']!r}")
+            limits[name] = dict(profiles[registry['profile']])
+            for key, value in limits[name].items():
+                used[key] += value * replicas
+        else:
+            weight = registry.get('weight', 1)
+            if isinstance(weight, bool) or not isinstance(weight, (int, float)) or weight <= 0:
+                raise ValueError(f"weight of registry {name} must be a positive number, got {weight!r}")
+            weights[name] = (weight, replicas)
+
+    for key in LIMIT_KEYS:
+        if key in budget and used[key] > budget[key]:
+            raise ValueError(
+                f"Resources profiles oversubscribe the budget: {_format(key, used[key])} {key} "
+                f"for a budget of {_format(key, budget[key])}"
+            )
+
+    # Weighted registries share what the profiles leave, replica by replica
+    total_weight = sum(weight * replicas for weight, replicas in weights.values())
+    for name, (weight, _) in weights.items():
+        share = weight / total_weight
+        limits[name] = {
+            'cpus': (budget['cpus'] - used['cpus']) * share,
+            'memory': int((budget['memory'] - used['memory']) * share),
+        }
+        if 'nofile' in budget:
+            limits[name]['nofile'] = int((budget['nofile'] - used['nofile']) * share)
+        for key, minimum in (('cpus', MIN_CPUS), ('memory', MIN_MEMORY), ('nofile', MIN_NOFILE)):
+            if key in limits[name] and limits[name][key] < minimum:
+                raise ValueError(
+                    f"Resources budget is oversubscribed: registry {name} would get {_format(key, limits[name][key])} "
+                    f"{key} per replica, less than {_format(key, minimum)}"
+                )
+    return limits
+
+
+def _format(key, value):
+    """Format a cpus, memory or nofile amount for an error message."""
+    if key == 'cpus':
+        return f'{value:g}'
+    if key == 'memory':
+        return f'{value / MIB:.0f}MiB'
+    return str(int(value))
+
+
+def apply_limits(service, limits):
+    """
+    Apply resource limits to a registry's Compose service.
+
+    Parameters
+    ----------
+    service : dict
+        The rendered service definition. It is not modified.
+    limits : dict
+        The limits of one replica, as returned by `allocate_resources`.
+
+    Returns
+    -------
+    dict
+        The service with ``deploy.resources.limits``, ``ulimits.nofile``, and
+        the ``GOMAXPROCS`` and ``GOMEMLIMIT`` environment variables.
+    """
+    service = dict(service)
+    memory_mib = max(1, limits['memory'] // MIB)
+    deploy = dict(service.get('deploy') or {})
+    resources = dict(deploy.get('resources') or {})
+    resources['limits'] = {
+        **(resources.get('limits') or {}),
+        'cpus': f"{limits['cpus']:.2f}",
+        'memory': f'{memory_mib}M',
+    }
+    deploy['resources'] = resources
+    service['deploy'] = deploy
+    if 'nofile' in limits:
+        service['ulimits'] = {
+            **(service.get('ulimits') or {}),
+            'nofile': {'soft': limits['nofile'], 'hard': limits['nofile']},
+        }
+
+    # The Go runtime sees the host's CPUs and memory, not the container limits
+    variables = {
+        'GOMAXPROCS': str(max(1, math.floor(limits['cpus']))),
+        'GOMEMLIMIT': f'{max(1, int(memory_mib * GOMEMLIMIT_RATIO))}MiB',
+    }
+    environment = service.get('environment')
+    if isinstance(environment, list):
+        service['environment'] = [
+            item for item in environment if str(item).split('=', 1)[0] not in variables
+        ] + [f'{key}={value}' for key, value in variables.items()]
+    else:
+        service['environment'] = {**(environment or {}), **variables}
+    return service
@@ -13,11 +13,14 @@ import importlib.resources
 import os
 import tempfile
 
-from rich.prompt import Confirm, Prompt
+from rich.prompt import Confirm, IntPrompt, Prompt
 from rich.text import Text
 from ruamel.yaml import YAML
 
-from multi_registry_cache.functions import console
+from multi_registry_cache.entrypoints import KEY_TYPES, TLS_VERSIONS
+from multi_registry_cache.functions import console, resolve_storage_redirect
+from multi_registry_cache.redis_topology import validate_client, validate_tuning
+from multi_registry_cache.storage_tuning import tune_storage
 
 
 def main(config_path="config.yaml"):
@@ -94,6 +97,17 @@ def main(config_path="config.yaml"):
     domain_name = Prompt.ask("[blue]Enter the domain name to use [/][italic green](For example, {name}.registry.example.com can produce docker.registry.example.com)[/]")
     config['traefik']['perRegistry']['router']['rule'] = f"Host(`{domain_name}`)"
 
+    # HTTP/3 lets distant clients reuse QUIC connections instead of a TCP and TLS handshake per layer connection
+    if Confirm.ask(Text("Do you want to enable HTTP/3 on the HTTPS entry point (publishes UDP 443)?", style="bold blue"), default=False):
+        config['traefik']['http3'] = True
+    if Confirm.ask(Text("Do you want to set TLS options (minimum version, curves, ACME key type)?", style="bold blue"), default=False):
+        config['traefik']['tls'] = {
+            'minVersion': Prompt.ask(Text("Minimum TLS version", style="yellow"), choices=list(TLS_VERSIONS), default="VersionTLS12"),
+            # X25519 is the fastest key exchange; P-256 is for clients without it
+            'curvePreferences': ["X25519", "CurveP256"],
+            'keyType': Prompt.ask(Text("Key type of the ACME certificates (ECDSA handshakes are cheaper)", style="yellow"), choices=list(KEY_TYPES), default="EC256"),
+        }
+
     # Ask user for storage driver choice
     storage_driver = Prompt.ask(Text("Choose your storage (in every case, a subdirectory per registry will be created)", style="blue"), choices=["inmemory", "filesystem", "s3", "gcs"])
 
@@ -132,6 +146,86 @@ def main(config_path="config.yaml"):
     # Add the storage configuration to the main configuration
     config['registry']['baseConfig']['storage'][storage_driver] = storage_config
 
+    # Object storage throughput depends on part sizes: derive them from the link and the layer sizes
+    if storage_driver in ("s3", "gcs") and Confirm.ask(
+        Text("Do you want to tune storage throughput for large layers?", style="bold blue"), default=True
+    ):
+        while True:
+            storage_tuning = {
+                'linkBandwidth': Prompt.ask(Text("Link bandwidth to the object storage (e.g. 1gbit, 500mbit)", style="yellow"), default="1gbit"),
+                'layerSize': Prompt.ask(Text("Size of the largest layers you expect (e.g. 4gb for ML images)", style="yellow"), default="4gb"),
+            }
+            try:
+                tuned = tune_storage({'storage': {storage_driver: {}}}, storage_tuning)['storage'][storage_driver]
+                break
+            except ValueError as e:
+                console.print(Text(f"Invalid storage tuning: {e}", style="bold red"))
+        console.print(Text(
+            "Recommended values: " + ", ".join(f"{key}={value}" for key, value in tuned.items()),
+            style="green"
+        ))
+        config['storageTuning'] = storage_tuning
+
+    # Let clients download blobs from the object storage, or a CDN in front of it, instead of through the registry
+    if storage_driver in ("s3", "gcs") and Confirm.ask(
+        Text("Do you want clients to download blobs directly from the object storage (storage redirect)?", style="bold blue"),
+        default=True
+    ):
+        storage_redirect = {'enabled': True}
+        cdn_choices = ["none", "redirect"] + (["cloudfront"] if storage_driver == "s3" else [])
+        cdn = Prompt.ask(Text("Serve blobs through a CDN? ('redirect' rewrites the URL to a CDN base URL)", style="yellow"), choices=cdn_choices, default="none")
+        if cdn != "none":
+            while True:
+                options = {'baseurl': Prompt.ask(Text("CDN base URL (e.g. https://d111111abcdef8.cloudfront.net/)", style="yellow"))}
+                if cdn == "cloudfront":
+                    options['privatekey'] = Prompt.ask(Text("Path of the CloudFront private key inside the registry containers", style="yellow"))
+                    options['keypairid'] = Prompt.ask(Text("CloudFront key pair ID", style="yellow"))
+                    options['duration'] = Prompt.ask(Text("Lifetime of the signed URLs", style="yellow"), default="20m")
+                try:
+                    storage_redirect['cdn'] = resolve_storage_redirect({'cdn': {'name': cdn, 'options': options}})['cdn']
+                    break
+                except ValueError as e:
+                    console.print(Text(f"Invalid CDN settings: {e}", style="bold red"))
+        config['storageRedirect'] = storage_redirect
+
+    # Optionally generate a Redis tuning profile for the blob descriptor cache
+    if Confirm.ask(Text("Do you want to tune Redis (memory limit, eviction, persistence)?", style="bold blue"), default=False):
+        while True:
+            tuning = {
+                'descriptorMemory': Prompt.ask(Text("Expected blob descriptor memory per registry", style="yellow"), default="64mb"),
+                'maxmemoryPolicy': Prompt.ask(Text("Eviction policy", style="yellow"), choices=["allkeys-lfu", "allkeys-lru"], default="allkeys-lfu"),
+                'persistence': Prompt.ask(Text("Persistence (the cache can always be rebuilt)", style="yellow"), choices=["none", "rdb", "aof"], default="none"),
+                'ioThreads': IntPrompt.ask(Text("Redis I/O threads", style="yellow"), default=1),
+                'lazyfree': Confirm.ask(Text("Free memory in the background (lazyfree)?", style="yellow"), default=True),
+                'hz': IntPrompt.ask(Text("Background task frequency (hz)", style="yellow"), default=10),
+            }
+            try:
+                validate_tuning(tuning)
+                break
+            except ValueError as e:
+                console.print(Text(f"Invalid Redis tuning: {e}", style="bold red"))
+        config['redis']['tuning'] = tuning
+
+    # Optionally size the registries' Redis connection pool
+    if Confirm.ask(Text("Do you want to tune the registries' Redis connections (pool, timeouts)?", style="bold blue"), default=False):
+        while True:
+            client = {
+                'pool': {
+                    'maxidle': IntPrompt.ask(Text("Idle connections kept open per registry", style="yellow"), default=16),
+                    'maxactive': IntPrompt.ask(Text("Maximum connections per registry (0 for no limit)", style="yellow"), default=64),
+                    'idletimeout': Prompt.ask(Text("Close idle connections after", style="yellow"), default="300s"),
+                },
+                'dialtimeout': Prompt.ask(Text("Connection timeout", style="yellow"), default="100ms"),
+                'readtimeout': Prompt.ask(Text("Read timeout", style="yellow"), default="100ms"),
+                'writetimeout': Prompt.ask(Text("Write timeout", style="yellow"), default="100ms"),
+            }
+            try:
+                validate_client(client)
+                break
+            except ValueError as e:
+                console.print(Text(f"Invalid Redis client settings: {e}", style="bold red"))
+        config['redis']['client'] = client
+
     # Ask if user wants to proceed with creating config.yaml
     if Confirm.ask(Text("Is everything correct? Do we create config.yaml?", style="bold blue"), default=True):
         # Write the final configuration to config.yaml
@@ -0,0 +1,219 @@
+"""
+Throughput tuning of the S3 and GCS storage drivers.
+
+The Distribution defaults (10MB upload parts, 32MB copy parts) are sized for
+small layers. For multi-GB layers they mean thousands of sequential requests
+per blob. With a ``storageTuning`` section, generate derives part sizes and
+concurrency from the declared link bandwidth and expected layer size, and
+emits them, with any explicit value, into each registry's storage driver.
+Explicit values are validated against the limits of the object stores.
+"""
+
+import math
+import re
+
+from multi_registry_cache.functions import deep_merge
+from multi_registry_cache.redis_topology import parse_size
+
+MIB = 1024 ** 2
+GIB = 1024 ** 3
+
+# S3 multipart limits: parts of 5MiB to 5GiB (except the last one), at most 10000 parts per object,
+# and a single CopyObject request copies at most 5GiB
+S3_MIN_PART_SIZE = 5 * MIB
+S3_MAX_PART_SIZE = 5 * GIB
+S3_MAX_PARTS = 10000
+# GCS resumable uploads are sent in multiples of 256KiB
+GCS_CHUNK_ALIGNMENT = 256 * 1024
+
+# Throughput of a single S3 request stream, used to size concurrency to the link
+S3_STREAM_THROUGHPUT = 50 * 1000 ** 2
+# Upload parts hold about this much time of link bandwidth
+PART_DURATION = 0.25
+# Upload parts are buffered in memory by every writer: keep them reasonable
+MAX_UPLOAD_PART_SIZE = 256 * MIB
+
+SIZE_TUNABLES = ('chunksize', 'multipartcopychunksize', 'multipartcopythresholdsize')
+DRIVER_TUNABLES = {
+    's3': ('chunksize', 'multipartcopychunksize', 'multipartcopymaxconcurrency', 'multipartcopythresholdsize',
+           'maxconcurrency'),
+    'gcs': ('chunksize',),
+}
+SETTINGS_KEYS = ('linkBandwidth', 'layerSize')
+
+_BANDWIDTH = re.compile(r'^(\d+(?:\.\d+)?)\s*([kmg]?)bit(?:/s)?$')
+_BANDWIDTH_UNITS = {'': 1, 'k': 1000, 'm': 1000 ** 2, 'g': 1000 ** 3}
+
+
+def parse_bandwidth(value):
+    """
+    Parse a link bandwidth such as ``1gbit`` or ``500mbit/s``.
+
+    Parameters
+    ----------
+    value : str
+        The bandwidth, in bits per second with an optional k/m/g prefix.
+
+    Returns
+    -------
+    float
+        The bandwidth in bytes per second.
+
+    Raises
+    ------
+    ValueError
+        If the value is not a positive bandwidth.
+    """
+    match = _BANDWIDTH.match(str(value).strip().lower())
+    if match is None or float(match.group(1)) <= 0:
+        raise ValueError(f"Invalid link bandwidth: {value!r} (expected e.g. 1gbit or 500mbit)")
+    return float(match.group(1)) * _BANDWIDTH_UNITS[match.group(2)] / 8
+
+
+def _power_of_two_mib(size, minimum, maximum):
+    """Round a size up to a power-of-two number of MiB, within bounds."""
+    mib = max(1, math.ceil(size / MIB))
+    return min(max(2 ** math.ceil(math.log2(mib)) * MIB, minimum), maximum)
+
+
+def recommend(driver, link_bandwidth, layer_size):
+    """
+    Recommend storage driver tunables for a link and a layer size.
+
+    Parameters
+    ----------
+    driver : str
+        The storage driver, 's3' or 'gcs'.
+    link_bandwidth : float
+        The link bandwidth in bytes per second.
+    layer_size : int
+        The expected size of the largest layers, in bytes.
+
+    Returns
+    -------
+    dict
+        The recommended tunables of the driver, sizes in bytes.
+    """
+    # An upload part carries a fraction of a second of traffic, so request overhead stays small
+    upload_part = link_bandwidth * PART_DURATION
+    if driver == 'gcs':
+        return {'chunksize': _power_of_two_mib(upload_part, 16 * MIB, MAX_UPLOAD_PART_SIZE)}
+
+    # Uploads must fit in S3_MAX_PARTS parts
+    chunksize = _power_of_two_mib(
+        max(upload_part, layer_size / S3_MAX_PARTS), 8 * MIB, max(MAX_UPLOAD_PART_SIZE, layer_size / S3_MAX_PARTS)
+    )
+    # Server-side copies (when an upload is committed) do not use the link: about a hundred parts
+    # copied in parallel finish a large layer in a few rounds
+    copy_chunksize = _power_of_two_mib(layer_size / 100, 32 * MIB, S3_MAX_PART_SIZE)
+    return {
+        'chunksize': chunksize,
+        'multipartcopychunksize': copy_chunksize,
+        'multipartcopythresholdsize': copy_chunksize,
+        'multipartcopymaxconcurrency': min(100, max(1, math.ceil(layer_size / copy_chunksize))),
+        'maxconcurrency': min(256, max(16, 4 * math.ceil(link_bandwidth / S3_STREAM_THROUGHPUT))),
+    }
+
+
+def validate_driver_tuning(driver, params, layer_size=None):
+    """
+    Validate and normalize the tunables of a storage driver.
+
+    Parameters
+    ----------
+    driver : str
+        The storage driver, 's3' or 'gcs'.
+    params : dict
+        The tunables; sizes may use units (``64mb``).
+    layer_size : int, optional
+        The expected layer size, checked against the S3 part count limit.
+
+    Returns
+    -------
+    dict
+        The tunables, sizes converted to bytes.
+
+    Raises
+    ------
+    ValueError
+        If a value is out of the limits of the object store.
+    """
+    tuned = {}
+    for key, value in params.items():
+        if key in SIZE_TUNABLES:
+            tuned[key] = parse_size(value)
+        elif isinstance(value, bool) or not isinstance(value, int) or value < 1:
+            raise ValueError(f"{driver}.{key} must be a positive integer, got {value!r}")
+        else:
+            tuned[key] = value
+
+    if driver == 's3':
+        for key in ('chunksize', 'multipartcopychunksize'):
+            if key in tuned and not S3_MIN_PART_SIZE <= tuned[key] <= S3_MAX_PART_SIZE:
+                raise ValueError(f"s3.{key} must be between 5MB and 5GB (S3 part size limits), got {params[key]!r}")
+        if tuned.get('multipartcopythresholdsize', 0) > S3_MAX_PART_SIZE:
+            raise ValueError(
+                f"s3.multipartcopythresholdsize must be at most 5GB (larger objects cannot be copied in one request), "
+                f"got {params['multipartcopythresholdsize']!r}"
+            )
+        if layer_size and 'chunksize' in tuned and layer_size > tuned['chunksize'] * S3_MAX_PARTS:
+            raise ValueError(
+                f"s3.chunksize {params['chunksize']!r} is too small for {layer_size} byte layers (at most {S3_MAX_PARTS} parts)"
+            )
+    elif driver == 'gcs':
+        if 'chunksize' in tuned and (tuned['chunksize'] < GCS_CHUNK_ALIGNMENT or tuned['chunksize'] % GCS_CHUNK_ALIGNMENT):
+            raise ValueError(f"gcs.chunksize must be a positive multiple of 256KB, got {params['chunksize']!r}")
+    return tuned
+
+
+def tune_storage(registry_config, settings=None, override=None):
+    """
+    Apply and validate the throughput tunables of a registry's S3 or GCS storage.
+
+    Parameters
+    ----------
+    registry_config : dict
+        The rendered registry configuration. It is not modified.
+    settings : dict, optional
+        The ``storageTuning`` settings: ``linkBandwidth`` and ``layerSize`` to
+        derive recommended values, and any driver tunable, which takes
+        precedence over them and over the value in the driver configuration.
+    override : dict, optional
+        The registry's own ``storageTuning``, merged over `settings`.
+
+    Returns
+    -------
+    dict
+        The registry configuration with the tunables in its storage driver,
+        or unchanged if it uses another driver.
+
+    Raises
+    ------
+    ValueError
+        If a setting is unknown or invalid.
+    """
+    for section in (settings, override):
+        if section is not None and not isinstance(section, dict):
+            raise ValueError(f"storageTuning must be a mapping, got {section!r}")
+    settings = {**(settings or {}), **(override or {})}
+    storage = registry_config.get('storage') or {}
+    driver = next((name for name in DRIVER_TUNABLES if name in storage), None)
+    if driver is None:
+        return registry_config
+
+    unknown = sorted(set(settings) - set(SETTINGS_KEYS) - set(DRIVER_TUNABLES[driver]))
+    if unknown:
+        raise ValueError(f"Unknown storageTuning setting(s) for {driver}: {', '.join(unknown)}")
+
+    layer_size = parse_size(settings['layerSize']) if 'layerSize' in settings else None
+    params = {}
+    if 'linkBandwidth' in settings:
+        params = recommend(driver, parse_bandwidth(settings['linkBandwidth']), layer_size or GIB)
+    driver_config = storage[driver] or {}
+    params.update({key: value for key, value in driver_config.items() if key in DRIVER_TUNABLES[driver]})
+    params.update({key: value for key, value in settings.items() if key in DRIVER_TUNABLES[driver]})
+    if not params:
+        return registry_config
+
+    tuned = validate_driver_tuning(driver, params, layer_size)
+    return deep_merge(registry_config, {'storage': {driver: {**driver_config, **tuned}}})
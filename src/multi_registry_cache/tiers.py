@@ -0,0 +1,147 @@
+"""
+Tiered cache topology: central and edge sites.
+
+With a ``tiers`` section, generate writes one bundle per site in
+``tiers/<tier>/``. A tier without ``upstream`` (the central site) caches the
+real upstream registries. An edge tier caches its upstream tier instead: the
+``proxy.remoteurl`` of each of its registries is the URL of the same registry
+on the upstream tier, taken from the rendered ``perRegistry.router`` rule, so
+every layer crosses the internet once for all the sites. Credentials and TTLs
+are carried over.
+
+Every registry is rendered with ``{tier}`` and the tier's ``vars`` as extra
+placeholders, so that each site gets its own hostnames.
+"""
+
+from multi_registry_cache import functions
+from multi_registry_cache.placement import registry_host
+
+TIERS_DIR = 'tiers'
+TIER_KEYS = ('name', 'upstream', 'registries', 'vars')
+
+
+def validate_tiers(tiers, registry_names):
+    """
+    Validate the ``tiers`` section.
+
+    Parameters
+    ----------
+    tiers : list of dict
+        The tiers, each with a ``name``, the ``upstream`` tier it caches (none
+        for a central tier), the ``registries`` it serves (all of them by
+        default) and ``vars``, extra placeholders of its templates.
+    registry_names : list of str
+        The names of every registry, in config order.
+
+    Returns
+    -------
+    dict
+        Tier name to its settings (``registries`` filled in), upstream tiers
+        first.
+
+    Raises
+    ------
+    ValueError
+        If a key is unknown, a tier or registry is unknown, the upstreams form
+        a loop, or an edge tier serves a registry its upstream tier does not.
+    """
+    if not isinstance(tiers, list) or not tiers:
+        raise ValueError(f"tiers must be a non-empty list, got {tiers!r}")
+    validated = {}
+    for tier in tiers:
+        if not isinstance(tier, dict) or not isinstance(tier.get('name'), str) or not tier['name']:
+            raise ValueError(f"Every tier needs a name, got {tier!r}")
+        name = tier['name']
+        unknown = sorted(set(tier) - set(TIER_KEYS))
+        if unknown:
+            raise ValueError(f"Unknown key(s) for tier {name}: {', '.join(unknown)}")
+        if name in validated:
+            raise ValueError(f"Duplicate tier name {name!r}")
+        variables = tier.get('vars') or {}
+        if not isinstance(variables, dict) or {'name', 'tier'} & set(variables):
+            raise ValueError(f"vars of tier {name} must be a mapping without name or tier")
+        served = tier.get('registries', registry_names)
+        if not isinstance(served, list):
+            raise ValueError(f"registries of tier {name} must be a list of registry names")
+        missing = sorted(set(served) - set(registry_names))
+        if missing:
+            raise ValueError(f"Tier {name} serves unknown registries: {', '.join(missing)}")
+        validated[name] = {**tier, 'registries': [n for n in registry_names if n in set(served)], 'vars': variables}
+
+    for name, tier in validated.items():
+        upstream = tier.get('upstream')
+        if upstream is None:
+            continue
+        if upstream not in validated:
+            raise ValueError(f"Tier {name} has unknown upstream tier {upstream!r}")
+        missing = [registry for registry in tier['registries'] if registry not in validated[upstream]['registries']]
+        if missing:
+            raise ValueError(f"Tier {name} serves {', '.join(missing)}, missing from its upstream tier {upstream}")
+
+    ordered = {}
+    for name in validated:
+        chain = []
+        while name is not None and name not in ordered:
+            if name in chain:
+                raise ValueError(f"Tier upstreams form a loop: {' -> '.join(chain + [name])}")
+            chain.append(name)
+            name = validated[name].get('upstream')
+        for tier_name in reversed(chain):
+            ordered[tier_name] = validated[tier_name]
+    return ordered
+
+
+def tier_registries(tier_name, tiers, registries, router_template):
+    """
+    Return the registries of a tier, ready to generate.
+
+    Parameters
+    ----------
+    tier_name : str
+        The tier.
+    tiers : dict
+        The tiers returned by `validate_tiers`.
+    registries : list of dict
+        Every registry. They are not modified.
+    router_template : dict or CompiledTemplate
+        The ``traefik.perRegistry.router`` template, whose rule gives the
+        hostname of a registry on a tier.
+
+    Returns
+    -------
+    list of dict
+        Copies of the tier's registries, with ``tier`` and the tier's vars.
+        On an edge tier, each registry is a cache whose ``url`` is the same
+        registry on the upstream tier.
+
+    Raises
+    ------
+    ValueError
+        If a registry would cache itself: its hostname is the same on the tier
+        and on its upstream tier.
+    """
+    tier = tiers[tier_name]
+    served = set(tier['registries'])
+    result = []
+    for registry in registries:
+        if registry['name'] not in served:
+            continue
+        tier_registry = {**registry, **tier['vars'], 'tier': tier_name}
+        upstream = tier.get('upstream')
+        if upstream is not None:
+            upstream_registry = {**registry, **tiers[upstream]['vars'], 'tier': upstream}
+            upstream_router = functions.render_template(router_template, upstream_registry)
+            host = registry_host(upstream_router)
+            if host == registry_host(functions.render_template(router_template, tier_registry)):
+                raise ValueError(
+                    f"Registry {registry['name']} has the same hostname {host} on tiers {tier_name} and {upstream}: "
+                    "use {tier} or tier vars in the router rule"
+                )
+            scheme = 'https' if 'tls' in upstream_router else 'http'
+            # A private registry of the upstream tier is cached read-only on the edges, and the
+            # upstreams of a registry are left to the upstream tier
+            for key in ('upstreams', 'upstreamMode'):
+                tier_registry.pop(key, None)
+            tier_registry.update({'type': 'cache', 'url': f'{scheme}://{host}'})
+        result.append(tier_registry)
+    return result
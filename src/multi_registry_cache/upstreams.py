@@ -0,0 +1,337 @@
+"""
+Several upstreams behind one cache registry.
+
+A ``cache`` registry proxies a single ``url``: when it is slow or down, every
+pull stalls. With ``upstreams`` (e.g. registry-1.docker.io and mirror.gcr.io),
+generate runs one registry:2 backend per upstream, each with its own
+``<name>-<upstream>.yaml`` but the storage and Redis database of the registry,
+so a layer pulled through one upstream is served by all of them. Traefik
+routes the registry to the backends through a ``failover`` chain, in upstream
+order, or a ``weighted`` service.
+
+Each backend checks its upstream with the registry's own health checks
+(``health.tcp`` by default, or ``health.http``): while the upstream is
+unreachable, the backend answers 503, the Traefik health check takes it out,
+and pulls go to the other upstreams.
+"""
+
+import os
+import re
+from urllib.parse import urlsplit
+
+from multi_registry_cache import functions
+from multi_registry_cache.functions import ENDPOINT_RULES
+
+UPSTREAM_KEYS = ('name', 'url', 'username', 'password', 'ttl', 'weight', 'healthCheck')
+UPSTREAM_MODES = ('failover', 'weighted')
+DEFAULT_MODE = 'failover'
+# Registry keys set per upstream instead
+REGISTRY_ONLY_KEYS = ('url', 'username', 'password')
+# health.tcp and health.http checks of the Distribution config
+TCP_HEALTH_CHECK = {'timeout': '3s', 'interval': '10s', 'threshold': 3}
+HTTP_HEALTH_CHECK_KEYS = ('uri', 'headers', 'statuscode', 'timeout', 'interval', 'threshold')
+# Upstream names end up in Compose service and Traefik service names
+_UPSTREAM_NAME = re.compile(r'^[a-zA-Z0-9]+$')
+
+
+def resolve_upstreams(registry):
+    """
+    Validate the ``upstreams`` of a registry.
+
+    Parameters
+    ----------
+    registry : dict
+        The registry entry, with ``upstreams``: URLs or mappings with a
+        ``url``, an optional ``name`` (default ``upstream<N>``), credentials,
+        ``ttl`` (default: the registry's), ``weight`` (default 1) and
+        ``healthCheck`` (``false``, or the options of a ``health.http`` check
+        instead of the default ``health.tcp`` one). ``upstreamMode`` is
+        ``failover`` (default) or ``weighted``.
+
+    Returns
+    -------
+    list of dict or None
+        None for a registry without ``upstreams``. Otherwise, in order, each
+        upstream's ``name``, ``backend`` (the Compose service, or replica
+        prefix, of its backend), ``registry`` (the registry entry rendering
+        its config file), ``weight`` and ``health`` (the Distribution
+        ``health`` section, or None).
+
+    Raises
+    ------
+    ValueError
+        If the registry is not a cache, sets ``url`` or credentials next to
+        ``upstreams``, or an upstream is invalid.
+    """
+    if 'upstreams' not in registry:
+        if 'upstreamMode' in registry:
+            raise ValueError(f"Registry {registry['name']} has an upstreamMode but no upstreams")
+        return None
+
+    name = registry['name']
+    if registry.get('type', 'cache') != 'cache':
+        raise ValueError(f"Registry {name} has upstreams but is not a cache")
+    mixed = [key for key in REGISTRY_ONLY_KEYS if key in registry]
+    if mixed:
+        raise ValueError(f"Registry {name} has upstreams: set {', '.join(mixed)} per upstream")
+    mode = registry.get('upstreamMode', DEFAULT_MODE)
+    if mode not in UPSTREAM_MODES:
+        raise ValueError(f"upstreamMode of registry {name} must be one of {', '.join(UPSTREAM_MODES)}, got {mode!r}")
+    entries = registry['upstreams']
+    if not isinstance(entries, list) or len(entries) < 2:
+        raise ValueError(f"upstreams of registry {name} must list at least two upstreams, use url for a single one")
+
+    base = {key: value for key, value in registry.items() if key not in ('upstreams', 'upstreamMode')}
+    resolved = []
+    for index, upstream in enumerate(entries, start=1):
+        if isinstance(upstream, str):
+            upstream = {'url': upstream}
+        if not isinstance(upstream, dict) or not isinstance(upstream.get('url'), str) or not upstream['url']:
+            raise ValueError(f"Every upstream of registry {name} needs a url, got {upstream!r}")
+        unknown = sorted(set(upstream) - set(UPSTREAM_KEYS))
+        if unknown:
+            raise ValueError(f"Unknown key(s) for an upstream of registry {name}: {', '.join(unknown)}")
+        label = upstream.get('name', f'upstream{index}')
+        if not isinstance(label, str) or not _UPSTREAM_NAME.match(label) or label in ENDPOINT_RULES:
+            raise ValueError(f"Invalid upstream name {label!r} for registry {name}: use letters and digits")
+        if any(other['name'] == label for other in resolved):
+            raise ValueError(f"Duplicate upstream name {label!r} for registry {name}")
+        weight = upstream.get('weight', 1)
+        if isinstance(weight, bool) or not isinstance(weight, int) or weight < 1:
+            raise ValueError(f"weight of upstream {label} of registry {name} must be a positive integer, got {weight!r}")
+
+        upstream_registry = {**base, 'url': upstream['url']}
+        for key in ('username', 'password', 'ttl'):
+            if key in upstream:
+                upstream_registry[key] = upstream[key]
+        resolved.append({
+            'name': label,
+            'backend': f'{name}-{label}',
+            'registry': upstream_registry,
+            'weight': weight,
+            'health': _health_section(functions.interpolate_strings(upstream['url'], base),
+                                      upstream.get('healthCheck', True), f'upstream {label} of registry {name}'),
+        })
+    return resolved
+
+
+def _health_section(url, check, where):
+    """Return the Distribution ``health`` section checking an upstream, or None if disabled."""
+    if check is False:
+        return None
+    if check is True:
+        parts = urlsplit(url)
+        if not parts.hostname:
+            raise ValueError(f"url of {where} must be an absolute URL, got {url!r}")
+        port = parts.port or (80 if parts.scheme == 'http' else 443)
+        return {'tcp': [{'addr': f'{parts.hostname}:{port}', **TCP_HEALTH_CHECK}]}
+    if not isinstance(check, dict):
+        raise ValueError(f"healthCheck of {where} must be true, false or a mapping, got {check!r}")
+    unknown = sorted(set(check) - set(HTTP_HEALTH_CHECK_KEYS))
+    if unknown:
+        raise ValueError(f"Unknown healthCheck option(s) of {where}: {', '.join(unknown)}")
+    return {'http': [{'uri': f"{url.rstrip('/')}/v2/", **check}]}
+
+
+def backend_names(registry):
+    """
+    Return the Compose service names of every backend of a registry.
+
+    Returns
+    -------
+    list of str
+        The replicas of each upstream for a registry with ``upstreams``,
+        otherwise the registry's replicas (see `functions.replica_names`).
+    """
+    upstreams = resolve_upstreams(registry)
+    if upstreams is None:
+        return functions.replica_names(registry)
+    return [
+        backend
+        for upstream in upstreams
+        for backend in functions.replica_names({**registry, 'name': upstream['backend']})
+    ]
+
+
+def generated_names(registry):
+    """
+    Return the names that a registry's generated objects take.
+
+    Returns
+    -------
+    dict
+        Kind of object (``Compose service``, ``config file``, ``Traefik
+        service``, ``Traefik router``) to the names of that kind.
+    """
+    name = registry['name']
+    resolved = resolve_upstreams(registry)
+    backends = [name] if resolved is None else [upstream['backend'] for upstream in resolved]
+    services = [name, *backends]
+    if resolved is not None and registry.get('upstreamMode', DEFAULT_MODE) == 'failover':
+        services.extend(f"{upstream['backend']}-failover" for upstream in resolved[1:-1])
+    return {
+        'Compose service': backend_names(registry),
+        'config file': [f'{backend}.yaml' for backend in backends],
+        'Traefik service': sorted(set(services)),
+        'Traefik router': [name, *(f'{name}-{endpoint}' for endpoint in ENDPOINT_RULES)],
+    }
+
+
+def validate_names(registries):
+    """
+    Check that no two registries generate objects with the same name.
+
+    A registry ``docker`` with an upstream ``hub`` and a registry
+    ``docker-hub`` would otherwise overwrite each other's Compose service,
+    config file and Traefik service.
+
+    Parameters
+    ----------
+    registries : list of dict
+        Every registry, their upstreams validated.
+
+    Raises
+    ------
+    ValueError
+        If two registries generate a Compose service, config file, Traefik
+        service or router with the same name.
+    """
+    owners = {}
+    for registry in registries:
+        for kind, names in generated_names(registry).items():
+            for generated in names:
+                owner = owners.setdefault((kind, generated), registry['name'])
+                if owner != registry['name']:
+                    raise ValueError(
+                        f"Registries {owner} and {registry['name']} both generate the {kind} {generated}: rename one"
+                    )
+
+
+def add_health_check(config, health):
+    """
+    Add the health check of an upstream to a rendered registry config.
+
+    Parameters
+    ----------
+    config : dict
+        The registry config. It is not modified.
+    health : dict or None
+        The ``health`` section returned by `resolve_upstreams`.
+
+    Returns
+    -------
+    dict
+        The config, its checks of the same kind followed by the upstream's.
+    """
+    if health is None:
+        return config
+    merged = dict(config.get('health') or {})
+    for kind, checks in health.items():
+        merged[kind] = [*(merged.get(kind) or []), *checks]
+    return {**config, 'health': merged}
+
+
+def _config_mount(volume, name, backend):
+    """Return a Compose volume with the config file of `name` replaced by the one of `backend`, or None."""
+    if isinstance(volume, dict):
+        source = volume.get('source')
+    elif isinstance(volume, str):
+        source = volume.partition(':')[0]
+    else:
+        return None
+    if not isinstance(source, str) or os.path.basename(source) != f'{name}.yaml':
+        return None
+    backend_source = os.path.join(os.path.dirname(source), f'{backend}.yaml')
+    if isinstance(volume, dict):
+        return {**volume, 'source': backend_source}
+    return backend_source + volume[len(source):]
+
+
+def create_backend_service(service, name, backend):
+    """
+    Create the Compose service of an upstream backend.
+
+    Parameters
+    ----------
+    service : dict
+        The rendered Compose service of the registry. It is not modified.
+    name : str
+        The registry name.
+    backend : str
+        The upstream backend, whose ``<backend>.yaml`` replaces the
+        registry's ``<name>.yaml`` in the volumes.
+
+    Returns
+    -------
+    dict
+        The backend's Compose service.
+
+    Raises
+    ------
+    ValueError
+        If the service does not mount ``<name>.yaml``.
+    """
+    volumes = []
+    found = False
+    for volume in service.get('volumes') or []:
+        mounted = _config_mount(volume, name, backend)
+        found = found or mounted is not None
+        volumes.append(volume if mounted is None else mounted)
+    if not found:
+        raise ValueError(f"The Compose service of registry {name} must mount {name}.yaml to have several upstreams")
+    return {**service, 'volumes': volumes}
+
+
+def create_upstream_services(registry, upstreams, mode, custom=None, servers_transport=None):
+    """
+    Create the Traefik services of a registry with several upstreams.
+
+    Parameters
+    ----------
+    registry : dict
+        The registry entry.
+    upstreams : list of dict
+        The upstreams returned by `resolve_upstreams`.
+    mode : str
+        ``failover`` or ``weighted``.
+    custom : dict or CompiledTemplate, optional
+        The ``traefik.perRegistry.service`` template, rendered once per
+        upstream with the replicas of its backend as servers.
+    servers_transport : str, optional
+        The name of the serversTransport of the load balancers.
+
+    Returns
+    -------
+    tuple of (dict, dict)
+        The registry service, and the other services keyed by name: the load
+        balancer of each upstream and, for a failover over more than two
+        upstreams, the inner steps of the chain.
+
+    Raises
+    ------
+    ValueError
+        If the service template is not a ``loadBalancer``.
+    """
+    services = {}
+    for upstream in upstreams:
+        service = functions.create_traefik_service(
+            registry, custom, functions.replica_names({**registry, 'name': upstream['backend']}), servers_transport
+        )
+        if not isinstance(service, dict) or not isinstance(service.get('loadBalancer'), dict):
+            raise ValueError(f"Registry {registry['name']} has upstreams: its Traefik service must be a loadBalancer")
+        services[upstream['backend']] = service
+
+    if mode == 'weighted':
+        # With healthCheck enabled, upstreams whose health check fails leave the rotation
+        return {'weighted': {
+            'services': [{'name': upstream['backend'], 'weight': upstream['weight']} for upstream in upstreams],
+            'healthCheck': {},
+        }}, services
+
+    # Traefik's failover has a single fallback: chain them, each step reporting its health to the previous one
+    fallback = upstreams[-1]['backend']
+    for upstream in reversed(upstreams[1:-1]):
+        step = f"{upstream['backend']}-failover"
+        services[step] = {'failover': {'service': upstream['backend'], 'fallback': fallback, 'healthCheck': {}}}
+        fallback = step
+    return {'failover': {'service': upstreams[0]['backend'], 'fallback': fallback}}, services
@@ -0,0 +1,542 @@
+"""
+Cache pre-warmer for the multi-registry cache environment.
+
+Pulls image manifests and blobs through the cache registries, so that after a
+deploy or a storage migration the first clients are served from the cache
+instead of hitting the upstream registries (and their rate limits) all at once.
+
+Usage:
+    Called via the CLI: multi-registry-cache warm [--config config.yaml] IMAGE...
+"""
+
+import asyncio
+import http.client
+import json
+import os
+import re
+import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from rich.table import Table
+from rich.text import Text
+
+from multi_registry_cache import functions, inventory, tiers, upstreams
+from multi_registry_cache.functions import console
+
+DEFAULT_STATE_FILE = '.warm-state.json'
+STATE_VERSION = 1
+# Minimum delay between two saves of the resume state
+STATE_SAVE_INTERVAL = 5.0
+# Blobs are read and discarded in chunks of this size
+READ_CHUNK_SIZE = 1 << 20
+
+DOCKER_HUB_HOSTS = ('docker.io', 'index.docker.io', 'registry-1.docker.io')
+INDEX_MEDIA_TYPES = (
+    'application/vnd.oci.image.index.v1+json',
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+)
+IMAGE_MEDIA_TYPES = (
+    'application/vnd.oci.image.manifest.v1+json',
+    'application/vnd.docker.distribution.manifest.v2+json',
+)
+MANIFEST_ACCEPT = ', '.join(INDEX_MEDIA_TYPES + IMAGE_MEDIA_TYPES)
+
+_HOST_RULE = re.compile(r"Host\(\s*`([^`]+)`")
+_REPOSITORY = re.compile(r"^[a-z0-9]+(?:[._-]+[a-z0-9]+)*(?:/[a-z0-9]+(?:[._-]+[a-z0-9]+)*)*$")
+
+
+class WarmError(RuntimeError):
+    """Raised when some images could not be fetched through their cache."""
+
+
+def parse_image_reference(reference):
+    """
+    Split an image reference the way the Docker client does.
+
+    Parameters
+    ----------
+    reference : str
+        An image reference, e.g. ``nginx``, ``ghcr.io/owner/app:1.2`` or
+        ``quay.io/org/app@sha256:...``.
+
+    Returns
+    -------
+    tuple of (str, str, str)
+        The registry host (``docker.io`` when omitted), the repository
+        (with ``library/`` added for official Docker Hub images) and the tag
+        or digest (``latest`` when omitted).
+
+    Raises
+    ------
+    ValueError
+        If the repository name is invalid.
+    """
+    name, digest = reference, None
+    if '@' in name:
+        name, digest = name.split('@', 1)
+    tag = None
+    if ':' in name.rsplit('/', 1)[-1]:
+        name, tag = name.rsplit(':', 1)
+
+    first, _, rest = name.partition('/')
+    if rest and ('.' in first or ':' in first or first == 'localhost'):
+        host, repository = first, rest
+    else:
+        host, repository = 'docker.io', name
+    if host in DOCKER_HUB_HOSTS and '/' not in repository:
+        repository = f'library/{repository}'
+
+    if not _REPOSITORY.match(repository):
+        raise ValueError(f"Invalid image reference {reference!r}")
+    return host, repository, digest or tag or 'latest'
+
+
+def _upstream_aliases(registry):
+    """Return the hostnames of the upstream registries of a cache, with the Docker Hub aliases."""
+    resolved = upstreams.resolve_upstreams(registry)
+    urls = [registry.get('url', '')] if resolved is None else [upstream['registry']['url'] for upstream in resolved]
+    aliases = []
+    for url in urls:
+        host = urlsplit(functions.interpolate_strings(url, registry)).netloc
+        aliases.extend(DOCKER_HUB_HOSTS if host in DOCKER_HUB_HOSTS else (host,))
+    return aliases
+
+
+def resolve_caches(base_config, endpoint=None, tier=None):
+    """
+    Find the public address of every cache registry from the Traefik router template.
+
+    Parameters
+    ----------
+    base_config : dict
+        The loaded config.yaml.
+    endpoint : str, optional
+        URL to connect to instead of the host of the router rule, e.g. to
+        reach Traefik directly. The rule host is still sent as Host header.
+    tier : str, optional
+        With a ``tiers`` section, the tier whose caches are warmed. Optional
+        when there is a single tier. An edge tier also caches the registries
+        of its upstream tier, reachable by their hostname there.
+
+    Returns
+    -------
+    dict
+        Mapping of registry host (the cache hostname and the upstream
+        hostname, with its Docker Hub aliases) to the cache: a dict with its
+        'name', the 'host' of its router rule and the 'base_url' to connect to.
+
+    Raises
+    ------
+    ValueError
+        If a router rule has no ``Host(`...`)`` matcher, or the tier is
+        missing or unknown.
+    """
+    template = functions.compile_template(base_config['traefik']['perRegistry']['router'])
+    registries = base_config['registries']
+    originals = {registry['name']: registry for registry in registries}
+    if 'tiers' in base_config:
+        tier_settings = tiers.validate_tiers(base_config['tiers'], list(originals))
+        if tier is None and len(tier_settings) == 1:
+            tier = next(iter(tier_settings))
+        if tier not in tier_settings:
+            raise ValueError(f"choose the tier to warm among {', '.join(tier_settings)}, got {tier!r}")
+        registries = tiers.tier_registries(tier, tier_settings, registries, template)
+    elif tier is not None:
+        raise ValueError(f"the config has no tiers, got tier {tier!r}")
+
+    caches = {}
+    for registry in registries:
+        # Only pull-through caches have something to warm
+        if registry.get('type', 'cache') != 'cache':
+            continue
+
+        name = registry['name']
+        router = functions.render_template(template, registry)
+        match = _HOST_RULE.search(router.get('rule', ''))
+        if match is None:
+            raise ValueError(f"No Host(`...`) in the router rule of {name}: {router.get('rule')!r}")
+        host = match.group(1)
+        scheme = 'https' if 'tls' in router else 'http'
+        cache = {'name': name, 'host': host, 'base_url': endpoint or f'{scheme}://{host}'}
+
+        aliases = _upstream_aliases(registry)
+        original = originals[name]
+        if original is not registry and original.get('type', 'cache') == 'cache':
+            # An edge tier caches the upstream tier, which caches the real upstream registries
+            aliases.extend(_upstream_aliases(original))
+        for key in (host, *aliases):
+            if key:
+                caches[key] = cache
+    return caches
+
+
+def load_state(state_path):
+    """
+    Load the digests of the blobs fetched by an interrupted run.
+
+    Parameters
+    ----------
+    state_path : str
+        Path of the state file.
+
+    Returns
+    -------
+    dict
+        Mapping of registry name to the set of fetched blob digests. Empty if
+        the file is missing, unreadable or from another version.
+    """
+    try:
+        with open(state_path, 'r', encoding='UTF-8') as file:
+            state = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if not isinstance(state, dict) or state.get('version') != STATE_VERSION:
+        return {}
+    return {name: set(digests) for name, digests in state.get('blobs', {}).items()}
+
+
+def save_state(state_path, done):
+    """
+    Atomically write the digests of the fetched blobs.
+
+    Parameters
+    ----------
+    state_path : str
+        Path of the state file.
+    done : dict
+        Mapping of registry name to the set of fetched blob digests.
+    """
+    state = {
+        'version': STATE_VERSION,
+        'blobs': {name: sorted(digests) for name, digests in sorted(done.items()) if digests},
+    }
+    temp_path = f'{state_path}.tmp'
+    with open(temp_path, 'w', encoding='UTF-8') as file:
+        json.dump(state, file)
+    os.replace(temp_path, state_path)
+
+
+def warm(config_path="config.yaml", images=(), state_path=DEFAULT_STATE_FILE, concurrency=4,
+         registry_concurrency=None, max_connections=16, platforms=None, endpoint=None,
+         insecure=False, timeout=300.0, restart=False, tier=None):
+    """
+    Pull images through the cache registries so their manifests and blobs get cached.
+
+    For every image, the manifest is resolved through the cache serving its
+    registry; for a multi-arch index, the manifest of each platform is
+    resolved too. Every config and layer blob is then downloaded and
+    discarded. A blob shared by several images is fetched once.
+
+    The digests of fetched blobs are saved to a state file while running, so
+    an interrupted run resumes where it stopped. The file is removed once a
+    run completes without errors.
+
+    Parameters
+    ----------
+    config_path : str
+        Path to the config.yaml file. Defaults to "config.yaml".
+    images : iterable of str
+        Image references, e.g. ``nginx:1.27`` or ``ghcr.io/owner/app:1.2``.
+        The registry host selects the cache, by its upstream ``url`` or its
+        own hostname.
+    state_path : str
+        Path of the resume state file. Defaults to ".warm-state.json".
+    concurrency : int
+        Maximum number of concurrent requests per cache. Defaults to 4.
+    registry_concurrency : dict, optional
+        Per-registry overrides of ``concurrency``, keyed by registry name.
+    max_connections : int
+        Maximum number of concurrent requests over all caches. Defaults to 16.
+    platforms : list of str, optional
+        Platforms (``os/arch`` or ``os/arch/variant``) to warm in multi-arch
+        images. Defaults to all of them.
+    endpoint : str, optional
+        URL to connect to instead of the hostname of each cache, which is then
+        only sent as Host header (e.g. ``http://127.0.0.1``).
+    insecure : bool
+        Do not verify TLS certificates. Defaults to False.
+    timeout : float
+        Socket timeout in seconds. Defaults to 300.
+    restart : bool
+        Ignore the state of a previous run. Defaults to False.
+    tier : str, optional
+        With a ``tiers`` section, the tier whose caches are warmed. Optional
+        when there is a single tier.
+
+    Returns
+    -------
+    dict
+        Per-registry statistics: 'images', 'manifests', 'blobs' (downloaded),
+        'cached' (skipped: fetched by a previous run, or already in storage
+        and redirected to), 'bytes', 'seconds' and 'errors'.
+
+    Raises
+    ------
+    WarmError
+        If some images could not be warmed. The statistics are reported first.
+    """
+    try:
+        with open(config_path, 'r', encoding='UTF-8') as file:
+            base_config = functions.load_yaml(file)
+            console.print(Text("Config loaded successfully", style="bold green"))
+    except FileNotFoundError:
+        console.print(Text(f"Error: {config_path} not found", style="bold red"))
+        raise
+
+    try:
+        base_config['registries'] = inventory.load_registries(base_config, config_path)
+        caches = resolve_caches(base_config, endpoint, tier)
+    except (KeyError, ValueError) as e:
+        console.print(Text(f"Error: cannot resolve the cache hostnames - {e}", style="bold red"))
+        raise
+
+    # Map every image to the cache serving its registry
+    targets = []
+    failures = []
+    for image in images:
+        try:
+            host, repository, reference = parse_image_reference(image)
+        except ValueError as e:
+            failures.append(str(e))
+            console.print(Text(f"Error: {e}", style="bold red"))
+            continue
+        if host not in caches:
+            failures.append(f"No cache registry for {image} ({host})")
+            console.print(Text(f"Error: no cache registry for {image} ({host})", style="bold red"))
+            continue
+        targets.append((caches[host], repository, reference, image))
+
+    done = {} if restart else load_state(state_path)
+    if done:
+        console.print(Text(
+            f"Resuming: {sum(len(digests) for digests in done.values())} blob(s) already fetched",
+            style="bold yellow"
+        ))
+
+    context = None
+    if insecure:
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    registry_concurrency = registry_concurrency or {}
+    limits = {cache['name']: registry_concurrency.get(cache['name'], concurrency) for cache, *_ in targets}
+
+    stats = {
+        name: {'images': 0, 'manifests': 0, 'blobs': 0, 'cached': 0, 'bytes': 0, 'seconds': 0.0, 'errors': 0}
+        for name in limits
+    }
+    try:
+        failures.extend(asyncio.run(_warm_all(
+            targets, limits, done, stats, platforms, max_connections, timeout, context, state_path
+        )))
+    finally:
+        save_state(state_path, done)
+
+    _print_report(stats)
+    if failures:
+        console.print(Text(f"{len(failures)} image(s) could not be warmed, run again to resume", style="bold red"))
+        raise WarmError(f"{len(failures)} image(s) could not be warmed")
+    os.remove(state_path)
+    console.print(Text("Cache warmed successfully", style="bold green"))
+    return stats
+
+
+class _ConnectionPool:
+    """Keep-alive HTTP connections to one cache, with at most `size` requests in flight."""
+
+    def __init__(self, base_url, host, size, timeout, context=None):
+        url = urlsplit(base_url)
+        self._https = url.scheme == 'https'
+        self._netloc = url.netloc
+        self._prefix = url.path.rstrip('/')
+        self._host = host
+        self._timeout = timeout
+        self._context = context
+        self._idle = []
+        self._slots = asyncio.Semaphore(size)
+
+    def _connect(self):
+        if self._https:
+            return http.client.HTTPSConnection(self._netloc, timeout=self._timeout, context=self._context)
+        return http.client.HTTPConnection(self._netloc, timeout=self._timeout)
+
+    async def get(self, path, headers=None, discard=False):
+        """
+        Send a GET request on an idle connection, or a new one.
+
+        Returns the status, the headers (lower-cased names) and the body, or
+        its size when `discard` is true.
+        """
+        headers = {'Host': self._host, **(headers or {})}
+        async with self._slots:
+            while True:
+                reused = bool(self._idle)
+                connection = self._idle.pop() if reused else self._connect()
+                try:
+                    status, response_headers, body, reusable = await asyncio.to_thread(
+                        _send_get, connection, self._prefix + path, headers, discard
+                    )
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    connection.close()
+                    # The server closed an idle keep-alive connection: retry on a new one
+                    if reused:
+                        continue
+                    raise
+                except BaseException:
+                    connection.close()
+                    raise
+                if reusable:
+                    self._idle.append(connection)
+                else:
+                    connection.close()
+                return status, response_headers, body
+
+    def close(self):
+        """Close the idle connections."""
+        while self._idle:
+            self._idle.pop().close()
+
+
+def _send_get(connection, path, headers, discard):
+    """Run one blocking GET request; called in a worker thread."""
+    connection.request('GET', path, headers=headers)
+    response = connection.getresponse()
+    if discard and response.status == 200:
+        body = 0
+        while chunk := response.read(READ_CHUNK_SIZE):
+            body += len(chunk)
+    else:
+        body = response.read()
+    response_headers = {name.lower(): value for name, value in response.getheaders()}
+    return response.status, response_headers, body, not response.will_close
+
+
+def _wanted(descriptor, platforms):
+    """Whether a manifest of an index must be warmed."""
+    annotations = descriptor.get('annotations') or {}
+    if annotations.get('vnd.docker.reference.type') == 'attestation-manifest':
+        return False
+    if not platforms:
+        return True
+    platform = descriptor.get('platform') or {}
+    os_arch = f"{platform.get('os')}/{platform.get('architecture')}"
+    full = f"{os_arch}/{platform['variant']}" if platform.get('variant') else os_arch
+    return full in platforms or os_arch in platforms
+
+
+async def _warm_all(targets, limits, done, stats, platforms, max_connections, timeout, context, state_path):
+    """Warm every target image; return the failure messages."""
+    loop = asyncio.get_running_loop()
+    # Worker threads run the blocking requests: their number bounds connections over all caches
+    executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix='warm')
+    loop.set_default_executor(executor)
+
+    pools = {}
+    for cache, *_ in targets:
+        if cache['name'] not in pools:
+            pools[cache['name']] = _ConnectionPool(
+                cache['base_url'], cache['host'], limits[cache['name']], timeout, context
+            )
+    blob_tasks = {}
+    failures = []
+    start = time.monotonic()
+    last_save = start
+
+    def checkpoint(name):
+        nonlocal last_save
+        now = time.monotonic()
+        stats[name]['seconds'] = now - start
+        if now - last_save >= STATE_SAVE_INTERVAL:
+            save_state(state_path, done)
+            last_save = now
+
+    async def fetch_manifest(cache, repository, reference):
+        status, _, body = await pools[cache['name']].get(
+            f'/v2/{repository}/manifests/{reference}', {'Accept': MANIFEST_ACCEPT}
+        )
+        if status != 200:
+            raise WarmError(f"manifest {reference} of {repository}: HTTP {status}")
+        stats[cache['name']]['manifests'] += 1
+        return json.loads(body)
+
+    async def fetch_blob(cache, repository, digest):
+        name = cache['name']
+        fetched = done.setdefault(name, set())
+        if digest in fetched:
+            stats[name]['cached'] += 1
+            return
+        status, _, body = await pools[name].get(f'/v2/{repository}/blobs/{digest}', discard=True)
+        if 300 <= status < 400:
+            # The blob is already in storage: the registry redirects clients to it
+            stats[name]['cached'] += 1
+        elif status == 200:
+            stats[name]['blobs'] += 1
+            stats[name]['bytes'] += body
+        else:
+            raise WarmError(f"blob {digest} of {repository}: HTTP {status}")
+        fetched.add(digest)
+        checkpoint(name)
+
+    async def warm_image(cache, repository, reference, image):
+        name = cache['name']
+        try:
+            manifest = await fetch_manifest(cache, repository, reference)
+            manifests = [manifest]
+            if 'manifests' in manifest:
+                children = [child for child in manifest['manifests'] if _wanted(child, platforms)]
+                manifests = await asyncio.gather(*(
+                    fetch_manifest(cache, repository, child['digest']) for child in children
+                ))
+
+            digests = []
+            for image_manifest in manifests:
+                if 'config' in image_manifest:
+                    digests.append(image_manifest['config']['digest'])
+                # Foreign layers are not served by registries
+                digests.extend(layer['digest'] for layer in image_manifest.get('layers', []) if not layer.get('urls'))
+            for digest in digests:
+                if (name, digest) not in blob_tasks:
+                    blob_tasks[name, digest] = asyncio.create_task(fetch_blob(cache, repository, digest))
+            results = await asyncio.gather(*(blob_tasks[name, digest] for digest in digests), return_exceptions=True)
+            errors = [result for result in results if isinstance(result, Exception)]
+            if errors:
+                raise errors[0]
+            stats[name]['images'] += 1
+            checkpoint(name)
+            console.print(Text(f"Warmed {image} through {name}", style="green"))
+        except (WarmError, OSError, http.client.HTTPException, ValueError, KeyError) as e:
+            stats[name]['errors'] += 1
+            failures.append(f"{image}: {e}")
+            console.print(Text(f"Error warming {image} through {name}: {e}", style="bold red"))
+
+    try:
+        await asyncio.gather(*(warm_image(*target) for target in targets))
+    finally:
+        for pool in pools.values():
+            pool.close()
+        executor.shutdown(wait=False, cancel_futures=True)
+    return failures
+
+
+def _print_report(stats):
+    """Print the per-registry throughput report."""
+    table = Table(title="Cache warm-up")
+    for column in ("Registry", "Images", "Manifests", "Blobs", "Cached", "Data", "Throughput", "Errors"):
+        table.add_column(column, justify="left" if column == "Registry" else "right")
+    for name, registry_stats in stats.items():
+        seconds = registry_stats['seconds']
+        throughput = registry_stats['bytes'] / seconds if seconds else 0
+        table.add_row(
+            name,
+            str(registry_stats['images']),
+            str(registry_stats['manifests']),
+            str(registry_stats['blobs']),
+            str(registry_stats['cached']),
+            functions.format_bytes(registry_stats['bytes']),
+            f"{functions.format_bytes(throughput)}/s",
+            str(registry_stats['errors']),
+        )
+    console.print(table)
+
@@ -0,0 +1,387 @@
+"""
+Watch mode of the configuration generator.
+
+Keeps running after a first generation: config.yaml and its ``registriesFrom``
+sources are watched (with inotify on Linux, by polling their metadata
+elsewhere), bursts of saves are debounced
+into a single run, and each run only renders the registries whose entry
+changed, from the manifest kept in memory. The Compose services to recreate
+are then handed to a reload hook, which runs ``docker compose up -d`` on them
+by default.
+
+Usage:
+    Called via the CLI: multi-registry-cache generate --watch [--config config.yaml] [--output-dir compose]
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import subprocess
+import threading
+import time
+
+import yaml
+from rich.text import Text
+
+from multi_registry_cache import functions, inventory, manifest, placement, tiers
+from multi_registry_cache import generate as generate_module
+from multi_registry_cache.functions import console
+
+DEFAULT_DEBOUNCE = 0.5
+DEFAULT_POLL_INTERVAL = 1.0
+
+# inotify(7) flags: editors either rewrite the file in place or rename a temp file over it
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT = struct.Struct('iIII')
+
+
+def _watched_entries(paths):
+    """Split paths into watched directories: the file names to watch in each, or None for a source directory."""
+    entries = {}
+    for path in paths:
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            entries[path] = None
+        else:
+            directory = os.path.dirname(path)
+            if directory not in entries or entries[directory] is not None:
+                entries.setdefault(directory, set()).add(os.path.basename(path))
+    return entries
+
+
+def _is_source_file(name):
+    """Whether a file of a source directory is read as a registry source."""
+    return name.endswith(inventory.SOURCE_EXTENSIONS) and not name.startswith('.')
+
+
+class InotifyWatcher:
+    """
+    Watch files and directories through inotify.
+
+    The parent directory of a file is watched rather than the file itself, so
+    the watch survives editors that save by renaming a new file over the old
+    one. In a watched directory, any registry source file counts.
+    """
+
+    def __init__(self, paths):
+        libc_name = ctypes.util.find_library('c')
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError("inotify is not available")
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+        try:
+            self.set_paths(paths)
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def set_paths(self, paths):
+        """Watch these files and directories instead of the current ones."""
+        for descriptor in self.watches:
+            self.libc.inotify_rm_watch(self.fd, descriptor)
+        self.watches = {}
+        for directory, names in _watched_entries([paths] if isinstance(paths, str) else paths).items():
+            descriptor = self.libc.inotify_add_watch(self.fd, directory.encode(), WATCH_MASK)
+            if descriptor < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed on {directory}")
+            self.watches[descriptor] = None if names is None else {name.encode() for name in names}
+
+    def wait(self, timeout):
+        """Wait up to `timeout` seconds; return True if a watched file changed."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        changed = False
+        try:
+            while True:
+                data = os.read(self.fd, 64 * 1024)
+                offset = 0
+                while offset < len(data):
+                    descriptor, _, _, length = _EVENT.unpack_from(data, offset)
+                    name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0')
+                    offset += _EVENT.size + length
+                    if not name or descriptor not in self.watches:
+                        # Events on the directory itself, or from a watch removed by set_paths
+                        continue
+                    names = self.watches[descriptor]
+                    changed = changed or (_is_source_file(name.decode(errors='replace')) if names is None else name in names)
+        except BlockingIOError:
+            pass
+        return changed
+
+    def close(self):
+        """Release the inotify instance."""
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Watch files and directories by comparing their metadata at a fixed interval."""
+
+    def __init__(self, paths, interval=DEFAULT_POLL_INTERVAL):
+        self.interval = interval
+        self.set_paths(paths)
+
+    def set_paths(self, paths):
+        """Watch these files and directories instead of the current ones."""
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        self.signature = self._signature()
+
+    def _signature(self):
+        signature = []
+        for path in self.paths:
+            files = inventory.source_files(path) if os.path.isdir(path) else [path]
+            for filename in files:
+                try:
+                    stat = os.stat(filename)
+                except FileNotFoundError:
+                    signature.append((filename, None))
+                    continue
+                signature.append((filename, stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        return signature
+
+    def wait(self, timeout):
+        """Wait up to `timeout` seconds; return True if a watched file changed."""
+        remaining = timeout
+        while True:
+            signature = self._signature()
+            if signature != self.signature:
+                self.signature = signature
+                return True
+            if remaining <= 0:
+                return False
+            delay = min(self.interval, remaining)
+            time.sleep(delay)
+            remaining -= delay
+
+    def close(self):
+        """Nothing to release."""
+
+
+def open_watcher(paths, poll_interval=DEFAULT_POLL_INTERVAL):
+    """
+    Watch files and directories with inotify, or by polling where inotify is not available.
+
+    Parameters
+    ----------
+    paths : str or list of str
+        The files and directories to watch.
+    poll_interval : float
+        Interval between two checks of the polling watcher, in seconds.
+
+    Returns
+    -------
+    InotifyWatcher or PollingWatcher
+        An object whose ``wait(timeout)`` returns True when a watched file
+        changed, and whose ``set_paths(paths)`` replaces the watched paths.
+    """
+    try:
+        return InotifyWatcher(paths)
+    except (OSError, AttributeError, TypeError):
+        console.print(Text("inotify is not available, polling the config files instead", style="bold yellow"))
+        return PollingWatcher(paths, poll_interval)
+
+
+def config_sources(config_path):
+    """
+    Return the ``registriesFrom`` sources of a config file.
+
+    Returns
+    -------
+    list of str
+        The source files and directories, or an empty list if the config
+        cannot be read: generate reports that error.
+    """
+    try:
+        with open(config_path, 'r', encoding='UTF-8') as file:
+            base_config = functions.load_yaml(file)
+        return inventory.source_paths(base_config, config_path) if isinstance(base_config, dict) else []
+    except (OSError, ValueError, yaml.YAMLError):
+        return []
+
+
+def inputs_hash(config_path, sources):
+    """
+    Hash the content of the config file and of its registry source files.
+
+    Returns
+    -------
+    str or None
+        The hash, or None if the config file does not exist.
+    """
+    config_hash = manifest.hash_file(config_path)
+    if config_hash is None:
+        return None
+    files = [
+        [filename, manifest.hash_file(filename)]
+        for source in sources if os.path.exists(source)
+        for filename in inventory.source_files(source)
+    ]
+    return manifest.hash_data([config_hash, files])
+
+
+def bundle_services(output_dir, services):
+    """
+    Group the services to recreate by the bundle that runs them.
+
+    Parameters
+    ----------
+    output_dir : str
+        The output directory of generate.
+    services : list of str
+        The services returned by generate: ``<service>``, or prefixed with
+        their tier (``<tier>/``), their node (``<node>/``) or ``front/`` for
+        the front Traefik of the nodes.
+
+    Returns
+    -------
+    dict
+        ``(bundle, node)`` to the Compose services to recreate in it, where
+        `bundle` is the bundle directory relative to `output_dir` (empty for
+        `output_dir` itself) and `node` the node running it, or None for a
+        bundle run from this host.
+    """
+    bundles = {}
+    for service in services:
+        *prefix, name = service.split('/')
+        path, node = [], None
+        for index, part in enumerate(prefix):
+            if index == 0 and os.path.isdir(os.path.join(output_dir, tiers.TIERS_DIR, part)):
+                path += [tiers.TIERS_DIR, part]
+            elif part == placement.FRONT_DIR and index == len(prefix) - 1:
+                path.append(part)
+            else:
+                path += [placement.NODES_DIR, part]
+                node = part
+        bundles.setdefault((os.path.join(*path) if path else '', node), []).append(name)
+    return bundles
+
+
+def compose_reload(output_dir):
+    """
+    Return the default reload hook, which recreates services with Docker Compose.
+
+    Parameters
+    ----------
+    output_dir : str
+        The output directory of generate.
+
+    Returns
+    -------
+    callable
+        A function taking the list of services to recreate, which runs
+        ``docker compose up -d <services>`` in each bundle holding some (see
+        `bundle_services`). Node bundles run on their node: the command is
+        only printed for them.
+    """
+    def reload(services):
+        for (bundle, node), names in bundle_services(output_dir, services).items():
+            command = ['docker', 'compose', 'up', '-d', *names]
+            directory = os.path.join(output_dir, bundle)
+            if node is not None:
+                console.print(Text(f"Node {node}: run {' '.join(command)} in {directory}", style="bold yellow"))
+                continue
+            console.print(Text(f"Running: {' '.join(command)} in {directory}", style="bold blue"))
+            result = subprocess.run(command, cwd=directory, check=False)
+            if result.returncode != 0:
+                console.print(Text(f"Error: docker compose exited with status {result.returncode}", style="bold red"))
+    return reload
+
+
+def dry_run_reload(services):
+    """Reload hook that only prints the command it would run."""
+    console.print(Text(f"Dry run: docker compose up -d {' '.join(services)}", style="bold blue"))
+
+
+def watch(config_path="config.yaml", output_dir="compose", force=False, jobs=1, reload=None,
+          debounce=DEFAULT_DEBOUNCE, stop=None, watcher=None):
+    """
+    Generate the configuration, then again every time config.yaml or one of its registry sources changes.
+
+    Parameters
+    ----------
+    config_path : str
+        Path to the config.yaml file. Defaults to "config.yaml".
+    output_dir : str
+        Directory where generated files are written. Defaults to "compose".
+    force : bool
+        Render every registry again on the first run. Defaults to False.
+    jobs : int
+        Number of worker threads of each run. Defaults to 1.
+    reload : callable, optional
+        Called with the sorted list of services to recreate after a run that
+        changed some; `compose_reload` by default, `dry_run_reload` to only
+        print them.
+    debounce : float
+        Quiet period, in seconds, that ends a burst of saves. Defaults to 0.5.
+    stop : threading.Event, optional
+        Watching stops once it is set. Without it, watch runs until interrupted.
+    watcher : object, optional
+        The file watcher, see `open_watcher`. Its paths are refreshed after
+        each successful run, from the ``registriesFrom`` sources of the config.
+        Closed when watching stops.
+    """
+    if reload is None:
+        reload = compose_reload(output_dir)
+    if stop is None:
+        stop = threading.Event()
+    sources = config_sources(config_path)
+    if watcher is None:
+        watcher = open_watcher([config_path, *sources])
+
+    # The manifest of the last run, and with it every rendered registry, stays in memory
+    state = {}
+    last_hash = None
+    watched = f"{config_path} and {len(sources)} registry source(s)" if sources else config_path
+    console.print(Text(f"Watching {watched} (Ctrl+C to stop)", style="bold blue"))
+    try:
+        while not stop.is_set():
+            if last_hash is not None:
+                if not watcher.wait(DEFAULT_POLL_INTERVAL):
+                    continue
+                # Wait for the end of the burst: editors often write a file several times per save
+                while watcher.wait(debounce) and not stop.is_set():
+                    pass
+                if stop.is_set():
+                    break
+
+            # The sources are read again each time: the change may add or remove one
+            config_hash = inputs_hash(config_path, config_sources(config_path))
+            if config_hash is None:
+                # Removed, or between the two steps of a save by rename: the next event brings it back
+                console.print(Text(f"{config_path} not found, waiting for it", style="bold yellow"))
+                last_hash = last_hash or ''
+                continue
+            if config_hash == last_hash:
+                continue
+            last_hash = config_hash
+
+            try:
+                recreate = generate_module.generate(
+                    config_path=config_path, output_dir=output_dir, force=force, jobs=jobs, state=state
+                )
+            except Exception as e:
+                # Keep the running services and wait for the next fix of the config
+                console.print(Text(f"Generation failed, keeping the current services: {e}", style="bold red"))
+                continue
+            finally:
+                force = False
+            # A run may add or remove registry sources, or create a source directory
+            sources = config_sources(config_path)
+            watcher.set_paths([config_path, *sources])
+            if recreate:
+                reload(recreate)
+    finally:
+        watcher.close()
@@ -0,0 +1,162 @@
+"""Tests for multi_registry_cache.access_logs module."""
+
+import gzip
+import json
+import random
+
+import pytest
+import yaml
+
+from multi_registry_cache.access_logs import (
+    OTHER,
+    LatencySketch,
+    analyze_file,
+    analyze_logs,
+    parse_line,
+    registry_for_router,
+    request_kind,
+)
+
+REGISTRIES = {"dockerhub", "ghcr", "quay"}
+
+
+def _clf(router, path, status=200, size=1234, duration=12):
+    return (
+        f'10.0.0.1 - - [18/Oct/2026:10:00:00 +0000] "GET {path} HTTP/1.1" {status} {size} "-" '
+        f'"docker/27.0" 42 "{router}" "http://{router.split("@")[0]}:5000" {duration}ms\n'
+    ).encode()
+
+
+def _json(router, path, status=200, size=1234, duration=12):
+    return (json.dumps({
+        "RouterName": router,
+        "RequestPath": path,
+        "DownstreamStatus": status,
+        "DownstreamContentSize": size,
+        "Duration": duration * 1_000_000,
+    }) + "\n").encode()
+
+
+class TestLatencySketch:
+    """Tests for LatencySketch."""
+
+    def test_quantiles_within_relative_accuracy(self):
+        values = [random.Random(42).lognormvariate(3, 1.5) for _ in range(20000)]
+        sketch = LatencySketch()
+        for value in values:
+            sketch.add(value)
+        values.sort()
+        for q in (0.5, 0.9, 0.99):
+            exact = values[int(q * (len(values) - 1))]
+            assert sketch.quantile(q) == pytest.approx(exact, rel=0.02)
+
+    def test_merge_equals_single_sketch(self):
+        whole, first, second = LatencySketch(), LatencySketch(), LatencySketch()
+        for value in range(1, 1001):
+            whole.add(value)
+            (first if value % 2 else second).add(value)
+        first.merge(second)
+        assert first.count == whole.count
+        assert first.buckets == whole.buckets
+        assert first.quantile(0.99) == whole.quantile(0.99)
+
+    def test_empty_and_zero_values(self):
+        sketch = LatencySketch()
+        assert sketch.quantile(0.5) is None
+        sketch.add(0)
+        sketch.add(0)
+        sketch.add(100)
+        assert sketch.quantile(0.5) == 0.0
+        assert sketch.quantile(1) == pytest.approx(100, rel=0.01)
+
+    def test_merge_different_accuracy(self):
+        with pytest.raises(ValueError):
+            LatencySketch(0.01).merge(LatencySketch(0.05))
+
+
+class TestParsing:
+    """Tests for parse_line, request_kind and registry_for_router."""
+
+    def test_clf_line(self):
+        assert parse_line(_clf("ghcr@file", "/v2/owner/app/manifests/1.0", 200, 512, 34)) == (
+            "ghcr@file", "/v2/owner/app/manifests/1.0", 200, 512, 34.0
+        )
+
+    def test_clf_line_without_size(self):
+        assert parse_line(_clf("ghcr@file", "/v2/", 401, "-"))[3] == 0
+
+    def test_json_line(self):
+        assert parse_line(_json("ghcr@file", "/v2/owner/app/blobs/sha256:abc", 200, 10, 7)) == (
+            "ghcr@file", "/v2/owner/app/blobs/sha256:abc", 200, 10, 7.0
+        )
+
+    @pytest.mark.parametrize("line", [b"garbage\n", b'{"RouterName": "x"}\n', b"{not json\n"])
+    def test_unparsable_lines(self, line):
+        assert parse_line(line) is None
+
+    @pytest.mark.parametrize("path, kind", [
+        ("/v2/library/nginx/manifests/latest", "manifests"),
+        ("/v2/library/nginx/tags/list?n=10", "manifests"),
+        ("/v2/library/nginx/blobs/sha256:abc", "blobs"),
+        ("/v2/library/nginx/blobs/uploads/1234", "other"),
+        ("/v2/", "other"),
+    ])
+    def test_request_kind(self, path, kind):
+        assert request_kind(path) == kind
+
+    @pytest.mark.parametrize("router, registry", [
+        ("dockerhub@file", "dockerhub"),
+        ("dockerhub-manifests@file", "dockerhub"),
+        ("quay-blobs", "quay"),
+        ("traefik-dashboard@internal", OTHER),
+        ("-", OTHER),
+    ])
+    def test_registry_for_router(self, router, registry):
+        assert registry_for_router(router, REGISTRIES) == registry
+
+
+class TestAnalyze:
+    """Tests for analyze_file and analyze_logs."""
+
+    def test_analyze_file(self, tmp_path):
+        log = tmp_path / "access.log"
+        log.write_bytes(b"".join([
+            _clf("dockerhub@file", "/v2/library/nginx/manifests/latest", duration=20),
+            _json("dockerhub-blobs@file", "/v2/library/nginx/blobs/sha256:abc", size=10_000, duration=900),
+            _clf("ghcr@file", "/v2/", status=502, size=0),
+            b"not an access log line\n",
+        ]))
+        result = analyze_file(str(log), REGISTRIES)
+        assert result["lines"] == 4
+        assert result["skipped"] == 1
+        dockerhub = result["registries"]["dockerhub"]
+        assert dockerhub["requests"] == 2
+        assert dockerhub["bytes"] == 11234
+        assert dockerhub["latency"]["manifests"].quantile(0.5) == pytest.approx(20, rel=0.01)
+        assert dockerhub["latency"]["blobs"].quantile(0.5) == pytest.approx(900, rel=0.01)
+        assert result["registries"]["ghcr"]["errors"] == 1
+
+    def test_parallel_matches_sequential(self, tmp_path, sample_config):
+        config_path = tmp_path / "config.yaml"
+        config_path.write_text(yaml.safe_dump(sample_config))
+        rng = random.Random(1)
+        paths = []
+        for index in range(3):
+            lines = [
+                _clf(f"{rng.choice(['dockerhub', 'ghcr', 'quay'])}@file",
+                     rng.choice(["/v2/a/manifests/1", "/v2/a/blobs/sha256:b"]),
+                     size=rng.randint(0, 10**6), duration=rng.randint(1, 5000))
+                for _ in range(500)
+            ]
+            path = tmp_path / (f"access.log.{index}.gz" if index else "access.log")
+            with (gzip.open if index else open)(path, "wb") as file:
+                file.write(b"".join(lines))
+            paths.append(str(path))
+
+        sequential = analyze_logs(str(config_path), paths, jobs=1)
+        parallel = analyze_logs(str(config_path), paths, jobs=3)
+        assert sequential["lines"] == parallel["lines"] == 1500
+        assert sequential["registries"].keys() == parallel["registries"].keys()
+        for name, stats in sequential["registries"].items():
+            assert parallel["registries"][name]["bytes"] == stats["bytes"]
+            assert parallel["registries"][name]["latency"]["blobs"].buckets == stats["latency"]["blobs"].buckets
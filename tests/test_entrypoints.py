@@ -0,0 +1,85 @@
+"""Tests for multi_registry_cache.entrypoints module."""
+
+import pytest
+
+from multi_registry_cache.entrypoints import apply_tls, enable_http3, validate_http3, validate_tls
+
+
+def _traefik_config():
+    return {
+        "entryPoints": {"web": {"address": ":80"}, "websecure": {"address": ":443"}},
+        "certificatesResolvers": {"le": {"acme": {"email": "me@example.net"}}},
+    }
+
+
+class TestHttp3:
+    """Tests for validate_http3 and enable_http3."""
+
+    @pytest.mark.parametrize("settings, entry_point", [
+        (True, "websecure"),
+        (False, None),
+        ({}, "websecure"),
+        ({"entryPoint": "https"}, "https"),
+    ])
+    def test_validate(self, settings, entry_point):
+        assert validate_http3(settings) == entry_point
+
+    @pytest.mark.parametrize("settings", ["yes", {"port": 443}, {"entryPoint": ""}])
+    def test_validate_invalid(self, settings):
+        with pytest.raises(ValueError):
+            validate_http3(settings)
+
+    def test_udp_port_is_published(self):
+        traefik_config = _traefik_config()
+        service = {"image": "traefik:v2.10", "ports": ["80:80", "443:443"]}
+        enable_http3(traefik_config, service, "websecure")
+        assert service["ports"] == ["80:80", "443:443", "443:443/udp"]
+        assert traefik_config["entryPoints"]["websecure"] == {"address": ":443", "http3": {}}
+        assert traefik_config["experimental"] == {"http3": True}
+
+    def test_other_host_port_is_advertised(self):
+        traefik_config = _traefik_config()
+        service = {"image": "traefik:v3.1", "ports": ["0.0.0.0:8443:443"]}
+        enable_http3(traefik_config, service, "websecure")
+        assert service["ports"][-1] == "0.0.0.0:8443:443/udp"
+        assert traefik_config["entryPoints"]["websecure"]["http3"] == {"advertisedPort": 8443}
+        assert "experimental" not in traefik_config
+
+    def test_existing_udp_mapping_is_kept(self):
+        service = {"ports": ["443:443", {"target": 443, "published": 443, "protocol": "udp"}]}
+        enable_http3(_traefik_config(), service, "websecure")
+        assert len(service["ports"]) == 2
+
+    def test_unknown_entry_point(self):
+        with pytest.raises(ValueError, match="https"):
+            enable_http3(_traefik_config(), None, "https")
+
+
+class TestTls:
+    """Tests for validate_tls and apply_tls."""
+
+    def test_apply(self):
+        traefik_config = _traefik_config()
+        traefik_config["tls"] = {"options": {"default": {"sniStrict": True}}}
+        settings = validate_tls({"minVersion": "VersionTLS12", "curvePreferences": ["X25519", "CurveP256"], "keyType": "EC256"})
+        assert apply_tls(traefik_config, settings) == ["le"]
+        assert traefik_config["tls"]["options"]["default"] == {
+            "sniStrict": True, "minVersion": "VersionTLS12", "curvePreferences": ["X25519", "CurveP256"],
+        }
+        assert traefik_config["certificatesResolvers"]["le"]["acme"] == {"email": "me@example.net", "keyType": "EC256"}
+
+    def test_key_type_without_resolver(self):
+        assert apply_tls({"entryPoints": {}}, {"keyType": "EC256"}) == []
+
+    @pytest.mark.parametrize("settings", [
+        {"minVersion": "TLS1.2"},
+        {"curvePreferences": "X25519"},
+        {"curvePreferences": []},
+        {"curvePreferences": ["X448"]},
+        {"keyType": "EC512"},
+        {"cipherSuites": []},
+        ["VersionTLS12"],
+    ])
+    def test_invalid(self, settings):
+        with pytest.raises(ValueError):
+            validate_tls(settings)
@@ -4,13 +4,25 @@ import copy
 import os
 
 import pytest
+import yaml
 
+from multi_registry_cache import functions
 from multi_registry_cache.functions import (
+    compile_template,
     create_docker_service,
+    create_endpoint_routers,
     create_registry_config,
     create_traefik_router,
+    create_traefik_servers_transport,
     create_traefik_service,
+    deep_merge,
+    dump_yaml,
     interpolate_strings,
+    load_yaml,
+    replica_names,
+    resolve_storage_redirect,
+    stream_yaml,
+    validate_endpoint_routers,
     write_http_secret,
     write_to_file,
     write_yaml_file,
@@ -49,6 +61,45 @@ class TestInterpolateStrings:
         assert result == "host:8080"
 
 
+class TestCompileTemplate:
+    """Tests for compile_template and CompiledTemplate."""
+
+    def test_matches_interpolate_strings(self, sample_config):
+        template = sample_config["registry"]["baseConfig"]
+        variables = {"name": "docker", "url": "https://example.com"}
+        compiled = compile_template(template)
+        assert compiled.render(variables) == interpolate_strings(template, variables)
+
+    def test_static_subtrees_are_shared(self):
+        template = {"host": "{name}.example.com", "headers": {"X-Static": ["nosniff"]}}
+        compiled = compile_template(template)
+        first = compiled.render({"name": "a"})
+        second = compiled.render({"name": "b"})
+        assert first["host"] == "a.example.com"
+        assert second["host"] == "b.example.com"
+        assert first["headers"] is template["headers"]
+        assert second["headers"] is template["headers"]
+
+    def test_static_template(self):
+        template = {"port": 5000, "names": ["a", "b"]}
+        compiled = compile_template(template)
+        assert compiled.is_static
+        assert compiled.render({"name": "x"}) is template
+
+    def test_escaped_braces(self):
+        compiled = compile_template({"literal": "{{name}}", "value": "{name}"})
+        assert compiled.render({"name": "x"}) == {"literal": "{name}", "value": "x"}
+
+    def test_missing_variable_raises(self):
+        compiled = compile_template(["{missing}"])
+        with pytest.raises(KeyError):
+            compiled.render({"name": "x"})
+
+    def test_compile_is_idempotent(self):
+        compiled = compile_template({"a": "{name}"})
+        assert compile_template(compiled) is compiled
+
+
 class TestCreateRegistryConfig:
     """Tests for create_registry_config."""
 
@@ -77,6 +128,17 @@ class TestCreateRegistryConfig:
         assert result["proxy"]["remoteurl"] == "https://example.com"
         assert "username" not in result["proxy"]
 
+    def test_compiled_template_is_not_mutated(self, base_registry_config, cache_registry, private_registry):
+        template = compile_template(base_registry_config)
+        snapshot = copy.deepcopy(base_registry_config)
+        cache = create_registry_config(template, cache_registry, 0)
+        private = create_registry_config(template, private_registry, 1)
+        assert base_registry_config == snapshot
+        assert cache["redis"]["db"] == 0
+        assert private["redis"]["db"] == 1
+        assert "proxy" not in private
+        assert cache["proxy"]["remoteurl"] == "https://registry-1.docker.io"
+
     def test_interpolation_happens(self, base_registry_config, cache_registry):
         result = create_registry_config(base_registry_config, cache_registry, 0)
         # The registry name should be interpolated in any {name} placeholders
@@ -84,6 +146,59 @@ class TestCreateRegistryConfig:
             assert "{name}" not in value
 
 
+class TestStorageRedirect:
+    """Tests for resolve_storage_redirect and storage redirects in create_registry_config."""
+
+    CLOUDFRONT = {
+        "name": "cloudfront",
+        "options": {"baseurl": "https://cdn.example.net/{name}/", "privatekey": "/pk.pem", "keypairid": "KEY"},
+    }
+
+    def test_shorthand_and_override(self):
+        assert resolve_storage_redirect(None) is None
+        assert resolve_storage_redirect(True) == {"enabled": True, "cdn": None}
+        assert resolve_storage_redirect({"cdn": self.CLOUDFRONT}, False) == {"enabled": False, "cdn": None}
+        resolved = resolve_storage_redirect({"enabled": False}, {"enabled": True, "cdn": self.CLOUDFRONT})
+        assert resolved == {"enabled": True, "cdn": self.CLOUDFRONT}
+
+    @pytest.mark.parametrize("settings", [
+        "yes",
+        {"enabled": "yes"},
+        {"cdn": {"name": "akamai"}},
+        {"cdn": {"name": "redirect", "options": {}}},
+        {"cdn": {"name": "cloudfront", "options": {"baseurl": "https://cdn.example.net/"}}},
+        {"disable": True},
+    ])
+    def test_invalid(self, settings):
+        with pytest.raises(ValueError):
+            resolve_storage_redirect(settings)
+
+    def test_cdn_middleware(self, base_registry_config, cache_registry):
+        template = compile_template(base_registry_config)
+        snapshot = copy.deepcopy(base_registry_config)
+        result = create_registry_config(template, cache_registry, 0, storage_redirect=resolve_storage_redirect(
+            {"cdn": self.CLOUDFRONT}
+        ))
+        assert base_registry_config == snapshot
+        assert result["storage"]["redirect"] == {"disable": False}
+        assert result["storage"]["cache"] == base_registry_config["storage"]["cache"]
+        assert result["middleware"]["storage"] == [{
+            "name": "cloudfront",
+            "options": {"baseurl": "https://cdn.example.net/dockerhub/", "privatekey": "/pk.pem", "keypairid": "KEY"},
+        }]
+
+    def test_disabled_redirect_has_no_middleware(self, base_registry_config, cache_registry):
+        result = create_registry_config(base_registry_config, cache_registry, 0, storage_redirect=resolve_storage_redirect(
+            {"enabled": False, "cdn": self.CLOUDFRONT}
+        ))
+        assert result["storage"]["redirect"] == {"disable": True}
+        assert "middleware" not in result
+
+    def test_no_settings_leaves_config_unchanged(self, base_registry_config, cache_registry):
+        result = create_registry_config(base_registry_config, cache_registry, 0)
+        assert "redirect" not in result["storage"]
+
+
 class TestCreateDockerService:
     """Tests for create_docker_service."""
 
@@ -118,14 +233,182 @@ class TestCreateTraefikService:
         custom = {"loadBalancer": {"servers": [{"url": "http://{name}:5000"}]}}
         result = create_traefik_service(registry, custom)
         assert result["loadBalancer"]["servers"][0]["url"] == "http://quay:5000"
+        assert "healthCheck" not in result["loadBalancer"]
+
+    def test_service_with_replicas(self):
+        registry = {"name": "quay"}
+        custom = compile_template({"loadBalancer": {"servers": [{"url": "http://{name}:5000"}]}})
+        result = create_traefik_service(registry, custom, ["quay-1", "quay-2"])
+        assert result["loadBalancer"]["servers"] == [
+            {"url": "http://quay-1:5000"},
+            {"url": "http://quay-2:5000"},
+        ]
+        assert result["loadBalancer"]["healthCheck"]["path"] == "/v2/"
+        assert "sticky" not in result["loadBalancer"]
+
+    def test_template_health_check_is_kept(self):
+        custom = {"loadBalancer": {"servers": [{"url": "http://{name}:5000"}], "healthCheck": {"path": "/"}}}
+        result = create_traefik_service({"name": "quay"}, custom, ["quay-1", "quay-2"])
+        assert result["loadBalancer"]["healthCheck"] == {"path": "/"}
+
+    def test_servers_transport_is_referenced(self):
+        custom = compile_template({"loadBalancer": {"servers": [{"url": "http://{name}:5000"}]}})
+        result = create_traefik_service({"name": "quay"}, custom, servers_transport="quay")
+        assert result["loadBalancer"]["serversTransport"] == "quay"
+        assert "serversTransport" not in custom.source["loadBalancer"]
+
+
+class TestCreateTraefikServersTransport:
+    """Tests for create_traefik_servers_transport and deep_merge."""
+
+    TEMPLATE = {
+        "maxIdleConnsPerHost": 256,
+        "forwardingTimeouts": {"dialTimeout": "10s", "idleConnTimeout": "90s"},
+        "disableHTTP2": True,
+    }
+
+    def test_template_is_rendered(self):
+        result = create_traefik_servers_transport({"name": "quay"}, compile_template({"serverName": "{name}.local"}))
+        assert result == {"serverName": "quay.local"}
+
+    def test_override_is_deep_merged(self):
+        template = compile_template(self.TEMPLATE)
+        override = {"maxIdleConnsPerHost": 32, "forwardingTimeouts": {"dialTimeout": "3s"}}
+        result = create_traefik_servers_transport({"name": "quay"}, template, override)
+        assert result == {
+            "maxIdleConnsPerHost": 32,
+            "forwardingTimeouts": {"dialTimeout": "3s", "idleConnTimeout": "90s"},
+            "disableHTTP2": True,
+        }
+        assert self.TEMPLATE["forwardingTimeouts"]["dialTimeout"] == "10s"
+
+    def test_override_without_template(self):
+        result = create_traefik_servers_transport({"name": "quay"}, None, {"disableHTTP2": False})
+        assert result == {"disableHTTP2": False}
+
+    @pytest.mark.parametrize("override", [
+        {"maxIdleConnsPerHost": -1},
+        {"maxIdleConnsPerHost": "many"},
+        {"disableHTTP2": "yes"},
+        {"forwardingTimeouts": "10s"},
+    ])
+    def test_invalid_settings(self, override):
+        with pytest.raises(ValueError):
+            create_traefik_servers_transport({"name": "quay"}, self.TEMPLATE, override)
+
+    def test_deep_merge_does_not_mutate(self):
+        base = {"a": {"b": 1, "c": 2}, "d": [1]}
+        merged = deep_merge(base, {"a": {"b": 3}, "d": [2]})
+        assert merged == {"a": {"b": 3, "c": 2}, "d": [2]}
+        assert base == {"a": {"b": 1, "c": 2}, "d": [1]}
+
+
+class TestEndpointRouters:
+    """Tests for validate_endpoint_routers and create_endpoint_routers."""
+
+    ROUTER = {"rule": "Host(`quay.example.com`)", "service": "quay", "middlewares": ["auth", "gzip@file", "buffer"]}
+    SERVICE = {"loadBalancer": {"servers": [{"url": "http://quay:5000"}], "serversTransport": "quay"}}
+    MIDDLEWARES = {"auth": {"basicAuth": {}}, "gzip": {"compress": {}}, "buffer": {"buffering": {}}}
+
+    def test_manifests_router_compresses(self):
+        endpoints = validate_endpoint_routers({"manifests": {"compress": True}})
+        result = create_endpoint_routers("quay", self.ROUTER, self.SERVICE, endpoints)
+        router = result["routers"]["quay-manifests"]
+        assert router["rule"].startswith("(Host(`quay.example.com`)) && (Path(`/v2/{repository:.+}/manifests/")
+        assert router["middlewares"] == ["auth", "gzip@file", "buffer", "quay-compress"]
+        assert router["service"] == "quay"
+        assert result["middlewares"] == {"quay-compress": {"compress": {}}}
+        assert "services" not in result
+
+    def test_blobs_router_drops_compress_and_buffering(self):
+        endpoints = validate_endpoint_routers({"blobs": None})
+        result = create_endpoint_routers("quay", self.ROUTER, self.SERVICE, endpoints, base_middlewares=self.MIDDLEWARES)
+        router = result["routers"]["quay-blobs"]
+        assert router["middlewares"] == ["auth"]
+        assert "blobs/" in router["rule"]
+        assert self.ROUTER["middlewares"] == ["auth", "gzip@file", "buffer"]
+
+    def test_timeouts_get_a_dedicated_service(self):
+        endpoints = validate_endpoint_routers({"manifests": {"forwardingTimeouts": {"responseHeaderTimeout": "30s"}}})
+        transport = {"maxIdleConnsPerHost": 256, "forwardingTimeouts": {"dialTimeout": "10s"}}
+        result = create_endpoint_routers("quay", {**self.ROUTER, "priority": 10}, self.SERVICE, endpoints, transport)
+        assert result["routers"]["quay-manifests"]["service"] == "quay-manifests"
+        assert result["routers"]["quay-manifests"]["priority"] == 11
+        assert result["services"]["quay-manifests"]["loadBalancer"]["serversTransport"] == "quay-manifests"
+        assert result["serversTransports"]["quay-manifests"] == {
+            "maxIdleConnsPerHost": 256,
+            "forwardingTimeouts": {"dialTimeout": "10s", "responseHeaderTimeout": "30s"},
+        }
+        assert self.SERVICE["loadBalancer"]["serversTransport"] == "quay"
+
+    @pytest.mark.parametrize("settings", [
+        {"tags": {}},
+        {"manifests": {"buffering": True}},
+        {"manifests": {"compress": "yes"}},
+        {"blobs": {"compress": True}},
+        {"blobs": {"forwardingTimeouts": "30s"}},
+        ["manifests"],
+    ])
+    def test_invalid_settings(self, settings):
+        with pytest.raises(ValueError):
+            validate_endpoint_routers(settings)
+
+
+class TestReplicaNames:
+    """Tests for replica_names."""
+
+    def test_single_replica_keeps_name(self):
+        assert replica_names({"name": "docker"}) == ["docker"]
+        assert replica_names({"name": "docker", "replicas": 1}) == ["docker"]
+
+    def test_several_replicas(self):
+        assert replica_names({"name": "docker", "replicas": 3}) == ["docker-1", "docker-2", "docker-3"]
+
+
+class TestStreamYaml:
+    """Tests for stream_yaml and the libyaml-backed helpers."""
+
+    def test_matches_yaml_dump(self, tmp_path, sample_config):
+        filepath = tmp_path / "stream.yaml"
+        with open(filepath, "w", encoding="UTF-8") as f:
+            stream_yaml(sample_config, f)
+        assert filepath.read_text() == yaml.dump(sample_config)
+
+    def test_pure_python_fallback(self, tmp_path, sample_config, monkeypatch):
+        class PurePythonDumper(yaml.Dumper):
+            def ignore_aliases(self, data):
+                return True
+
+        monkeypatch.setattr(functions, "_NoAliasDumper", PurePythonDumper)
+        filepath = tmp_path / "stream.yaml"
+        with open(filepath, "w", encoding="UTF-8") as f:
+            stream_yaml(sample_config, f)
+        assert filepath.read_text() == yaml.dump(sample_config)
+
+    def test_deep_and_odd_values(self, tmp_path):
+        data = {
+            "services": {"b": {"empty": {}, "list": []}, "a": {"n": None, "t": True, "s": "01"}},
+            "http": {"routers": {"r": {"rule": "Host(`x`)", "nested": {"deep": [{"k": 1.5}]}}}},
+            1: "int key",
+        }
+        filepath = tmp_path / "stream.yaml"
+        with open(filepath, "w", encoding="UTF-8") as f:
+            stream_yaml(data, f)
+        assert filepath.read_text() == yaml.dump(data)
+
+    def test_shared_subtrees_have_no_anchors(self):
+        shared = ["registries"]
+        text = dump_yaml({"a": {"networks": shared}, "b": {"networks": shared}})
+        assert "&" not in text and "*" not in text
+
+    def test_load_yaml(self):
+        assert load_yaml("a: [1, 2]") == {"a": [1, 2]}
 
 
 class TestWriteYamlFile:
     """Tests for write_yaml_file."""
 
     def test_writes_valid_yaml(self, tmp_path):
-        import yaml
-
         data = {"key": "value", "list": [1, 2, 3]}
         filepath = str(tmp_path / "test.yaml")
         write_yaml_file(filepath, data)
@@ -134,6 +417,26 @@ class TestWriteYamlFile:
             loaded = yaml.safe_load(f)
         assert loaded == data
 
+    def test_identical_content_is_not_rewritten(self, tmp_path):
+        filepath = tmp_path / "test.yaml"
+        assert write_yaml_file(str(filepath), {"key": "value"}) is True
+        mtime = filepath.stat().st_mtime_ns
+
+        assert write_yaml_file(str(filepath), {"key": "value"}) is False
+        assert filepath.stat().st_mtime_ns == mtime
+        assert [entry.name for entry in tmp_path.iterdir()] == ["test.yaml"]
+
+    def test_rewrite_keeps_the_inode(self, tmp_path):
+        # A bind-mounted single file only sees writes to the same inode
+        filepath = tmp_path / "traefik.yaml"
+        write_yaml_file(str(filepath), {"http": {"routers": {}}})
+        inode = filepath.stat().st_ino
+
+        assert write_yaml_file(str(filepath), {"http": {"routers": {"ghcr": {"service": "ghcr"}}}}) is True
+        assert filepath.stat().st_ino == inode
+        assert yaml.safe_load(filepath.read_text()) == {"http": {"routers": {"ghcr": {"service": "ghcr"}}}}
+        assert [entry.name for entry in tmp_path.iterdir()] == ["traefik.yaml"]
+
 
 class TestWriteToFile:
     """Tests for write_to_file."""
@@ -145,6 +448,16 @@ class TestWriteToFile:
         with open(filepath) as f:
             assert f.read() == "databases 5"
 
+    def test_identical_content_is_not_rewritten(self, tmp_path):
+        filepath = tmp_path / "test.txt"
+        assert write_to_file(str(filepath), "databases 5") is True
+        mtime = filepath.stat().st_mtime_ns
+
+        assert write_to_file(str(filepath), "databases 5") is False
+        assert filepath.stat().st_mtime_ns == mtime
+        assert write_to_file(str(filepath), "databases 6") is True
+        assert filepath.read_text() == "databases 6"
+
 
 class TestWriteHttpSecret:
     """Tests for write_http_secret."""
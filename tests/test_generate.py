@@ -1,5 +1,6 @@
 """Integration tests for the generate command."""
 
+import json
 import os
 import shutil
 
@@ -7,6 +8,14 @@ import yaml
 import pytest
 
 from multi_registry_cache.generate import generate
+from multi_registry_cache.redis_topology import AllocationChangedError
+
+# The recommended traefik.transport, commented out in the sample
+TRANSPORT = {
+    "maxIdleConnsPerHost": 256,
+    "forwardingTimeouts": {"dialTimeout": "10s", "responseHeaderTimeout": "0s", "idleConnTimeout": "90s"},
+    "disableHTTP2": True,
+}
 
 
 class TestGenerate:
@@ -116,6 +125,759 @@ class TestGenerate:
             generate(config_path=str(tmp_path / "nonexistent.yaml"), output_dir=str(tmp_path))
 
 
+class TestIncrementalGenerate:
+    """Tests for the manifest-based incremental generation."""
+
+    def test_first_run_recreates_everything(self, tmp_path):
+        output_dir = str(tmp_path / "compose")
+        recreate = generate(config_path="config.sample.yaml", output_dir=output_dir)
+        assert recreate == ["dockerhub", "ghcr", "nvcr", "private", "quay", "redis", "traefik"]
+        assert os.path.exists(os.path.join(output_dir, ".manifest.json"))
+
+    def test_second_run_writes_nothing(self, tmp_path):
+        output_dir = str(tmp_path / "compose")
+        generate(config_path="config.sample.yaml", output_dir=output_dir)
+        mtimes = _mtimes(output_dir)
+
+        recreate = generate(config_path="config.sample.yaml", output_dir=output_dir)
+        assert recreate == []
+        assert _mtimes(output_dir) == mtimes
+
+    def test_changed_registry_only(self, tmp_path, sample_config):
+        output_dir = str(tmp_path / "compose")
+        config_path = _write_config(tmp_path, sample_config)
+        generate(config_path=config_path, output_dir=output_dir)
+        mtimes = _mtimes(output_dir)
+
+        sample_config["registries"][1]["ttl"] = "24h"
+        _write_config(tmp_path, sample_config)
+        recreate = generate(config_path=config_path, output_dir=output_dir)
+
+        assert recreate == ["ghcr"]
+        changed = {name for name, mtime in _mtimes(output_dir).items() if mtimes.get(name) != mtime}
+        assert changed == {"ghcr.yaml", ".manifest.json"}
+        with open(os.path.join(output_dir, "ghcr.yaml")) as f:
+            assert yaml.safe_load(f)["proxy"]["ttl"] == "24h"
+
+    def test_template_change_rerenders_all(self, tmp_path, sample_config):
+        output_dir = str(tmp_path / "compose")
+        config_path = _write_config(tmp_path, sample_config)
+        generate(config_path=config_path, output_dir=output_dir)
+
+        sample_config["registry"]["baseConfig"]["log"]["level"] = "info"
+        _write_config(tmp_path, sample_config)
+        recreate = generate(config_path=config_path, output_dir=output_dir)
+        assert recreate == ["dockerhub", "ghcr", "nvcr", "private", "quay"]
+
+    def test_tampered_output_is_rewritten(self, tmp_path):
+        output_dir = str(tmp_path / "compose")
+        generate(config_path="config.sample.yaml", output_dir=output_dir)
+        (tmp_path / "compose" / "quay.yaml").write_text("tampered")
+
+        recreate = generate(config_path="config.sample.yaml", output_dir=output_dir)
+        assert recreate == ["quay"]
+        with open(os.path.join(output_dir, "quay.yaml")) as f:
+            assert yaml.safe_load(f)["proxy"]["remoteurl"] == "https://quay.io"
+
+    def test_force_rerenders_but_keeps_identical_files(self, tmp_path):
+        output_dir = str(tmp_path / "compose")
+        generate(config_path="config.sample.yaml", output_dir=output_dir)
+        mtimes = _mtimes(output_dir)
+
+        generate(config_path="config.sample.yaml", output_dir=output_dir, force=True)
+        assert _mtimes(output_dir) == mtimes
+
+
+class TestParallelGenerate:
+    """Tests for generate with several worker threads."""
+
+    def test_parallel_output_matches_sequential(self, tmp_path):
+        sequential_dir = tmp_path / "sequential"
+        parallel_dir = tmp_path / "parallel"
+        generate(config_path="config.sample.yaml", output_dir=str(sequential_dir))
+        recreate = generate(config_path="config.sample.yaml", output_dir=str(parallel_dir), jobs=4)
+
+        assert recreate == ["dockerhub", "ghcr", "nvcr", "private", "quay", "redis", "traefik"]
+        for filename in ["compose.yaml", "traefik.yaml", "redis.conf", "dockerhub.yaml", "private.yaml", ".manifest.json"]:
+            assert (sequential_dir / filename).read_text() == (parallel_dir / filename).read_text()
+
+    def test_redis_db_follows_config_order(self, tmp_path):
+        output_dir = str(tmp_path / "compose")
+        generate(config_path="config.sample.yaml", output_dir=output_dir, jobs=4)
+        for db, name in enumerate(["dockerhub", "ghcr", "nvcr", "quay", "private"]):
+            with open(os.path.join(output_dir, f"{name}.yaml")) as f:
+                assert yaml.safe_load(f)["redis"]["db"] == db
+
+    def test_first_failing_registry_is_reported(self, tmp_path, sample_config):
+        sample_config["docker"]["perRegistry"]["compose"]["hostname"] = "{region}-{zone}"
+        for registry in sample_config["registries"]:
+            registry.update(region="eu", zone="a")
+        del sample_config["registries"][1]["region"]
+        del sample_config["registries"][3]["zone"]
+        config_path = _write_config(tmp_path, sample_config)
+
+        with pytest.raises(KeyError, match="region"):
+            generate(config_path=config_path, output_dir=str(tmp_path / "compose"), jobs=4)
+
+
+class TestRedisShards:
+    """Tests for generate with redis.shards."""
+
+    def test_shards_generate_services_and_confs(self, tmp_path, sample_config):
+        sample_config["redis"] = {"shards": 3}
+        config_path = _write_config(tmp_path, sample_config)
+        output_dir = tmp_path / "compose"
+        generate(config_path=config_path, output_dir=str(output_dir))
+
+        compose = yaml.safe_load((output_dir / "compose.yaml").read_text())
+        used = {}
+        for name in ["dockerhub", "ghcr", "nvcr", "quay", "private"]:
+            redis_config = yaml.safe_load((output_dir / f"{name}.yaml").read_text())["redis"]
+            shard, port = redis_config["addr"].split(":")
+            assert port == "6379"
+            used.setdefault(shard, []).append(redis_config["db"])
+        for shard in ["redis", "redis-1", "redis-2"]:
+            assert shard in compose["services"]
+            assert f"./{shard}.conf:/usr/local/etc/redis/redis.conf:ro" in compose["services"][shard]["volumes"]
+            count = len(used.get(shard, []))
+            assert (output_dir / f"{shard}.conf").read_text() == f"databases {max(count, 1)}"
+            assert sorted(used.get(shard, [])) == list(range(count))
+
+    def test_adding_shards_keeps_the_registries_on_redis(self, tmp_path, sample_config):
+        config_path = _write_config(tmp_path, sample_config)
+        output_dir = tmp_path / "compose"
+        generate(config_path=config_path, output_dir=str(output_dir))
+        before = json.loads((output_dir / "redis-allocation.json").read_text())["registries"]
+
+        sample_config["redis"] = {"shards": 2}
+        generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir))
+        after = json.loads((output_dir / "redis-allocation.json").read_text())["registries"]
+        assert after == before
+        assert all(entry["shard"] == "redis" for entry in after.values())
+
+    def test_tuning_sizes_each_shard(self, tmp_path, sample_config):
+        sample_config["redis"] = {"shards": 2, "tuning": {"descriptorMemory": "1mb", "baseMemory": "1mb"}}
+        config_path = _write_config(tmp_path, sample_config)
+        output_dir = tmp_path / "compose"
+        generate(config_path=config_path, output_dir=str(output_dir))
+
+        allocation = json.loads((output_dir / "redis-allocation.json").read_text())["registries"]
+        for shard in ["redis", "redis-1"]:
+            registries = sum(1 for entry in allocation.values() if entry["shard"] == shard)
+            conf = (output_dir / f"{shard}.conf").read_text().splitlines()
+            assert f"maxmemory {registries + 1}mb" in conf
+
+    def test_invalid_tuning(self, tmp_path, sample_config):
+        sample_config["redis"] = {"tuning": {"maxmemoryPolicy": "noeviction"}}
+        config_path = _write_config(tmp_path, sample_config)
+        with pytest.raises(ValueError):
+            generate(config_path=config_path, output_dir=str(tmp_path / "compose"))
+
+    def test_invalid_shards(self, tmp_path, sample_config):
+        sample_config["redis"] = {"shards": 0}
+        config_path = _write_config(tmp_path, sample_config)
+        with pytest.raises(ValueError):
+            generate(config_path=config_path, output_dir=str(tmp_path / "compose"))
+
+    def test_client_pool_settings(self, tmp_path, sample_config):
+        sample_config["redis"] = {"client": {"pool": {"maxidle": 16, "maxactive": 64}, "dialtimeout": "100ms"}}
+        output_dir = tmp_path / "compose"
+        generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir))
+        redis_config = yaml.safe_load((output_dir / "ghcr.yaml").read_text())["redis"]
+        assert redis_config["addr"] == "redis:6379"
+        assert redis_config["pool"] == {"maxidle": 16, "maxactive": 64}
+        assert redis_config["dialtimeout"] == "100ms"
+        assert isinstance(redis_config["db"], int)
+
+    def test_invalid_client(self, tmp_path, sample_config):
+        sample_config["redis"] = {"client": {"pool": {"maxidle": "many"}}}
+        with pytest.raises(ValueError):
+            generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(tmp_path / "compose"))
+
+
+class TestStableRedisAllocation:
+    """Tests for the persisted Redis database assignment."""
+
+    def test_inserted_registry_does_not_renumber(self, tmp_path, sample_config):
+        output_dir = tmp_path / "compose"
+        config_path = _write_config(tmp_path, sample_config)
+        generate(config_path=config_path, output_dir=str(output_dir))
+
+        sample_config["registries"].insert(0, {"name": "gcr", "type": "cache", "url": "https://gcr.io"})
+        _write_config(tmp_path, sample_config)
+        recreate = generate(config_path=config_path, output_dir=str(output_dir))
+
+        assert recreate == ["gcr", "redis"]
+        for db, name in enumerate(["dockerhub", "ghcr", "nvcr", "quay", "private", "gcr"]):
+            assert yaml.safe_load((output_dir / f"{name}.yaml").read_text())["redis"]["db"] == db
+        assert (output_dir / "redis.conf").read_text() == "databases 6"
+
+    def test_check_passes_when_assignments_are_kept(self, tmp_path, sample_config):
+        output_dir = tmp_path / "compose"
+        config_path = _write_config(tmp_path, sample_config)
+        generate(config_path=config_path, output_dir=str(output_dir))
+        mtimes = _mtimes(str(output_dir))
+
+        sample_config["registries"].pop(2)
+        _write_config(tmp_path, sample_config)
+        assert generate(config_path=config_path, output_dir=str(output_dir), check=True) == []
+        assert _mtimes(str(output_dir)) == mtimes
+
+    def test_check_fails_when_assignments_change(self, tmp_path, sample_config):
+        output_dir = tmp_path / "compose"
+        sample_config["redis"] = {"shards": 3}
+        config_path = _write_config(tmp_path, sample_config)
+        generate(config_path=config_path, output_dir=str(output_dir))
+
+        # The registries of redis-2 move to redis
+        sample_config["redis"] = {"shards": 1}
+        _write_config(tmp_path, sample_config)
+        with pytest.raises(AllocationChangedError):
+            generate(config_path=config_path, output_dir=str(output_dir), check=True)
+
+
+class TestReplicas:
+    """Tests for registries with several replicas."""
+
+    def test_replicas_share_config_and_are_load_balanced(self, tmp_path, sample_config):
+        sample_config["registries"][0]["replicas"] = 3
+        config_path = _write_config(tmp_path, sample_config)
+        output_dir = tmp_path / "compose"
+        recreate = generate(config_path=config_path, output_dir=str(output_dir))
+
+        compose = yaml.safe_load((output_dir / "compose.yaml").read_text())
+        traefik = yaml.safe_load((output_dir / "traefik.yaml").read_text())
+        assert "dockerhub" not in compose["services"]
+        for replica in ["dockerhub-1", "dockerhub-2", "dockerhub-3"]:
+            assert replica in recreate
+            assert "./dockerhub.yaml:/etc/docker/registry/config.yml:ro" in compose["services"][replica]["volumes"]
+        load_balancer = traefik["http"]["services"]["dockerhub"]["loadBalancer"]
+        assert [server["url"] for server in load_balancer["servers"]] == [
+            "http://dockerhub-1:5000",
+            "http://dockerhub-2:5000",
+            "http://dockerhub-3:5000",
+        ]
+        assert "healthCheck" in load_balancer
+        assert traefik["http"]["routers"]["dockerhub"]["service"] == "dockerhub"
+
+    def test_invalid_replicas(self, tmp_path, sample_config):
+        sample_config["registries"][0]["replicas"] = 0
+        config_path = _write_config(tmp_path, sample_config)
+        with pytest.raises(ValueError):
+            generate(config_path=config_path, output_dir=str(tmp_path / "compose"))
+
+
+class TestServersTransport:
+    """Tests for the per-registry Traefik serversTransport."""
+
+    def test_each_registry_gets_its_transport(self, tmp_path, sample_config):
+        sample_config["traefik"]["transport"] = TRANSPORT
+        sample_config["registries"][1]["transport"] = {"maxIdleConnsPerHost": 32}
+        config_path = _write_config(tmp_path, sample_config)
+        output_dir = tmp_path / "compose"
+        generate(config_path=config_path, output_dir=str(output_dir))
+
+        traefik = yaml.safe_load((output_dir / "traefik.yaml").read_text())
+        transports = traefik["http"]["serversTransports"]
+        assert set(transports) == {registry["name"] for registry in sample_config["registries"]}
+        assert transports["dockerhub"] == TRANSPORT
+        assert transports["ghcr"]["maxIdleConnsPerHost"] == 32
+        assert transports["ghcr"]["forwardingTimeouts"] == TRANSPORT["forwardingTimeouts"]
+        for name, service in traefik["http"]["services"].items():
+            assert service["loadBalancer"]["serversTransport"] == name
+
+    def test_no_transport_without_settings(self, tmp_path, sample_config):
+        assert "transport" not in sample_config["traefik"]
+        config_path = _write_config(tmp_path, sample_config)
+        output_dir = tmp_path / "compose"
+        generate(config_path=config_path, output_dir=str(output_dir))
+
+        traefik = yaml.safe_load((output_dir / "traefik.yaml").read_text())
+        assert "serversTransports" not in traefik["http"]
+        assert "serversTransport" not in traefik["http"]["services"]["dockerhub"]["loadBalancer"]
+
+    def test_invalid_transport(self, tmp_path, sample_config):
+        sample_config["registries"][0]["transport"] = {"disableHTTP2": "no"}
+        config_path = _write_config(tmp_path, sample_config)
+        with pytest.raises(ValueError):
+            generate(config_path=config_path, output_dir=str(tmp_path / "compose"))
+
+
+class TestEndpointRouters:
+    """Tests for the manifest and blob routers."""
+
+    def test_routers_are_generated_per_registry(self, tmp_path, sample_config):
+        sample_config["traefik"]["transport"] = TRANSPORT
+        sample_config["traefik"]["endpointRouters"] = {
+            "manifests": {"compress": True, "forwardingTimeouts": {"responseHeaderTimeout": "30s"}},
+            "blobs": {},
+        }
+        config_path = _write_config(tmp_path, sample_config)
+        output_dir = tmp_path / "compose"
+        generate(config_path=config_path, output_dir=str(output_dir))
+
+        http = yaml.safe_load((output_dir / "traefik.yaml").read_text())["http"]
+        for registry in sample_config["registries"]:
+            name = registry["name"]
+            assert name in http["routers"]
+            assert http["routers"][f"{name}-manifests"]["middlewares"] == [f"{name}-compress"]
+            assert http["routers"][f"{name}-manifests"]["service"] == f"{name}-manifests"
+            assert http["routers"][f"{name}-blobs"]["service"] == name
+            assert "middlewares" not in http["routers"][f"{name}-blobs"]
+            assert http["middlewares"][f"{name}-compress"] == {"compress": {}}
+            timeouts = http["serversTransports"][f"{name}-manifests"]["forwardingTimeouts"]
+            assert timeouts["responseHeaderTimeout"] == "30s"
+            assert timeouts["dialTimeout"] == TRANSPORT["forwardingTimeouts"]["dialTimeout"]
+
+    def test_disabling_removes_routers(self, tmp_path, sample_config):
+        output_dir = tmp_path / "compose"
+        sample_config["traefik"]["endpointRouters"] = {"blobs": {}}
+        generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir))
+        del sample_config["traefik"]["endpointRouters"]
+        generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir))
+
+        http = yaml.safe_load((output_dir / "traefik.yaml").read_text())["http"]
+        assert not [router for router in http["routers"] if router.endswith("-blobs")]
+
+    def test_invalid_settings(self, tmp_path, sample_config):
+        sample_config["traefik"]["endpointRouters"] = {"blobs": {"compress": True}}
+        with pytest.raises(ValueError):
+            generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(tmp_path / "compose"))
+
+
+class TestMetrics:
+    """Tests for the metrics stack."""
+
+    def test_metrics_stack_is_generated(self, tmp_path, sample_config):
+        sample_config["metrics"] = None
+        sample_config["redis"]["shards"] = 2
+        output_dir = tmp_path / "compose"
+        recreate = generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir))
+
+        registry_config = yaml.safe_load((output_dir / "dockerhub.yaml").read_text())
+        assert registry_config["http"]["debug"]["prometheus"]["enabled"] is True
+        traefik = yaml.safe_load((output_dir / "traefik.yaml").read_text())
+        assert traefik["metrics"]["prometheus"]["addRoutersLabels"] is True
+        compose = yaml.safe_load((output_dir / "compose.yaml").read_text())
+        assert "redis-exporter" in compose["services"]
+        assert "redis-exporter" in recreate
+
+        prometheus = yaml.safe_load((output_dir / "prometheus.yaml").read_text())
+        jobs = {job["job_name"]: job for job in prometheus["scrape_configs"]}
+        registries = {config["labels"]["registry"] for config in jobs["registry"]["static_configs"]}
+        assert registries == {registry["name"] for registry in sample_config["registries"]}
+        assert jobs["redis"]["static_configs"][0]["targets"] == ["redis://redis:6379", "redis://redis-1:6379"]
+
+    def test_no_metrics_by_default(self, tmp_path, sample_config):
+        output_dir = tmp_path / "compose"
+        generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir))
+        assert not (output_dir / "prometheus.yaml").exists()
+        assert "debug" not in yaml.safe_load((output_dir / "dockerhub.yaml").read_text())["http"]
+
+
+class TestStorageTuning:
+    """Tests for the storage driver throughput tuning."""
+
+    def test_s3_registries_are_tuned(self, tmp_path, sample_config):
+        storage = sample_config["registry"]["baseConfig"]["storage"]
+        storage.pop("inmemory", None)
+        storage.pop("filesystem", None)
+        storage["s3"] = {"bucket": "cache", "region": "eu-west-1", "rootdirectory": "{name}"}
+        sample_config["storageTuning"] = {"linkBandwidth": "1gbit", "layerSize": "4gb"}
+        sample_config["registries"][0]["storageTuning"] = {"layerSize": "400gb"}
+        output_dir = tmp_path / "compose"
+        generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir))
+
+        first = yaml.safe_load((output_dir / f"{sample_config['registries'][0]['name']}.yaml").read_text())
+        second = yaml.safe_load((output_dir / f"{sample_config['registries'][1]['name']}.yaml").read_text())
+        assert second["storage"]["s3"]["chunksize"] == 32 * 1024 ** 2
+        assert second["storage"]["s3"]["rootdirectory"] == sample_config["registries"][1]["name"]
+        assert first["storage"]["s3"]["chunksize"] == 64 * 1024 ** 2
+
+    def test_invalid_tuning(self, tmp_path, sample_config):
+        storage = sample_config["registry"]["baseConfig"]["storage"]
+        storage.pop("inmemory", None)
+        storage.pop("filesystem", None)
+        storage["s3"] = {"bucket": "cache", "chunksize": "1mb"}
+        with pytest.raises(ValueError):
+            generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(tmp_path / "compose"))
+
+
+class TestStorageRedirect:
+    """Tests for storage redirects and CDN middlewares."""
+
+    def test_global_and_registry_settings(self, tmp_path, sample_config):
+        sample_config["registry"]["baseConfig"]["storage"]["s3"] = {"bucket": "cache", "rootdirectory": "{name}"}
+        sample_config["storageRedirect"] = {"cdn": {"name": "redirect", "options": {"baseurl": "https://cdn.example.net/"}}}
+        sample_config["registries"][1]["storageRedirect"] = False
+        output_dir = tmp_path / "compose"
+        generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir))
+
+        first = yaml.safe_load((output_dir / f"{sample_config['registries'][0]['name']}.yaml").read_text())
+        second = yaml.safe_load((output_dir / f"{sample_config['registries'][1]['name']}.yaml").read_text())
+        assert first["storage"]["redirect"] == {"disable": False}
+        assert first["middleware"]["storage"][0]["options"]["baseurl"] == "https://cdn.example.net/"
+        assert second["storage"]["redirect"] == {"disable": True}
+        assert "middleware" not in second
+
+    def test_warns_with_filesystem(self, tmp_path, sample_config, capsys):
+        sample_config["registry"]["baseConfig"]["storage"]["filesystem"] = {"rootdirectory": "/var/lib/registry/{name}"}
+        sample_config["storageRedirect"] = True
+        generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(tmp_path / "compose"))
+        assert "blobs cannot be redirected" in " ".join(capsys.readouterr().out.split())
+
+    def test_invalid_settings(self, tmp_path, sample_config):
+        sample_config["storageRedirect"] = {"cdn": {"name": "cloudfront"}}
+        with pytest.raises(ValueError):
+            generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(tmp_path / "compose"))
+
+
+class TestResources:
+    """Tests for registry container sizing."""
+
+    def test_services_are_sized(self, tmp_path, sample_config):
+        sample_config["resources"] = {
+            "budget": {"cpus": 8, "memory": "16gb", "nofile": 400000},
+            "profiles": {"hot": {"cpus": 4, "memory": "8gb", "nofile": 200000}},
+        }
+        sample_config["registries"][0]["profile"] = "hot"
+        output_dir = tmp_path / "compose"
+        generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir))
+
+        services = yaml.safe_load((output_dir / "compose.yaml").read_text())["services"]
+        hot = services[sample_config["registries"][0]["name"]]
+        assert hot["deploy"]["resources"]["limits"] == {"cpus": "4.00", "memory": "8192M"}
+        assert "GOMAXPROCS=4" in hot["environment"]
+        # The four other registries share the rest equally
+        other = services[sample_config["registries"][1]["name"]]
+        assert other["deploy"]["resources"]["limits"]["cpus"] == "1.00"
+        assert other["ulimits"]["nofile"]["soft"] == 50000
+        assert "deploy" not in services["traefik"]
+
+    def test_oversubscribed_budget_fails(self, tmp_path, sample_config):
+        sample_config["resources"] = {"budget": {"cpus": 2, "memory": "1gb"}, "profiles": {"hot": {"cpus": 4, "memory": "1gb"}}}
+        sample_config["registries"][0]["profile"] = "hot"
+        with pytest.raises(ValueError):
+            generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(tmp_path / "compose"))
+
+    def test_weight_without_resources_fails(self, tmp_path, sample_config):
+        sample_config["registries"][0]["weight"] = 2
+        with pytest.raises(ValueError):
+            generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(tmp_path / "compose"))
+
+
+class TestTraefikDirectory:
+    """Tests for the Traefik file provider directory mode."""
+
+    def test_static_and_dynamic_files(self, tmp_path, sample_config):
+        sample_config["traefik"]["dynamicDirectory"] = True
+        sample_config["traefik"]["endpointRouters"] = {"blobs": {}}
+        sample_config["traefik"]["transport"] = TRANSPORT
+        output_dir = tmp_path / "compose"
+        generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir))
+
+        static = yaml.safe_load((output_dir / "traefik.yaml").read_text())
+        assert "http" not in static
+        assert static["providers"]["file"] == {"directory": "/etc/traefik/traefik.d", "watch": True}
+        assert "websecure" in static["entryPoints"]
+        compose = yaml.safe_load((output_dir / "compose.yaml").read_text())
+        assert "./traefik.d:/etc/traefik/traefik.d:ro" in compose["services"]["traefik"]["volumes"]
+
+        files = sorted(path.name for path in (output_dir / "traefik.d").iterdir())
+        assert files == ["_base.yaml"] + sorted(f"{registry['name']}.yaml" for registry in sample_config["registries"])
+        ghcr = yaml.safe_load((output_dir / "traefik.d" / "ghcr.yaml").read_text())["http"]
+        assert set(ghcr["routers"]) == {"ghcr", "ghcr-blobs"}
+        assert ghcr["services"]["ghcr"]["loadBalancer"]["serversTransport"] == "ghcr"
+        assert set(ghcr["serversTransports"]) == {"ghcr"}
+
+    def test_only_changed_registry_is_rewritten(self, tmp_path, sample_config):
+        sample_config["traefik"]["dynamicDirectory"] = True
+        output_dir = tmp_path / "compose"
+        generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir))
+        dynamic_dir = output_dir / "traefik.d"
+        before = {path.name: path.stat().st_mtime_ns for path in dynamic_dir.iterdir()}
+        changed = sample_config["registries"][1]["name"]
+        changed_text = (dynamic_dir / f"{changed}.yaml").read_text()
+
+        sample_config["registries"][1]["transport"] = {"maxIdleConnsPerHost": 512}
+        removed = sample_config["registries"].pop()
+        generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir))
+        after = {path.name: path.stat().st_mtime_ns for path in dynamic_dir.iterdir()}
+
+        assert f"{removed['name']}.yaml" not in after
+        assert (dynamic_dir / f"{changed}.yaml").read_text() != changed_text
+        assert all(after[name] == before[name] for name in after if name != f"{changed}.yaml")
+
+    def test_file_mode_is_unchanged(self, tmp_path, sample_config):
+        output_dir = tmp_path / "compose"
+        generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir))
+        assert not (output_dir / "traefik.d").exists()
+        traefik = yaml.safe_load((output_dir / "traefik.yaml").read_text())
+        assert "dockerhub" in traefik["http"]["routers"]
+
+
+class TestHttp3AndTls:
+    """Tests for the HTTP/3 and TLS settings of the HTTPS entry point."""
+
+    def test_ports_and_entry_points_are_consistent(self, tmp_path, sample_config):
+        sample_config["traefik"]["http3"] = True
+        sample_config["traefik"]["tls"] = {"minVersion": "VersionTLS12", "curvePreferences": ["X25519", "CurveP256"]}
+        output_dir = tmp_path / "compose"
+        recreate = generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir))
+
+        compose = yaml.safe_load((output_dir / "compose.yaml").read_text())
+        assert "443:443/udp" in compose["services"]["traefik"]["ports"]
+        traefik = yaml.safe_load((output_dir / "traefik.yaml").read_text())
+        assert traefik["entryPoints"]["websecure"]["http3"] == {}
+        assert traefik["experimental"]["http3"] is True
+        assert traefik["tls"]["options"]["default"]["minVersion"] == "VersionTLS12"
+        assert "traefik" in recreate
+
+    def test_invalid_tls(self, tmp_path, sample_config):
+        sample_config["traefik"]["tls"] = {"minVersion": "VersionTLS14"}
+        with pytest.raises(ValueError):
+            generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(tmp_path / "compose"))
+
+
+class TestProtection:
+    """Tests for the in-flight, rate limit and retry middlewares of the registry routers."""
+
+    def test_middlewares_are_attached(self, tmp_path, sample_config):
+        sample_config["traefik"]["protection"] = {"inFlightReq": 64, "retry": 2, "blobs": {"inFlightReq": 16}}
+        sample_config["registries"][1]["protection"] = {"inFlightReq": False}
+        output_dir = tmp_path / "compose"
+        generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir))
+
+        http = yaml.safe_load((output_dir / "traefik.yaml").read_text())["http"]
+        first, second = sample_config["registries"][0]["name"], sample_config["registries"][1]["name"]
+        assert http["middlewares"][f"{first}-inflightreq"]["inFlightReq"]["amount"] == 64
+        assert http["routers"][first]["middlewares"][-2:] == [f"{first}-inflightreq", f"{first}-retry"]
+        # Separate blob limits create the blobs router even without traefik.endpointRouters
+        assert http["routers"][f"{first}-blobs"]["middlewares"][-2:] == [f"{first}-blobs-inflightreq", f"{first}-retry"]
+        assert f"{first}-manifests" not in http["routers"]
+        assert http["routers"][second]["middlewares"][-1] == f"{second}-retry"
+        assert f"{second}-inflightreq" not in http["middlewares"]
+
+    def test_endpoint_routers_have_their_own_budgets(self, tmp_path, sample_config, capsys):
+        sample_config["traefik"]["endpointRouters"] = {"manifests": {}, "blobs": {}}
+        sample_config["traefik"]["protection"] = {"inFlightReq": 64, "retry": 2, "manifests": {"inFlightReq": 8}}
+        output_dir = tmp_path / "compose"
+        generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir))
+
+        routers = yaml.safe_load((output_dir / "traefik.yaml").read_text())["http"]["routers"]
+        name = sample_config["registries"][0]["name"]
+        assert f"{name}-inflightreq" not in routers[f"{name}-manifests"]["middlewares"]
+        assert routers[f"{name}-manifests"]["middlewares"][-2:] == [f"{name}-manifests-inflightreq", f"{name}-retry"]
+        assert routers[f"{name}-blobs"]["middlewares"][-1] == f"{name}-retry"
+        assert f"{name}-inflightreq" not in routers[f"{name}-blobs"]["middlewares"]
+        output = " ".join(capsys.readouterr().out.split())
+        assert "The blobs routers do not share the registry inFlightReq" in output
+        assert "The manifests routers" not in output
+
+    def test_no_middlewares_by_default(self, tmp_path, sample_config):
+        output_dir = tmp_path / "compose"
+        generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir))
+        http = yaml.safe_load((output_dir / "traefik.yaml").read_text())["http"]
+        name = sample_config["registries"][0]["name"]
+        assert not any(middleware.startswith(f"{name}-") for middleware in http.get("middlewares") or {})
+
+    def test_invalid_registry_protection(self, tmp_path, sample_config):
+        sample_config["registries"][0]["protection"] = {"rateLimit": {"average": 0}}
+        with pytest.raises(ValueError):
+            generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(tmp_path / "compose"))
+
+
+class TestRegistrySources:
+    """Tests for registries listed in registriesFrom sources."""
+
+    def test_jsonl_registries_are_generated(self, tmp_path, sample_config):
+        extra = sample_config["registries"].pop()
+        (tmp_path / "inventory.jsonl").write_text(json.dumps(extra) + "\n")
+        sample_config["registriesFrom"] = ["inventory.jsonl"]
+        output_dir = tmp_path / "compose"
+        generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir))
+
+        assert (output_dir / f"{extra['name']}.yaml").exists()
+        compose = yaml.safe_load((output_dir / "compose.yaml").read_text())
+        assert extra["name"] in compose["services"]
+
+    def test_missing_source_fails(self, tmp_path, sample_config):
+        sample_config["registriesFrom"] = "registries.d"
+        with pytest.raises(ValueError):
+            generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(tmp_path / "compose"))
+
+
+class TestNodes:
+    """Tests for the placement of registries on several nodes."""
+
+    def _nodes_config(self, sample_config):
+        sample_config["nodes"] = [
+            {"name": "cache-a", "address": "10.0.0.11", "capacity": 100},
+            {"name": "cache-b", "address": "10.0.0.12", "capacity": 100},
+        ]
+        for registry in sample_config["registries"]:
+            registry["load"] = 10
+        sample_config["registries"][0]["load"] = 80
+        return sample_config
+
+    def test_one_bundle_per_node_and_a_front(self, tmp_path, sample_config):
+        config = self._nodes_config(sample_config)
+        output_dir = tmp_path / "compose"
+        recreate = generate(config_path=_write_config(tmp_path, config), output_dir=str(output_dir))
+
+        first = config["registries"][0]["name"]
+        others = [registry["name"] for registry in config["registries"][1:]]
+        compose_a = yaml.safe_load((output_dir / "nodes" / "cache-a" / "compose.yaml").read_text())
+        compose_b = yaml.safe_load((output_dir / "nodes" / "cache-b" / "compose.yaml").read_text())
+        assert first in compose_a["services"]
+        assert set(others) <= set(compose_b["services"])
+        assert (output_dir / "nodes" / "cache-b" / f"{others[0]}.yaml").exists()
+        assert (output_dir / "nodes" / "cache-a" / "redis.conf").exists()
+
+        front = yaml.safe_load((output_dir / "front" / "traefik.yaml").read_text())
+        assert front["tcp"]["routers"][first]["service"] == "cache-a"
+        assert front["tcp"]["services"]["cache-b"]["loadBalancer"]["servers"] == [{"address": "10.0.0.12:443"}]
+        assert f"cache-a/{first}" in recreate and "front/traefik" in recreate
+
+        placement = json.loads((output_dir / "node-placement.json").read_text())
+        assert placement["registries"][first] == "cache-a"
+
+    def test_replanning_keeps_placements(self, tmp_path, sample_config):
+        config = self._nodes_config(sample_config)
+        output_dir = tmp_path / "compose"
+        generate(config_path=_write_config(tmp_path, config), output_dir=str(output_dir))
+        before = json.loads((output_dir / "node-placement.json").read_text())["registries"]
+
+        config["registries"].append({"name": "extra", "type": "registry", "load": 5})
+        recreate = generate(config_path=_write_config(tmp_path, config), output_dir=str(output_dir))
+        after = json.loads((output_dir / "node-placement.json").read_text())["registries"]
+        assert {name: after[name] for name in before} == before
+        # Only the node receiving the new registry is touched (its redis.conf gets a database more)
+        assert f"{after['extra']}/extra" in recreate
+        assert all(service.startswith(f"{after['extra']}/") for service in recreate)
+
+    def test_capacity_exceeded(self, tmp_path, sample_config):
+        config = self._nodes_config(sample_config)
+        config["registries"][1]["load"] = 150
+        with pytest.raises(ValueError):
+            generate(config_path=_write_config(tmp_path, config), output_dir=str(tmp_path / "compose"))
+
+
+class TestTiers:
+    """Tests for the central and edge tier bundles."""
+
+    def test_edge_registries_cache_the_central_ones(self, tmp_path, sample_config):
+        sample_config["traefik"]["perRegistry"]["router"]["rule"] = "Host(`{name}.{tier}.example.net`)"
+        sample_config["tiers"] = [{"name": "central"}, {"name": "paris", "upstream": "central"}]
+        output_dir = tmp_path / "compose"
+        recreate = generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir))
+
+        registry = sample_config["registries"][0]
+        central = yaml.safe_load((output_dir / "tiers" / "central" / f"{registry['name']}.yaml").read_text())
+        edge = yaml.safe_load((output_dir / "tiers" / "paris" / f"{registry['name']}.yaml").read_text())
+        assert central["proxy"]["remoteurl"] == registry["url"]
+        assert edge["proxy"]["remoteurl"] == f"https://{registry['name']}.central.example.net"
+        assert edge["proxy"]["password"] == registry["password"]
+        traefik = yaml.safe_load((output_dir / "tiers" / "paris" / "traefik.yaml").read_text())
+        assert traefik["http"]["routers"][registry["name"]]["rule"] == f"Host(`{registry['name']}.paris.example.net`)"
+        assert f"paris/{registry['name']}" in recreate
+
+    def test_loop_fails(self, tmp_path, sample_config):
+        sample_config["tiers"] = [{"name": "a", "upstream": "b"}, {"name": "b", "upstream": "a"}]
+        with pytest.raises(ValueError, match="loop"):
+            generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(tmp_path / "compose"))
+
+
+class TestUpstreams:
+    """Tests for cache registries with several upstreams."""
+
+    def test_backends_share_storage_behind_failover(self, tmp_path, sample_config):
+        registry = sample_config["registries"][0]
+        for key in ("url", "username", "password"):
+            registry.pop(key, None)
+        registry["upstreams"] = [
+            {"name": "hub", "url": "https://registry-1.docker.io", "username": "u", "password": "secret"},
+            "https://mirror.gcr.io",
+            {"name": "quay", "url": "https://quay.io:8443", "healthCheck": False},
+        ]
+        name = registry["name"]
+        output_dir = tmp_path / "compose"
+        recreate = generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir))
+
+        hub = yaml.safe_load((output_dir / f"{name}-hub.yaml").read_text())
+        mirror = yaml.safe_load((output_dir / f"{name}-upstream2.yaml").read_text())
+        quay = yaml.safe_load((output_dir / f"{name}-quay.yaml").read_text())
+        assert hub["proxy"]["remoteurl"] == "https://registry-1.docker.io"
+        assert hub["proxy"]["password"] == "secret"
+        assert "password" not in mirror["proxy"]
+        assert hub["storage"] == mirror["storage"] and hub["redis"] == mirror["redis"]
+        assert hub["health"]["tcp"][-1]["addr"] == "registry-1.docker.io:443"
+        assert "health" not in quay or "tcp" not in quay["health"]
+
+        compose = yaml.safe_load((output_dir / "compose.yaml").read_text())
+        assert name not in compose["services"]
+        assert f"./{name}-hub.yaml:/etc/docker/registry/config.yml:ro" in compose["services"][f"{name}-hub"]["volumes"]
+        assert "secret" not in (output_dir / "compose.yaml").read_text()
+        services = yaml.safe_load((output_dir / "traefik.yaml").read_text())["http"]["services"]
+        assert services[name] == {"failover": {"service": f"{name}-hub", "fallback": f"{name}-upstream2-failover"}}
+        assert services[f"{name}-upstream2-failover"]["failover"]["fallback"] == f"{name}-quay"
+        assert services[f"{name}-hub"]["loadBalancer"]["servers"] == [{"url": f"http://{name}-hub:5000"}]
+        assert "healthCheck" in services[f"{name}-hub"]["loadBalancer"]
+        assert f"{name}-quay" in recreate
+
+        assert generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir)) == []
+
+    def test_weighted_upstreams_with_replicas(self, tmp_path, sample_config):
+        registry = sample_config["registries"][0]
+        for key in ("url", "username", "password"):
+            registry.pop(key, None)
+        registry.update({
+            "upstreamMode": "weighted", "replicas": 2,
+            "upstreams": [{"name": "a", "url": "https://a.example", "weight": 3}, {"name": "b", "url": "https://b.example"}],
+        })
+        name = registry["name"]
+        output_dir = tmp_path / "compose"
+        generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(output_dir))
+
+        compose = yaml.safe_load((output_dir / "compose.yaml").read_text())
+        assert {f"{name}-a-1", f"{name}-a-2", f"{name}-b-1", f"{name}-b-2"} <= set(compose["services"])
+        services = yaml.safe_load((output_dir / "traefik.yaml").read_text())["http"]["services"]
+        assert services[name] == {"weighted": {"services": [
+            {"name": f"{name}-a", "weight": 3}, {"name": f"{name}-b", "weight": 1},
+        ], "healthCheck": {}}}
+        assert len(services[f"{name}-b"]["loadBalancer"]["servers"]) == 2
+
+    def test_url_with_upstreams_fails(self, tmp_path, sample_config):
+        sample_config["registries"][0]["upstreams"] = ["https://a.example", "https://b.example"]
+        with pytest.raises(ValueError, match="per upstream"):
+            generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(tmp_path / "compose"))
+
+    def test_backend_name_collision_fails(self, tmp_path, sample_config):
+        sample_config["registries"] = [
+            {"name": "docker", "upstreams": [{"name": "hub", "url": "https://registry-1.docker.io"}, "https://mirror.gcr.io"]},
+            {"name": "docker-hub", "url": "https://registry-1.docker.io"},
+        ]
+        with pytest.raises(ValueError, match="docker and docker-hub"):
+            generate(config_path=_write_config(tmp_path, sample_config), output_dir=str(tmp_path / "compose"))
+        assert not (tmp_path / "compose" / "docker-hub.yaml").exists()
+
+
+def _write_config(tmp_path, config):
+    """Dump a config dict to tmp_path/config.yaml and return its path."""
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(yaml.safe_dump(config))
+    return str(config_path)
+
+
+def _mtimes(directory):
+    """Return a mapping of file name to mtime for the files in a directory."""
+    return {
+        entry.name: entry.stat().st_mtime_ns
+        for entry in os.scandir(directory)
+        if entry.is_file()
+    }
+
+
 def _flatten_strings(obj):
     """Recursively yield all string values from a nested dict/list structure."""
     if isinstance(obj, str):
@@ -0,0 +1,104 @@
+"""Tests for multi_registry_cache.inventory module."""
+
+import json
+import os
+
+import pytest
+
+from multi_registry_cache import inventory
+from multi_registry_cache.inventory import CACHE_FILENAME, load_registries, read_source_file
+
+
+class TestReadSourceFile:
+    """Tests for read_source_file."""
+
+    def test_jsonl(self, tmp_path):
+        path = tmp_path / "inventory.jsonl"
+        path.write_text('{"name": "a", "type": "cache", "url": "https://a.example"}\n\n{"name": "b", "replicas": 2}\n')
+        assert read_source_file(str(path)) == [
+            {"name": "a", "type": "cache", "url": "https://a.example"},
+            {"name": "b", "replicas": 2},
+        ]
+
+    def test_csv(self, tmp_path):
+        path = tmp_path / "inventory.csv"
+        path.write_text("name,type,url,replicas,password\na,cache,https://a.example,2,0123\nb,registry,,,\n")
+        assert read_source_file(str(path)) == [
+            {"name": "a", "type": "cache", "url": "https://a.example", "replicas": 2, "password": "0123"},
+            {"name": "b", "type": "registry"},
+        ]
+
+    def test_yaml_single_registry(self, tmp_path):
+        path = tmp_path / "ghcr.yaml"
+        path.write_text("name: ghcr\ntype: cache\n")
+        assert read_source_file(str(path)) == [{"name": "ghcr", "type": "cache"}]
+
+    @pytest.mark.parametrize("filename, content, match", [
+        ("bad.jsonl", '{"name": "a"}\n{"name": \n', "bad.jsonl:2"),
+        ("bad.jsonl", '["a"]\n', "JSON object"),
+        ("bad.csv", "name,replicas\na,two\n", "bad.csv:2: invalid replicas"),
+        ("bad.yaml", "- 1\n- 2\n", "registry mapping"),
+        ("bad.toml", "", "Unsupported"),
+    ])
+    def test_invalid(self, tmp_path, filename, content, match):
+        path = tmp_path / filename
+        path.write_text(content)
+        with pytest.raises(ValueError, match=match):
+            read_source_file(str(path))
+
+
+class TestLoadRegistries:
+    """Tests for load_registries and its parse cache."""
+
+    def _config(self, tmp_path):
+        directory = tmp_path / "registries.d"
+        directory.mkdir()
+        (directory / "10-ghcr.yaml").write_text("name: ghcr\ntype: cache\n")
+        (directory / "20-more.jsonl").write_text('{"name": "quay", "type": "cache"}\n')
+        (directory / "README.md").write_text("not an inventory\n")
+        (tmp_path / "cmdb.csv").write_text("name,type\ninternal,registry\n")
+        return {"registries": [{"name": "dockerhub", "type": "cache"}], "registriesFrom": ["registries.d", "cmdb.csv"]}
+
+    def test_sources_follow_inline_registries(self, tmp_path):
+        registries = load_registries(self._config(tmp_path), str(tmp_path / "config.yaml"))
+        assert [registry["name"] for registry in registries] == ["dockerhub", "ghcr", "quay", "internal"]
+
+    def test_unchanged_files_come_from_the_cache(self, tmp_path, monkeypatch):
+        config = self._config(tmp_path)
+        config_path = str(tmp_path / "config.yaml")
+        load_registries(config, config_path)
+        cache = json.loads((tmp_path / CACHE_FILENAME).read_text())
+        assert len(cache["files"]) == 3
+
+        parsed = []
+        original = inventory.read_source_file
+        monkeypatch.setattr(inventory, "read_source_file", lambda path: parsed.append(path) or original(path))
+        csv_path = tmp_path / "cmdb.csv"
+        csv_path.write_text("name,type\ninternal,registry\nextra,registry\n")
+        registries = load_registries(config, config_path)
+        assert parsed == [str(csv_path)]
+        assert registries[-1]["name"] == "extra"
+
+    def test_stale_cache_entry_with_same_size_is_reparsed(self, tmp_path):
+        config = self._config(tmp_path)
+        config_path = str(tmp_path / "config.yaml")
+        load_registries(config, config_path)
+        path = tmp_path / "cmdb.csv"
+        path.write_text("name,type\ninternal,registrx\n")
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        assert load_registries(config, config_path)[-1]["type"] == "registrx"
+
+    def test_duplicate_names(self, tmp_path):
+        config = self._config(tmp_path)
+        config["registries"].append({"name": "quay"})
+        with pytest.raises(ValueError, match="quay"):
+            load_registries(config, str(tmp_path / "config.yaml"))
+
+    def test_missing_source(self, tmp_path):
+        with pytest.raises(ValueError, match="missing.jsonl"):
+            load_registries({"registriesFrom": "missing.jsonl"}, str(tmp_path / "config.yaml"))
+
+    def test_inline_only_writes_no_cache(self, tmp_path):
+        assert load_registries({"registries": [{"name": "a"}]}, str(tmp_path / "config.yaml")) == [{"name": "a"}]
+        assert not (tmp_path / CACHE_FILENAME).exists()
@@ -0,0 +1,83 @@
+"""Tests for multi_registry_cache.metrics module."""
+
+import pytest
+
+from multi_registry_cache.metrics import (
+    DEFAULT_METRICS,
+    add_traefik_metrics,
+    create_redis_exporter_service,
+    prometheus_config,
+    registry_debug_config,
+    validate_metrics,
+)
+
+
+class TestValidateMetrics:
+    """Tests for validate_metrics."""
+
+    def test_defaults(self):
+        assert validate_metrics(None) == DEFAULT_METRICS
+        assert validate_metrics({"registryPort": 6001})["registryPort"] == 6001
+
+    @pytest.mark.parametrize("settings", [
+        {"registryPort": 0},
+        {"traefikPort": "8082"},
+        {"registryPort": True},
+        {"exporter": True},
+        ["registryPort"],
+    ])
+    def test_invalid(self, settings):
+        with pytest.raises(ValueError):
+            validate_metrics(settings)
+
+
+class TestRegistryDebugConfig:
+    """Tests for registry_debug_config."""
+
+    def test_debug_listener(self, base_registry_config):
+        result = registry_debug_config(base_registry_config, DEFAULT_METRICS)
+        assert result["http"]["debug"] == {"addr": ":5001", "prometheus": {"enabled": True, "path": "/metrics"}}
+        assert result["http"]["addr"] == ":5000"
+        assert "debug" not in base_registry_config["http"]
+
+    def test_port_clash_with_api(self, base_registry_config):
+        with pytest.raises(ValueError):
+            registry_debug_config(base_registry_config, {**DEFAULT_METRICS, "registryPort": 5000})
+
+
+class TestTraefikAndExporter:
+    """Tests for add_traefik_metrics and create_redis_exporter_service."""
+
+    def test_traefik_metrics(self):
+        config = {"entryPoints": {"web": {"address": ":80"}}}
+        add_traefik_metrics(config, DEFAULT_METRICS)
+        assert config["entryPoints"]["metrics"] == {"address": ":8082"}
+        assert config["metrics"]["prometheus"]["entryPoint"] == "metrics"
+        assert config["metrics"]["prometheus"]["addRoutersLabels"] is True
+
+    def test_existing_traefik_metrics_are_kept(self):
+        config = {"metrics": {"datadog": {}}}
+        add_traefik_metrics(config, DEFAULT_METRICS)
+        assert config["metrics"] == {"datadog": {}}
+
+    def test_exporter_joins_redis_networks(self):
+        service = create_redis_exporter_service({"networks": ["registries"]}, DEFAULT_METRICS)
+        assert service["image"] == DEFAULT_METRICS["redisExporterImage"]
+        assert service["networks"] == ["registries"]
+
+
+class TestPrometheusConfig:
+    """Tests for prometheus_config."""
+
+    def test_every_target_is_listed(self):
+        config = prometheus_config(
+            DEFAULT_METRICS, {"dockerhub": ["dockerhub-1", "dockerhub-2"], "ghcr": ["ghcr"]}, ["redis:6379", "redis-1:6379"]
+        )
+        jobs = {job["job_name"]: job for job in config["scrape_configs"]}
+        assert jobs["registry"]["static_configs"] == [
+            {"targets": ["dockerhub-1:5001", "dockerhub-2:5001"], "labels": {"registry": "dockerhub"}},
+            {"targets": ["ghcr:5001"], "labels": {"registry": "ghcr"}},
+        ]
+        assert jobs["traefik"]["static_configs"] == [{"targets": ["traefik:8082"]}]
+        assert jobs["redis"]["static_configs"] == [{"targets": ["redis://redis:6379", "redis://redis-1:6379"]}]
+        assert jobs["redis"]["relabel_configs"][-1]["replacement"] == "redis-exporter:9121"
@@ -0,0 +1,111 @@
+"""Tests for multi_registry_cache.placement module."""
+
+import pytest
+
+from multi_registry_cache.placement import (
+    front_compose_config, front_traefik_config, plan_placement, registry_host, validate_nodes,
+)
+
+
+def _nodes(*capacities):
+    return validate_nodes([
+        {"name": f"node-{index}", "address": f"10.0.0.{index}", "capacity": capacity}
+        for index, capacity in enumerate(capacities, start=1)
+    ])
+
+
+def _registries(**loads):
+    return [{"name": name, "load": load} for name, load in loads.items()]
+
+
+class TestValidateNodes:
+    """Tests for validate_nodes."""
+
+    @pytest.mark.parametrize("nodes", [
+        [],
+        [{"name": "a", "address": "10.0.0.1"}],
+        [{"name": "a", "address": "10.0.0.1", "capacity": 0}],
+        [{"name": "../a", "address": "10.0.0.1", "capacity": 1}],
+        [{"name": "front", "address": "10.0.0.1", "capacity": 1}],
+        [{"name": "a", "address": "10.0.0.1", "capacity": 1, "zone": "b"}],
+        [{"name": "a", "address": "10.0.0.1", "capacity": 1}, {"name": "a", "address": "10.0.0.2", "capacity": 1}],
+    ])
+    def test_invalid(self, nodes):
+        with pytest.raises(ValueError):
+            validate_nodes(nodes)
+
+
+class TestPlanPlacement:
+    """Tests for plan_placement."""
+
+    def test_largest_first_on_the_freest_node(self):
+        placement, moves = plan_placement(_registries(a=50, b=40, c=30, d=20), _nodes(100, 80))
+        assert placement == {"a": "node-1", "b": "node-2", "c": "node-1", "d": "node-2"}
+        assert moves == []
+
+    def test_previous_placements_are_kept(self):
+        previous = {"a": "node-2", "b": "node-1"}
+        placement, moves = plan_placement(_registries(a=50, b=40, c=5), _nodes(100, 100), previous)
+        assert placement["a"] == "node-2" and placement["b"] == "node-1"
+        assert moves == []
+
+    def test_overloaded_node_moves_as_few_registries_as_possible(self):
+        previous = {"a": "node-1", "b": "node-1", "c": "node-1", "d": "node-2"}
+        # a grew: moving it alone relieves node-1
+        placement, moves = plan_placement(_registries(a=60, b=20, c=20, d=10), _nodes(80, 100), previous)
+        assert moves == [("a", "node-1", "node-2")]
+        assert placement["b"] == placement["c"] == "node-1"
+
+    def test_removed_node(self):
+        placement, moves = plan_placement(_registries(a=1, b=1), _nodes(10), {"a": "node-1", "b": "node-9"})
+        assert placement == {"a": "node-1", "b": "node-1"}
+        assert moves == [("b", "node-9", "node-1")]
+
+    def test_pinned_registry(self):
+        registries = _registries(a=10, b=10)
+        registries[1]["node"] = "node-2"
+        placement, _ = plan_placement(registries, _nodes(100, 5 + 10), {"b": "node-1"})
+        assert placement["b"] == "node-2"
+
+    @pytest.mark.parametrize("registries", [
+        _registries(a=60, b=60),
+        [{"name": "a", "node": "node-9"}],
+        [{"name": "a", "load": "heavy"}],
+    ])
+    def test_impossible(self, registries):
+        with pytest.raises(ValueError):
+            plan_placement(registries, _nodes(100))
+
+
+class TestFront:
+    """Tests for the front Traefik configuration."""
+
+    def test_routes_hosts_to_their_node(self):
+        traefik_config = {
+            "providers": {"file": {"filename": "/etc/traefik/traefik.yaml"}},
+            "entryPoints": {"web": {"address": ":80"}, "websecure": {"address": ":443", "transport": {}}},
+            "certificatesResolvers": {"le": {}},
+        }
+        front = front_traefik_config(traefik_config, {"ghcr": ("ghcr.example.net", "node-2")}, _nodes(1, 1), 80, 443)
+        assert front["entryPoints"] == {"web": {"address": ":80"}, "websecure": {"address": ":443"}}
+        assert "certificatesResolvers" not in front
+        assert front["tcp"]["routers"]["ghcr"] == {
+            "rule": "HostSNI(`ghcr.example.net`)", "entryPoints": ["websecure"], "service": "node-2",
+            "tls": {"passthrough": True},
+        }
+        assert front["tcp"]["services"]["node-2"]["loadBalancer"]["servers"] == [{"address": "10.0.0.2:443"}]
+        assert front["http"]["services"]["node-1"]["loadBalancer"]["servers"] == [{"url": "http://10.0.0.1:80"}]
+
+    def test_compose_keeps_only_the_traefik_config(self):
+        service = {
+            "image": "traefik:v3.1", "ports": ["80:80"], "networks": ["registries"],
+            "volumes": ["./traefik.yaml:/etc/traefik/traefik.yaml:ro", "./acme:/etc/traefik/acme:rw"],
+        }
+        assert front_compose_config(service) == {"services": {"traefik": {
+            "image": "traefik:v3.1", "ports": ["80:80"], "volumes": ["./traefik.yaml:/etc/traefik/traefik.yaml:ro"],
+        }}}
+
+    def test_registry_host(self):
+        assert registry_host({"rule": "Host(`a.example.net`) && PathPrefix(`/v2`)"}) == "a.example.net"
+        with pytest.raises(ValueError):
+            registry_host({"rule": "PathPrefix(`/v2`)"})
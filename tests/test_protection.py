@@ -0,0 +1,83 @@
+"""Tests for multi_registry_cache.protection module."""
+
+import pytest
+
+from multi_registry_cache.protection import attach_middlewares, create_protection, resolve_protection
+
+
+class TestResolveProtection:
+    """Tests for resolve_protection."""
+
+    def test_shorthands_and_defaults(self):
+        resolved = resolve_protection({"inFlightReq": 64, "rateLimit": 100, "retry": 2})
+        assert resolved == {"registry": {
+            "inFlightReq": {"inFlightReq": {"amount": 64, "sourceCriterion": {"requestHost": True}}},
+            "rateLimit": {"rateLimit": {"average": 100, "burst": 100, "sourceCriterion": {"requestHost": True}}},
+            "retry": {"retry": {"attempts": 2}},
+        }}
+
+    def test_registry_override_is_merged(self):
+        resolved = resolve_protection(
+            {"rateLimit": {"average": 100, "period": "1s"}, "retry": 2},
+            {"rateLimit": {"average": 10}, "retry": False},
+        )
+        assert resolved["registry"] == {"rateLimit": {"rateLimit": {
+            "average": 10, "burst": 10, "period": "1s", "sourceCriterion": {"requestHost": True},
+        }}}
+
+    def test_endpoint_sections(self):
+        resolved = resolve_protection({"inFlightReq": 64, "blobs": {"inFlightReq": 16, "retry": 3}})
+        assert resolved["blobs"]["inFlightReq"]["inFlightReq"]["amount"] == 16
+        assert resolved["blobs"]["retry"] == {"retry": {"attempts": 3}}
+        assert "manifests" not in resolved
+
+    def test_nothing_configured(self):
+        assert resolve_protection() == {"registry": {}}
+
+    @pytest.mark.parametrize("settings", [
+        [],
+        {"circuitBreaker": {}},
+        {"inFlightReq": 0},
+        {"inFlightReq": {"amount": 8, "depth": 1}},
+        {"rateLimit": {"burst": 10}},
+        {"rateLimit": {"average": 10, "burst": 5}},
+        {"rateLimit": {"average": 10, "period": "soon"}},
+        {"retry": {"attempts": 2, "initialInterval": 100}},
+        {"blobs": {"compress": True}},
+        {"manifests": 10},
+    ])
+    def test_invalid(self, settings):
+        with pytest.raises(ValueError):
+            resolve_protection(settings)
+
+
+class TestCreateProtection:
+    """Tests for create_protection and attach_middlewares."""
+
+    def test_chains(self):
+        protection = resolve_protection({
+            "inFlightReq": 64, "retry": 2,
+            "manifests": {"rateLimit": 50},
+            "blobs": {"inFlightReq": 16, "retry": False},
+        })
+        middlewares, chains = create_protection("dockerhub", protection)
+        assert set(middlewares) == {
+            "dockerhub-inflightreq", "dockerhub-retry", "dockerhub-manifests-ratelimit", "dockerhub-blobs-inflightreq",
+        }
+        assert chains == {
+            "registry": ["dockerhub-inflightreq", "dockerhub-retry"],
+            "manifests": ["dockerhub-manifests-ratelimit", "dockerhub-retry"],
+            "blobs": ["dockerhub-blobs-inflightreq"],
+        }
+
+    def test_endpoints_never_share_budgets(self):
+        # Traefik counts per router: sharing the registry middleware would multiply its budget
+        _, chains = create_protection("dockerhub", resolve_protection({"inFlightReq": 64, "rateLimit": 100, "retry": 2}))
+        assert chains["manifests"] == chains["blobs"] == ["dockerhub-retry"]
+
+    def test_attach_replaces_inherited_chain(self):
+        router = {"rule": "Host(`a`)", "middlewares": ["auth", "dockerhub-inflightreq"]}
+        attached = attach_middlewares(router, ["dockerhub-blobs-inflightreq"], ["dockerhub-inflightreq"])
+        assert attached["middlewares"] == ["auth", "dockerhub-blobs-inflightreq"]
+        assert router["middlewares"] == ["auth", "dockerhub-inflightreq"]
+        assert "middlewares" not in attach_middlewares({"rule": "Host(`a`)", "middlewares": ["x"]}, [], ["x"])
@@ -0,0 +1,246 @@
+"""Tests for multi_registry_cache.redis_topology module."""
+
+import pytest
+
+from multi_registry_cache.redis_topology import (
+    allocate_databases,
+    build_hash_ring,
+    create_shard_services,
+    databases_per_shard,
+    format_size,
+    load_allocation,
+    parse_size,
+    redis_conf,
+    redis_port,
+    save_allocation,
+    shard_for,
+    shard_names,
+    validate_client,
+    validate_tuning,
+)
+
+
+def _registries(count):
+    return [{"name": f"mirror{i}"} for i in range(count)]
+
+
+class TestShardNames:
+    """Tests for shard_names."""
+
+    def test_single_shard_keeps_redis(self):
+        assert shard_names(1) == ["redis"]
+
+    def test_several_shards(self):
+        assert shard_names(3) == ["redis", "redis-1", "redis-2"]
+
+    def test_first_shard_keeps_its_registries(self):
+        previous, _ = allocate_databases(_registries(20), shard_names(1))
+        allocation, changes = allocate_databases(_registries(20), shard_names(2), previous)
+        assert allocation == previous
+        assert changes == []
+
+
+class TestHashRing:
+    """Tests for build_hash_ring and shard_for."""
+
+    def test_deterministic(self):
+        ring = build_hash_ring(shard_names(4))
+        assert shard_for(ring, "dockerhub") == shard_for(build_hash_ring(shard_names(4)), "dockerhub")
+
+    def test_spreads_registries(self):
+        ring = build_hash_ring(shard_names(4))
+        used = {shard_for(ring, f"mirror{i}") for i in range(200)}
+        assert used == set(shard_names(4))
+
+    def test_adding_a_shard_moves_few_registries(self):
+        names = [f"mirror{i}" for i in range(1000)]
+        before = build_hash_ring(shard_names(4))
+        after = build_hash_ring(shard_names(5))
+        moved = [name for name in names if shard_for(before, name) != shard_for(after, name)]
+        # Only registries taken over by the new shard move
+        assert all(shard_for(after, name) == "redis-4" for name in moved)
+        assert len(moved) < 400
+
+
+class TestAllocateDatabases:
+    """Tests for allocate_databases."""
+
+    def test_initial_allocation_is_positional(self):
+        allocation, changes = allocate_databases(_registries(5), ["redis"])
+        assert allocation == {f"mirror{i}": ("redis", i) for i in range(5)}
+        assert changes == []
+
+    def test_databases_are_dense_per_shard(self):
+        allocation, _ = allocate_databases(_registries(50), shard_names(3))
+        for shard in shard_names(3):
+            dbs = sorted(db for owner, db in allocation.values() if owner == shard)
+            assert dbs == list(range(len(dbs)))
+
+    def test_insertion_keeps_existing_assignments(self):
+        registries = _registries(5)
+        previous, _ = allocate_databases(registries, ["redis"])
+        registries.insert(1, {"name": "inserted"})
+        allocation, changes = allocate_databases(registries, ["redis"], previous)
+        assert {name: allocation[name] for name in previous} == previous
+        assert allocation["inserted"] == ("redis", 5)
+        assert changes == []
+
+    def test_freed_slots_are_reused(self):
+        registries = _registries(5)
+        previous, _ = allocate_databases(registries, ["redis"])
+        del registries[2]
+        registries.append({"name": "new"})
+        allocation, _ = allocate_databases(registries, ["redis"], previous)
+        assert allocation["new"] == ("redis", 2)
+
+    def test_adding_a_shard_keeps_existing_assignments(self):
+        previous, _ = allocate_databases(_registries(20), shard_names(2))
+        allocation, changes = allocate_databases(_registries(20), shard_names(3), previous)
+        assert allocation == previous
+        assert changes == []
+
+    def test_removed_shard_reports_changes(self):
+        previous, _ = allocate_databases(_registries(20), shard_names(3))
+        allocation, changes = allocate_databases(_registries(20), shard_names(2), previous)
+        moved = {name for name, (shard, _) in previous.items() if shard == "redis-2"}
+        assert {name for name, _, _ in changes} == moved
+        assert all(shard != "redis-2" for shard, _ in allocation.values())
+
+    def test_databases_per_shard(self):
+        allocation = {"a": ("redis", 0), "b": ("redis", 3), "c": ("redis-1", 0)}
+        assert databases_per_shard(allocation, shard_names(3)) == {"redis": 4, "redis-1": 1, "redis-2": 0}
+
+
+class TestAllocationFile:
+    """Tests for load_allocation and save_allocation."""
+
+    def test_round_trip(self, tmp_path):
+        allocation = {"a": ("redis", 0), "b": ("redis", 1)}
+        save_allocation(str(tmp_path), allocation)
+        assert load_allocation(str(tmp_path)) == allocation
+
+    def test_missing_file(self, tmp_path):
+        assert load_allocation(str(tmp_path)) == {}
+
+    def test_unsupported_version(self, tmp_path):
+        (tmp_path / "redis-allocation.json").write_text('{"version": 99}')
+        with pytest.raises(ValueError):
+            load_allocation(str(tmp_path))
+
+
+class TestCreateShardServices:
+    """Tests for create_shard_services."""
+
+    def test_points_each_shard_at_its_conf(self):
+        base = {
+            "image": "redis:7.2",
+            "volumes": ["./redis.conf:/usr/local/etc/redis/redis.conf:ro"],
+        }
+        services = create_shard_services(base, ["redis", "redis-1"])
+        assert services["redis-1"]["volumes"] == ["./redis-1.conf:/usr/local/etc/redis/redis.conf:ro"]
+        assert services["redis"]["image"] == "redis:7.2"
+        assert base["volumes"] == ["./redis.conf:/usr/local/etc/redis/redis.conf:ro"]
+
+
+class TestValidateClient:
+    """Tests for validate_client."""
+
+    def test_valid(self):
+        client = {"pool": {"maxidle": 16, "maxactive": 64, "idletimeout": "300s"}, "dialtimeout": "10ms", "readtimeout": "1m30s"}
+        assert validate_client(client) == client
+
+    def test_unlimited_maxactive(self):
+        assert validate_client({"pool": {"maxidle": 32, "maxactive": 0}})["pool"]["maxidle"] == 32
+
+    @pytest.mark.parametrize("client", [
+        {"pool": {"maxidle": 64, "maxactive": 16}},
+        {"pool": {"maxidle": -1}},
+        {"pool": {"maxactive": True}},
+        {"pool": {"size": 10}},
+        {"pool": {"idletimeout": 300}},
+        {"dialtimeout": "10 seconds"},
+        {"timeout": "1s"},
+        "fast",
+    ])
+    def test_invalid(self, client):
+        with pytest.raises(ValueError):
+            validate_client(client)
+
+
+class TestRedisPort:
+    """Tests for redis_port."""
+
+    def test_port_from_addr(self):
+        assert redis_port("redis:6380") == 6380
+
+    def test_default_port(self):
+        assert redis_port(None) == 6379
+        assert redis_port("redis") == 6379
+
+
+class TestSizes:
+    """Tests for parse_size and format_size."""
+
+    def test_parse(self):
+        assert parse_size("64mb") == 64 * 1024 ** 2
+        assert parse_size("1G") == 1000 ** 3
+        assert parse_size(1024) == 1024
+        assert parse_size("512") == 512
+
+    @pytest.mark.parametrize("value", ["64 megabytes", "-1", "mb", True])
+    def test_parse_invalid(self, value):
+        with pytest.raises(ValueError):
+            parse_size(value)
+
+    def test_format(self):
+        assert format_size(352 * 1024 ** 2) == "352mb"
+        assert format_size(2 * 1024 ** 3) == "2gb"
+        assert format_size(1000) == "1000"
+
+
+class TestValidateTuning:
+    """Tests for validate_tuning."""
+
+    def test_defaults(self):
+        settings = validate_tuning({})
+        assert settings["maxmemoryPolicy"] == "allkeys-lfu"
+        assert settings["descriptorMemory"] == 64 * 1024 ** 2
+
+    @pytest.mark.parametrize("tuning", [
+        {"maxmemoryPolicy": "noeviction"},
+        {"maxmemoryPolicy": "volatile-lru"},
+        {"maxmemoryPolicy": "allkeys-lru", "lfuLogFactor": 10},
+        {"maxmemory": "1gb", "descriptorMemory": "64mb"},
+        {"maxmemory": 0},
+        {"persistence": "sometimes"},
+        {"ioThreads": 0},
+        {"hz": 1000},
+        {"lazyfree": "yes"},
+        {"maxmemoryPolicy": "allkeys-lfu", "typo": 1},
+    ])
+    def test_rejects_inconsistent_settings(self, tuning):
+        with pytest.raises(ValueError):
+            validate_tuning(tuning)
+
+
+class TestRedisConf:
+    """Tests for redis_conf."""
+
+    def test_without_tuning(self):
+        assert redis_conf(5) == "databases 5"
+
+    def test_computed_maxmemory(self):
+        conf = redis_conf(5, validate_tuning({"ioThreads": 4}), registry_count=5).splitlines()
+        assert "maxmemory 352mb" in conf
+        assert "maxmemory-policy allkeys-lfu" in conf
+        assert 'save ""' in conf
+        assert "io-threads 4" in conf
+        assert "lazyfree-lazy-eviction yes" in conf
+        assert "hz 10" in conf
+
+    def test_explicit_maxmemory_and_aof(self):
+        conf = redis_conf(2, validate_tuning({"maxmemory": "2gb", "persistence": "aof", "lazyfree": False}), 2).splitlines()
+        assert "maxmemory 2gb" in conf
+        assert "appendonly yes" in conf
+        assert "lazyfree-lazy-eviction no" in conf
+        assert not any(line.startswith("io-threads") for line in conf)
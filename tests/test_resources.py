@@ -0,0 +1,90 @@
+"""Tests for multi_registry_cache.resources module."""
+
+import pytest
+
+from multi_registry_cache.resources import MIB, allocate_resources, apply_limits, validate_resources
+
+SETTINGS = {
+    "budget": {"cpus": 8, "memory": "8gb", "nofile": 200000},
+    "profiles": {"large": {"cpus": 4, "memory": "4gb", "nofile": 100000}},
+}
+
+
+class TestValidateResources:
+    """Tests for validate_resources."""
+
+    def test_sizes_are_parsed(self):
+        settings = validate_resources(SETTINGS)
+        assert settings["budget"] == {"cpus": 8.0, "memory": 8192 * MIB, "nofile": 200000}
+        assert settings["profiles"]["large"]["memory"] == 4096 * MIB
+
+    @pytest.mark.parametrize("settings", [
+        {},
+        {"budget": {"cpus": 8}},
+        {"budget": {"cpus": 0, "memory": "1gb"}},
+        {"budget": {"cpus": 8, "memory": "1gb", "nofile": 100}},
+        {"budget": {"cpus": 8, "memory": "1gb", "disk": "1gb"}},
+        {"budget": {"cpus": 8, "memory": "1gb"}, "profiles": {"small": {"cpus": "half", "memory": "1gb"}}},
+        {"budget": {"cpus": 8, "memory": "1gb"}, "limits": {}},
+        {"budget": {"cpus": 8, "memory": "8gb"}, "profiles": {"large": {"cpus": 4, "memory": "4gb", "nofile": 100000}}},
+    ])
+    def test_invalid(self, settings):
+        with pytest.raises(ValueError):
+            validate_resources(settings)
+
+
+class TestAllocateResources:
+    """Tests for allocate_resources."""
+
+    def test_weights_share_what_profiles_leave(self):
+        registries = [
+            {"name": "dockerhub", "profile": "large"},
+            {"name": "ghcr", "weight": 3},
+            {"name": "private", "replicas": 2},
+        ]
+        limits = allocate_resources(registries, validate_resources(SETTINGS))
+        assert limits["dockerhub"] == {"cpus": 4.0, "memory": 4096 * MIB, "nofile": 100000}
+        # 4 CPUs left, shared by weights 3 (ghcr) and 1 + 1 (two private replicas)
+        assert limits["ghcr"]["cpus"] == pytest.approx(2.4)
+        assert limits["private"]["cpus"] == pytest.approx(0.8)
+        assert limits["ghcr"]["nofile"] == 60000
+
+    def test_oversubscribed_profiles(self):
+        registries = [{"name": "dockerhub", "profile": "large", "replicas": 3}]
+        with pytest.raises(ValueError, match="oversubscribe"):
+            allocate_resources(registries, validate_resources(SETTINGS))
+
+    def test_nothing_left_for_weighted_registries(self):
+        registries = [{"name": "dockerhub", "profile": "large", "replicas": 2}, {"name": "ghcr"}]
+        with pytest.raises(ValueError, match="oversubscribed"):
+            allocate_resources(registries, validate_resources(SETTINGS))
+
+    @pytest.mark.parametrize("registry", [
+        {"name": "a", "profile": "huge"},
+        {"name": "a", "profile": "large", "weight": 2},
+        {"name": "a", "weight": 0},
+        {"name": "a", "weight": True},
+    ])
+    def test_invalid_registry(self, registry):
+        with pytest.raises(ValueError):
+            allocate_resources([registry], validate_resources(SETTINGS))
+
+
+class TestApplyLimits:
+    """Tests for apply_limits."""
+
+    LIMITS = {"cpus": 2.4, "memory": 3000 * MIB, "nofile": 60000}
+
+    def test_limits_and_go_runtime(self):
+        service = {"image": "registry:2", "environment": {"OTEL_TRACES_EXPORTER": "none"}}
+        result = apply_limits(service, self.LIMITS)
+        assert service == {"image": "registry:2", "environment": {"OTEL_TRACES_EXPORTER": "none"}}
+        assert result["deploy"]["resources"]["limits"] == {"cpus": "2.40", "memory": "3000M"}
+        assert result["ulimits"]["nofile"] == {"soft": 60000, "hard": 60000}
+        assert result["environment"] == {"OTEL_TRACES_EXPORTER": "none", "GOMAXPROCS": "2", "GOMEMLIMIT": "2700MiB"}
+
+    def test_list_environment(self):
+        service = {"environment": ["GOMAXPROCS=16", "FOO=bar"]}
+        result = apply_limits(service, {"cpus": 0.5, "memory": 512 * MIB})
+        assert result["environment"] == ["FOO=bar", "GOMAXPROCS=1", "GOMEMLIMIT=460MiB"]
+        assert "ulimits" not in result
@@ -0,0 +1,126 @@
+"""Tests for multi_registry_cache.storage_tuning module."""
+
+import copy
+
+import pytest
+
+from multi_registry_cache.storage_tuning import (
+    GIB,
+    MIB,
+    S3_MAX_PARTS,
+    parse_bandwidth,
+    recommend,
+    tune_storage,
+    validate_driver_tuning,
+)
+
+
+def _s3_config(**params):
+    return {"storage": {"cache": {"blobdescriptor": "redis"}, "s3": {"bucket": "cache", **params}}}
+
+
+class TestParseBandwidth:
+    """Tests for parse_bandwidth."""
+
+    @pytest.mark.parametrize("value, expected", [
+        ("1gbit", 125_000_000),
+        ("500mbit/s", 62_500_000),
+        ("2.5 Gbit", 312_500_000),
+        ("8000bit", 1000),
+    ])
+    def test_valid(self, value, expected):
+        assert parse_bandwidth(value) == expected
+
+    @pytest.mark.parametrize("value", ["1gb", "fast", "0mbit", ""])
+    def test_invalid(self, value):
+        with pytest.raises(ValueError):
+            parse_bandwidth(value)
+
+
+class TestRecommend:
+    """Tests for recommend."""
+
+    def test_s3_defaults_for_large_layers(self):
+        params = recommend("s3", parse_bandwidth("1gbit"), 4 * GIB)
+        assert params["chunksize"] == 32 * MIB
+        assert params["multipartcopychunksize"] == 64 * MIB
+        assert params["multipartcopythresholdsize"] == 64 * MIB
+        assert params["multipartcopymaxconcurrency"] == 64
+        assert params["maxconcurrency"] == 16
+
+    def test_s3_parts_fit_the_part_limit(self):
+        layer_size = 1024 * GIB
+        params = recommend("s3", parse_bandwidth("100mbit"), layer_size)
+        assert params["chunksize"] * S3_MAX_PARTS >= layer_size
+        validate_driver_tuning("s3", params, layer_size)
+
+    def test_gcs_chunks_are_aligned(self):
+        params = recommend("gcs", parse_bandwidth("10gbit"), 4 * GIB)
+        assert params == {"chunksize": 256 * MIB}
+        validate_driver_tuning("gcs", params)
+
+
+class TestValidateDriverTuning:
+    """Tests for validate_driver_tuning."""
+
+    def test_sizes_accept_units(self):
+        assert validate_driver_tuning("s3", {"chunksize": "64mb", "maxconcurrency": 10}) == {
+            "chunksize": 64 * MIB,
+            "maxconcurrency": 10,
+        }
+
+    @pytest.mark.parametrize("params", [
+        {"chunksize": "4mb"},
+        {"multipartcopychunksize": "6gb"},
+        {"multipartcopythresholdsize": "6gb"},
+        {"multipartcopymaxconcurrency": 0},
+        {"maxconcurrency": True},
+    ])
+    def test_s3_limits(self, params):
+        with pytest.raises(ValueError):
+            validate_driver_tuning("s3", params)
+
+    def test_s3_chunksize_too_small_for_layer_size(self):
+        with pytest.raises(ValueError, match="parts"):
+            validate_driver_tuning("s3", {"chunksize": "5mb"}, 100 * GIB)
+
+    @pytest.mark.parametrize("chunksize", ["100kb", "1000000"])
+    def test_gcs_alignment(self, chunksize):
+        with pytest.raises(ValueError, match="256KB"):
+            validate_driver_tuning("gcs", {"chunksize": chunksize})
+
+
+class TestTuneStorage:
+    """Tests for tune_storage."""
+
+    def test_precedence(self):
+        config = _s3_config(chunksize="16mb", multipartcopychunksize="128mb")
+        original = copy.deepcopy(config)
+        tuned = tune_storage(
+            config,
+            {"linkBandwidth": "1gbit", "layerSize": "4gb", "multipartcopychunksize": "256mb", "maxconcurrency": 8},
+            {"maxconcurrency": 32},
+        )["storage"]["s3"]
+        assert config == original
+        assert tuned["bucket"] == "cache"
+        # Driver config over recommendation, global settings over driver config, registry over global
+        assert tuned["chunksize"] == 16 * MIB
+        assert tuned["multipartcopychunksize"] == 256 * MIB
+        assert tuned["maxconcurrency"] == 32
+        assert tuned["multipartcopymaxconcurrency"] == 64
+
+    def test_explicit_values_are_validated_without_settings(self):
+        with pytest.raises(ValueError):
+            tune_storage(_s3_config(chunksize="1mb"))
+
+    def test_other_drivers_are_unchanged(self):
+        config = {"storage": {"filesystem": {"rootdirectory": "/var/lib/registry"}}}
+        assert tune_storage(config, {"linkBandwidth": "1gbit"}) is config
+
+    def test_unknown_setting(self):
+        with pytest.raises(ValueError, match="multipartcopychunksize"):
+            tune_storage({"storage": {"gcs": {"bucket": "cache"}}}, {"multipartcopychunksize": "64mb"})
+
+    def test_not_a_mapping(self):
+        with pytest.raises(ValueError):
+            tune_storage(_s3_config(), ["1gbit"])
@@ -0,0 +1,81 @@
+"""Tests for multi_registry_cache.tiers module."""
+
+import pytest
+
+from multi_registry_cache.functions import compile_template
+from multi_registry_cache.tiers import tier_registries, validate_tiers
+
+ROUTER = {"rule": "Host(`{name}.{tier}.example.net`)", "service": "{name}", "tls": {}}
+REGISTRIES = [
+    {"name": "dockerhub", "type": "cache", "url": "https://registry-1.docker.io",
+     "username": "user", "password": "pass", "ttl": "720h"},
+    {"name": "ghcr", "type": "cache", "url": "https://ghcr.io"},
+    {"name": "private", "type": "registry"},
+]
+NAMES = [registry["name"] for registry in REGISTRIES]
+
+
+class TestValidateTiers:
+    """Tests for validate_tiers."""
+
+    def test_upstream_tiers_come_first(self):
+        tiers = validate_tiers([
+            {"name": "paris", "upstream": "eu"},
+            {"name": "eu", "upstream": "central"},
+            {"name": "central"},
+        ], NAMES)
+        assert list(tiers) == ["central", "eu", "paris"]
+        assert tiers["paris"]["registries"] == NAMES
+
+    @pytest.mark.parametrize("tiers, match", [
+        ([{"name": "a", "upstream": "b"}, {"name": "b", "upstream": "a"}], "loop"),
+        ([{"name": "a", "upstream": "a"}], "loop"),
+        ([{"name": "a", "upstream": "central"}], "unknown upstream"),
+        ([{"name": "central", "registries": ["ghcr"]}, {"name": "edge", "upstream": "central"}], "missing"),
+        ([{"name": "central", "registries": ["quay"]}], "unknown registries"),
+        ([{"name": "central", "vars": {"tier": "x"}}], "vars"),
+        ([{"name": "central", "site": "x"}], "Unknown"),
+        ([{"name": "central"}, {"name": "central"}], "Duplicate"),
+    ])
+    def test_invalid(self, tiers, match):
+        with pytest.raises(ValueError, match=match):
+            validate_tiers(tiers, NAMES)
+
+
+class TestTierRegistries:
+    """Tests for tier_registries."""
+
+    def test_edge_caches_the_central_tier(self):
+        tiers = validate_tiers([{"name": "central"}, {"name": "edge", "upstream": "central"}], NAMES)
+        central = tier_registries("central", tiers, REGISTRIES, compile_template(ROUTER))
+        edge = tier_registries("edge", tiers, REGISTRIES, compile_template(ROUTER))
+
+        assert central[0]["url"] == "https://registry-1.docker.io"
+        assert central[2]["type"] == "registry"
+        assert edge[0]["url"] == "https://dockerhub.central.example.net"
+        assert (edge[0]["username"], edge[0]["password"], edge[0]["ttl"]) == ("user", "pass", "720h")
+        assert edge[2] == {"name": "private", "type": "cache", "tier": "edge", "url": "https://private.central.example.net"}
+        assert REGISTRIES[2] == {"name": "private", "type": "registry"}
+
+    def test_vars_and_plain_http(self):
+        router = {"rule": "Host(`{name}.{site}.example.net`)"}
+        tiers = validate_tiers([
+            {"name": "central", "vars": {"site": "hq"}},
+            {"name": "edge", "upstream": "central", "registries": ["ghcr"], "vars": {"site": "lyon"}},
+        ], NAMES)
+        edge = tier_registries("edge", tiers, REGISTRIES, router)
+        assert edge == [{"name": "ghcr", "type": "cache", "url": "http://ghcr.hq.example.net", "site": "lyon", "tier": "edge"}]
+
+    def test_edge_leaves_upstreams_to_the_central_tier(self):
+        registries = [{"name": "hub", "type": "cache", "upstreamMode": "weighted",
+                       "upstreams": ["https://registry-1.docker.io", "https://mirror.gcr.io"]}]
+        tiers = validate_tiers([{"name": "central"}, {"name": "edge", "upstream": "central"}], ["hub"])
+        assert "upstreams" in tier_registries("central", tiers, registries, ROUTER)[0]
+        assert tier_registries("edge", tiers, registries, ROUTER) == [
+            {"name": "hub", "type": "cache", "tier": "edge", "url": "https://hub.central.example.net"},
+        ]
+
+    def test_same_hostname_on_both_tiers(self):
+        tiers = validate_tiers([{"name": "central"}, {"name": "edge", "upstream": "central"}], NAMES)
+        with pytest.raises(ValueError, match="same hostname"):
+            tier_registries("edge", tiers, REGISTRIES, {"rule": "Host(`{name}.example.net`)"})
@@ -0,0 +1,184 @@
+"""Tests for multi_registry_cache.upstreams module."""
+
+import pytest
+
+from multi_registry_cache.upstreams import (
+    add_health_check, backend_names, create_backend_service, create_upstream_services, generated_names, resolve_upstreams,
+    validate_names
+)
+
+SERVICE = {"loadBalancer": {"servers": [{"url": "http://{name}:5000"}]}}
+
+
+def _registry(**extra):
+    return {
+        "name": "hub", "type": "cache", "ttl": "720h",
+        "upstreams": [
+            {"name": "docker", "url": "https://registry-1.docker.io", "username": "user", "password": "pass"},
+            {"url": "https://mirror.gcr.io", "ttl": "24h"},
+        ],
+        **extra,
+    }
+
+
+class TestResolveUpstreams:
+    """Tests for resolve_upstreams."""
+
+    def test_single_url_registry(self):
+        assert resolve_upstreams({"name": "ghcr", "type": "cache", "url": "https://ghcr.io"}) is None
+
+    def test_upstream_registries(self):
+        docker, mirror = resolve_upstreams(_registry())
+        assert docker["backend"] == "hub-docker"
+        assert mirror["name"] == "upstream2"
+        assert docker["registry"] == {
+            "name": "hub", "type": "cache", "ttl": "720h",
+            "url": "https://registry-1.docker.io", "username": "user", "password": "pass",
+        }
+        assert mirror["registry"]["ttl"] == "24h"
+        assert "username" not in mirror["registry"]
+        assert docker["health"] == {"tcp": [
+            {"addr": "registry-1.docker.io:443", "timeout": "3s", "interval": "10s", "threshold": 3},
+        ]}
+
+    def test_http_health_check(self):
+        registry = _registry()
+        registry["upstreams"][1]["healthCheck"] = {"statuscode": 200}
+        assert resolve_upstreams(registry)[1]["health"] == {
+            "http": [{"uri": "https://mirror.gcr.io/v2/", "statuscode": 200}],
+        }
+
+    @pytest.mark.parametrize("extra, match", [
+        ({"type": "registry"}, "not a cache"),
+        ({"url": "https://a.example"}, "per upstream"),
+        ({"upstreamMode": "random"}, "upstreamMode"),
+        ({"upstreams": ["https://a.example"]}, "at least two"),
+        ({"upstreams": ["https://a.example", {"name": "a-b", "url": "https://b.example"}]}, "Invalid upstream name"),
+        ({"upstreams": ["https://a.example", {"name": "blobs", "url": "https://b.example"}]}, "Invalid upstream name"),
+        ({"upstreams": [{"name": "a", "url": "https://a.example"}, {"name": "a", "url": "https://b.example"}]},
+         "Duplicate"),
+        ({"upstreams": ["https://a.example", {"url": "https://b.example", "weight": 0}]}, "weight"),
+        ({"upstreams": ["https://a.example", {"url": "https://b.example", "proxy": {}}]}, "Unknown key"),
+        ({"upstreams": ["https://a.example", {"url": "https://b.example", "healthCheck": {"path": "/"}}]},
+         "Unknown healthCheck"),
+        ({"upstreams": ["https://a.example", "b.example"]}, "absolute URL"),
+    ])
+    def test_invalid_upstreams(self, extra, match):
+        with pytest.raises(ValueError, match=match):
+            resolve_upstreams(_registry(**extra))
+
+    def test_mode_without_upstreams(self):
+        with pytest.raises(ValueError, match="no upstreams"):
+            resolve_upstreams({"name": "ghcr", "url": "https://ghcr.io", "upstreamMode": "weighted"})
+
+
+class TestBackendNames:
+    """Tests for backend_names."""
+
+    def test_replicas_of_each_upstream(self):
+        assert backend_names(_registry(replicas=2)) == ["hub-docker-1", "hub-docker-2", "hub-upstream2-1", "hub-upstream2-2"]
+
+    def test_single_url_registry(self):
+        assert backend_names({"name": "ghcr", "replicas": 2}) == ["ghcr-1", "ghcr-2"]
+
+
+class TestValidateNames:
+    """Tests for generated_names and validate_names."""
+
+    def test_generated_names(self):
+        registry = _registry()
+        registry["upstreams"].append("https://quay.io")
+        names = generated_names(registry)
+        assert names["config file"] == ["hub-docker.yaml", "hub-upstream2.yaml", "hub-upstream3.yaml"]
+        assert names["Traefik service"] == ["hub", "hub-docker", "hub-upstream2", "hub-upstream2-failover", "hub-upstream3"]
+        assert names["Traefik router"] == ["hub", "hub-manifests", "hub-blobs"]
+
+    @pytest.mark.parametrize("other", [
+        {"name": "hub-docker"},
+        {"name": "hub-upstream2-failover", "upstreams": ["https://a.example", "https://b.example"]},
+        {"name": "hub-blobs"},
+    ])
+    def test_collisions(self, other):
+        registry = _registry()
+        registry["upstreams"].append("https://quay.io")
+        with pytest.raises(ValueError, match="both generate"):
+            validate_names([registry, other])
+
+    def test_replica_collision(self):
+        with pytest.raises(ValueError, match="Compose service a-1"):
+            validate_names([{"name": "a", "replicas": 2}, {"name": "a-1"}])
+
+    def test_replicas_of_distinct_registries(self):
+        validate_names([{"name": "a", "replicas": 2}, {"name": "b", "replicas": 2}, _registry()])
+
+
+class TestAddHealthCheck:
+    """Tests for add_health_check."""
+
+    def test_checks_are_appended(self):
+        config = {"health": {"storagedriver": {"enabled": True}, "tcp": [{"addr": "redis:6379"}]}}
+        result = add_health_check(config, {"tcp": [{"addr": "ghcr.io:443"}]})
+        assert result["health"]["tcp"] == [{"addr": "redis:6379"}, {"addr": "ghcr.io:443"}]
+        assert result["health"]["storagedriver"] == {"enabled": True}
+        assert config["health"]["tcp"] == [{"addr": "redis:6379"}]
+
+    def test_disabled(self):
+        config = {"version": 0.1}
+        assert add_health_check(config, None) is config
+
+
+class TestCreateBackendService:
+    """Tests for create_backend_service."""
+
+    def test_config_file_is_replaced(self):
+        service = {"image": "registry:2", "volumes": [
+            "./hub.yaml:/etc/docker/registry/config.yml:ro",
+            "./dockerhub.yaml:/other.yml:ro",
+            {"type": "bind", "source": "./hub.yaml", "target": "/config.yml"},
+        ]}
+        assert create_backend_service(service, "hub", "hub-docker")["volumes"] == [
+            "./hub-docker.yaml:/etc/docker/registry/config.yml:ro",
+            "./dockerhub.yaml:/other.yml:ro",
+            {"type": "bind", "source": "./hub-docker.yaml", "target": "/config.yml"},
+        ]
+        assert service["volumes"][0] == "./hub.yaml:/etc/docker/registry/config.yml:ro"
+
+    def test_missing_config_mount(self):
+        with pytest.raises(ValueError, match="must mount hub.yaml"):
+            create_backend_service({"image": "registry:2"}, "hub", "hub-docker")
+
+
+class TestCreateUpstreamServices:
+    """Tests for create_upstream_services."""
+
+    def test_failover_chain(self):
+        registry = _registry()
+        registry["upstreams"].append("https://quay.io")
+        service, services = create_upstream_services(registry, resolve_upstreams(registry), "failover", SERVICE, "hub")
+        assert service == {"failover": {"service": "hub-docker", "fallback": "hub-upstream2-failover"}}
+        assert services["hub-upstream2-failover"] == {
+            "failover": {"service": "hub-upstream2", "fallback": "hub-upstream3", "healthCheck": {}},
+        }
+        load_balancer = services["hub-docker"]["loadBalancer"]
+        assert load_balancer["servers"] == [{"url": "http://hub-docker:5000"}]
+        assert load_balancer["serversTransport"] == "hub"
+        assert "healthCheck" in load_balancer
+
+    def test_two_upstreams_need_no_chain(self):
+        registry = _registry()
+        service, services = create_upstream_services(registry, resolve_upstreams(registry), "failover", SERVICE)
+        assert service == {"failover": {"service": "hub-docker", "fallback": "hub-upstream2"}}
+        assert sorted(services) == ["hub-docker", "hub-upstream2"]
+
+    def test_weighted(self):
+        registry = _registry()
+        registry["upstreams"][0]["weight"] = 4
+        service, _ = create_upstream_services(registry, resolve_upstreams(registry), "weighted", SERVICE)
+        assert service == {"weighted": {"services": [
+            {"name": "hub-docker", "weight": 4}, {"name": "hub-upstream2", "weight": 1},
+        ], "healthCheck": {}}}
+
+    def test_requires_load_balancer(self):
+        registry = _registry()
+        with pytest.raises(ValueError, match="loadBalancer"):
+            create_upstream_services(registry, resolve_upstreams(registry), "failover", {"weighted": {}})
@@ -0,0 +1,267 @@
+"""Tests for multi_registry_cache.warm module."""
+
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import yaml
+
+from multi_registry_cache.warm import (
+    WarmError,
+    load_state,
+    parse_image_reference,
+    resolve_caches,
+    save_state,
+    warm,
+)
+
+
+def _blob(content):
+    return f"sha256:{hashlib.sha256(content).hexdigest()}", content
+
+
+CONFIG_AMD64 = _blob(b'{"architecture": "amd64"}')
+CONFIG_ARM64 = _blob(b'{"architecture": "arm64"}')
+SHARED_LAYER = _blob(b"shared layer" * 1000)
+LAYER_AMD64 = _blob(b"amd64 layer" * 1000)
+LAYER_ARM64 = _blob(b"arm64 layer" * 1000)
+
+
+def _image_manifest(config, *layers):
+    return json.dumps({
+        "schemaVersion": 2,
+        "mediaType": "application/vnd.oci.image.manifest.v1+json",
+        "config": {"digest": config[0], "size": len(config[1])},
+        "layers": [{"digest": digest, "size": len(content)} for digest, content in layers],
+    }).encode()
+
+
+MANIFEST_AMD64 = _blob(_image_manifest(CONFIG_AMD64, SHARED_LAYER, LAYER_AMD64))
+MANIFEST_ARM64 = _blob(_image_manifest(CONFIG_ARM64, SHARED_LAYER, LAYER_ARM64))
+INDEX = json.dumps({
+    "schemaVersion": 2,
+    "mediaType": "application/vnd.oci.image.index.v1+json",
+    "manifests": [
+        {"digest": MANIFEST_AMD64[0], "platform": {"os": "linux", "architecture": "amd64"}},
+        {"digest": MANIFEST_ARM64[0], "platform": {"os": "linux", "architecture": "arm64", "variant": "v8"}},
+        {
+            "digest": "sha256:attestation",
+            "platform": {"os": "unknown", "architecture": "unknown"},
+            "annotations": {"vnd.docker.reference.type": "attestation-manifest"},
+        },
+    ],
+}).encode()
+
+
+class StandInRegistry(ThreadingHTTPServer):
+    """A minimal registry serving library/app:1.0 (multi-arch) and library/tool:2.0."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _RegistryHandler)
+        self.manifests = {
+            "library/app": {"1.0": INDEX, MANIFEST_AMD64[0]: MANIFEST_AMD64[1], MANIFEST_ARM64[0]: MANIFEST_ARM64[1]},
+            "library/tool": {"2.0": MANIFEST_AMD64[1]},
+        }
+        self.blobs = dict([CONFIG_AMD64, CONFIG_ARM64, SHARED_LAYER, LAYER_AMD64, LAYER_ARM64])
+        self.failing = set()
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def blob_requests(self):
+        return [path for _, path in self.requests if "/blobs/" in path]
+
+
+class _RegistryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append((self.headers["Host"], self.path))
+        _, _, repository_and_kind = self.path.partition("/v2/")
+        if "/manifests/" in self.path:
+            repository, _, reference = repository_and_kind.partition("/manifests/")
+            body = self.server.manifests.get(repository, {}).get(reference)
+        else:
+            repository, _, digest = repository_and_kind.partition("/blobs/")
+            body = None if digest in self.server.failing else self.server.blobs.get(digest)
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def registry_server():
+    server = StandInRegistry()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def config_path(tmp_path, sample_config):
+    path = tmp_path / "config.yaml"
+    path.write_text(yaml.safe_dump(sample_config))
+    return str(path)
+
+
+class TestParseImageReference:
+    """Tests for parse_image_reference."""
+
+    @pytest.mark.parametrize("reference, expected", [
+        ("nginx", ("docker.io", "library/nginx", "latest")),
+        ("nginx:1.27", ("docker.io", "library/nginx", "1.27")),
+        ("bitnami/redis:7", ("docker.io", "bitnami/redis", "7")),
+        ("ghcr.io/owner/app:1.2", ("ghcr.io", "owner/app", "1.2")),
+        ("localhost:5000/app", ("localhost:5000", "app", "latest")),
+        ("quay.io/org/app@sha256:abc", ("quay.io", "org/app", "sha256:abc")),
+    ])
+    def test_references(self, reference, expected):
+        assert parse_image_reference(reference) == expected
+
+    def test_invalid_reference(self):
+        with pytest.raises(ValueError):
+            parse_image_reference("ghcr.io/Owner/App")
+
+
+class TestResolveCaches:
+    """Tests for resolve_caches."""
+
+    def test_hosts_from_router_rule(self, sample_config):
+        caches = resolve_caches(sample_config)
+        assert caches["ghcr.io"]["base_url"] == "https://ghcr.registry-cache.example.net"
+        assert caches["ghcr.registry-cache.example.net"] is caches["ghcr.io"]
+        assert caches["docker.io"]["name"] == "dockerhub"
+        assert caches["registry-1.docker.io"]["name"] == "dockerhub"
+        assert "private" not in {cache["name"] for cache in caches.values()}
+
+    def test_endpoint_override(self, sample_config):
+        caches = resolve_caches(sample_config, "http://127.0.0.1:8080")
+        assert caches["quay.io"]["base_url"] == "http://127.0.0.1:8080"
+        assert caches["quay.io"]["host"] == "quay.registry-cache.example.net"
+
+    def test_rule_without_host(self, sample_config):
+        sample_config["traefik"]["perRegistry"]["router"]["rule"] = "PathPrefix(`/{name}`)"
+        with pytest.raises(ValueError):
+            resolve_caches(sample_config)
+
+    def test_upstreams_are_aliases(self, sample_config):
+        dockerhub = sample_config["registries"][0]
+        dockerhub["upstreams"] = [
+            {"url": dockerhub.pop("url"), "username": dockerhub.pop("username"), "password": dockerhub.pop("password")},
+            "https://mirror.gcr.io",
+        ]
+        caches = resolve_caches(sample_config)
+        assert caches["docker.io"]["name"] == "dockerhub"
+        assert caches["mirror.gcr.io"]["name"] == "dockerhub"
+
+    def test_single_tier(self, sample_config):
+        sample_config["traefik"]["perRegistry"]["router"]["rule"] = "Host(`{name}.{tier}.example.net`)"
+        sample_config["tiers"] = [{"name": "central"}]
+        caches = resolve_caches(sample_config)
+        assert caches["docker.io"]["host"] == "dockerhub.central.example.net"
+        assert caches["dockerhub.central.example.net"]["name"] == "dockerhub"
+
+    def test_edge_tier(self, sample_config):
+        sample_config["traefik"]["perRegistry"]["router"]["rule"] = "Host(`{name}.{site}.example.net`)"
+        sample_config["tiers"] = [
+            {"name": "central", "vars": {"site": "hq"}},
+            {"name": "edge", "upstream": "central", "vars": {"site": "paris"}},
+        ]
+        with pytest.raises(ValueError, match="central, edge"):
+            resolve_caches(sample_config)
+        caches = resolve_caches(sample_config, tier="edge")
+        assert caches["docker.io"]["host"] == "dockerhub.paris.example.net"
+        assert caches["dockerhub.hq.example.net"]["name"] == "dockerhub"
+        # The private registry of the central tier is cached on the edges
+        assert caches["private.hq.example.net"]["host"] == "private.paris.example.net"
+
+    def test_tier_without_tiers(self, sample_config):
+        with pytest.raises(ValueError, match="no tiers"):
+            resolve_caches(sample_config, tier="edge")
+
+
+class TestWarm:
+    """Tests for warm against a stand-in registry."""
+
+    def test_multi_arch_image_is_warmed(self, registry_server, config_path, tmp_path):
+        state_path = tmp_path / "state.json"
+        stats = warm(config_path, ["app:1.0", "tool:2.0"], state_path=str(state_path), endpoint=registry_server.url)
+
+        blobs = registry_server.blob_requests()
+        assert sorted(path.rsplit("/", 1)[1] for path in blobs) == sorted(registry_server.blobs)
+        assert {host for host, _ in registry_server.requests} == {"dockerhub.registry-cache.example.net"}
+        assert "sha256:attestation" not in "".join(path for _, path in registry_server.requests)
+        assert stats["dockerhub"]["images"] == 2
+        assert stats["dockerhub"]["manifests"] == 4
+        assert stats["dockerhub"]["blobs"] == 5
+        assert stats["dockerhub"]["bytes"] == sum(len(content) for content in registry_server.blobs.values())
+        assert not state_path.exists()
+
+    def test_platform_filter(self, registry_server, config_path, tmp_path):
+        warm(config_path, ["docker.io/library/app:1.0"], state_path=str(tmp_path / "state.json"),
+             endpoint=registry_server.url, platforms=["linux/arm64/v8"])
+        fetched = {path.rsplit("/", 1)[1] for path in registry_server.blob_requests()}
+        assert fetched == {CONFIG_ARM64[0], SHARED_LAYER[0], LAYER_ARM64[0]}
+
+    def test_resume_after_failure(self, registry_server, config_path, tmp_path):
+        state_path = tmp_path / "state.json"
+        registry_server.failing.add(LAYER_ARM64[0])
+        with pytest.raises(WarmError):
+            warm(config_path, ["app:1.0"], state_path=str(state_path), endpoint=registry_server.url, concurrency=1)
+        assert load_state(str(state_path))["dockerhub"] == {CONFIG_AMD64[0], CONFIG_ARM64[0], SHARED_LAYER[0], LAYER_AMD64[0]}
+
+        registry_server.failing.clear()
+        registry_server.requests.clear()
+        stats = warm(config_path, ["app:1.0"], state_path=str(state_path), endpoint=registry_server.url)
+        assert [path.rsplit("/", 1)[1] for path in registry_server.blob_requests()] == [LAYER_ARM64[0]]
+        assert stats["dockerhub"]["cached"] == 4
+        assert not state_path.exists()
+
+    def test_tiered_config(self, registry_server, sample_config, tmp_path):
+        sample_config["traefik"]["perRegistry"]["router"]["rule"] = "Host(`{name}.{tier}.example.net`)"
+        sample_config["tiers"] = [{"name": "central"}, {"name": "edge", "upstream": "central"}]
+        path = tmp_path / "config.yaml"
+        path.write_text(yaml.safe_dump(sample_config))
+        warm(str(path), ["tool:2.0"], state_path=str(tmp_path / "state.json"), endpoint=registry_server.url,
+             tier="edge")
+        assert {host for host, _ in registry_server.requests} == {"dockerhub.edge.example.net"}
+
+    def test_unknown_registry_and_missing_image(self, registry_server, config_path, tmp_path):
+        with pytest.raises(WarmError):
+            warm(config_path, ["example.org/app", "missing:1.0", "tool:2.0"],
+                 state_path=str(tmp_path / "state.json"), endpoint=registry_server.url)
+        assert len(registry_server.blob_requests()) == 3
+
+
+class TestState:
+    """Tests for load_state and save_state."""
+
+    def test_round_trip(self, tmp_path):
+        path = str(tmp_path / "state.json")
+        save_state(path, {"dockerhub": {"sha256:b", "sha256:a"}, "ghcr": set()})
+        assert load_state(path) == {"dockerhub": {"sha256:a", "sha256:b"}}
+
+    def test_missing_or_invalid_state(self, tmp_path):
+        path = tmp_path / "state.json"
+        assert load_state(str(path)) == {}
+        path.write_text('{"version": 0, "blobs": {"dockerhub": ["sha256:a"]}}')
+        assert load_state(str(path)) == {}
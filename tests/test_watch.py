@@ -0,0 +1,236 @@
+"""Tests for multi_registry_cache.watch module."""
+
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+import yaml
+
+from multi_registry_cache import watch as watch_module
+from multi_registry_cache.watch import InotifyWatcher, PollingWatcher, bundle_services, compose_reload, watch
+
+
+class _QueueWatcher:
+    """Watcher stand-in whose changes are pushed by the test."""
+
+    def __init__(self):
+        self.events = queue.Queue()
+        self.paths = None
+        self.closed = False
+
+    def set_paths(self, paths):
+        self.paths = paths
+
+    def wait(self, timeout):
+        try:
+            self.events.get(timeout=min(timeout, 0.05))
+        except queue.Empty:
+            return False
+        return True
+
+    def close(self):
+        self.closed = True
+
+
+def _wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.01)
+
+
+class TestWatchers:
+    """Tests for the inotify and polling watchers."""
+
+    def test_polling_watcher(self, tmp_path):
+        path = tmp_path / "config.yaml"
+        path.write_text("a: 1\n")
+        watcher = PollingWatcher(str(path), interval=0.01)
+        assert watcher.wait(0.02) is False
+        path.write_text("a: 22\n")
+        assert watcher.wait(0.5) is True
+
+    @pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux only")
+    def test_inotify_watcher_follows_renames(self, tmp_path):
+        path = tmp_path / "config.yaml"
+        path.write_text("a: 1\n")
+        watcher = InotifyWatcher(str(path))
+        try:
+            (tmp_path / "other.yaml").write_text("b: 1\n")
+            assert watcher.wait(0.1) is False
+            # Editors often save by renaming a temp file over the original
+            (tmp_path / ".config.yaml.swp").write_text("a: 2\n")
+            os.replace(tmp_path / ".config.yaml.swp", path)
+            assert watcher.wait(1) is True
+        finally:
+            watcher.close()
+
+    def test_polling_watcher_source_directory(self, tmp_path):
+        source = tmp_path / "registries.d"
+        source.mkdir()
+        watcher = PollingWatcher([str(tmp_path / "config.yaml"), str(source)], interval=0.01)
+        (source / ".ghcr.yaml.swp").write_text("name: ghcr\n")
+        assert watcher.wait(0.02) is False
+        (source / "ghcr.yaml").write_text("name: ghcr\n")
+        assert watcher.wait(0.5) is True
+
+    @pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux only")
+    def test_inotify_watcher_sources(self, tmp_path):
+        source = tmp_path / "registries.d"
+        source.mkdir()
+        path = tmp_path / "config.yaml"
+        path.write_text("a: 1\n")
+        watcher = InotifyWatcher(str(path))
+        try:
+            (source / "ghcr.yaml").write_text("name: ghcr\n")
+            assert watcher.wait(0.1) is False
+            watcher.set_paths([str(path), str(source), str(tmp_path / "cmdb.csv")])
+            (source / "README.md").write_text("registries\n")
+            assert watcher.wait(0.1) is False
+            (source / "ghcr.yaml").write_text("name: ghcr\ntype: cache\n")
+            assert watcher.wait(1) is True
+            (tmp_path / "cmdb.csv").write_text("name\nquay\n")
+            assert watcher.wait(1) is True
+            while watcher.wait(0.1):
+                pass
+            path.write_text("a: 2\n")
+            assert watcher.wait(1) is True
+        finally:
+            watcher.close()
+
+
+class TestComposeReload:
+    """Tests for bundle_services and compose_reload."""
+
+    def test_bundles(self, tmp_path):
+        (tmp_path / "tiers" / "central").mkdir(parents=True)
+        (tmp_path / "tiers" / "edge" / "nodes" / "node-1").mkdir(parents=True)
+        services = ["central/dockerhub", "central/redis", "edge/front/traefik", "edge/node-1/ghcr"]
+        assert bundle_services(str(tmp_path), services) == {
+            (os.path.join("tiers", "central"), None): ["dockerhub", "redis"],
+            (os.path.join("tiers", "edge", "front"), None): ["traefik"],
+            (os.path.join("tiers", "edge", "nodes", "node-1"), "node-1"): ["ghcr"],
+        }
+        assert bundle_services(str(tmp_path), ["node-1/ghcr", "front/traefik", "quay"]) == {
+            (os.path.join("nodes", "node-1"), "node-1"): ["ghcr"],
+            ("front", None): ["traefik"],
+            ("", None): ["quay"],
+        }
+
+    def test_compose_runs_in_each_local_bundle(self, tmp_path, monkeypatch):
+        (tmp_path / "tiers" / "central").mkdir(parents=True)
+        runs = []
+
+        def run(command, cwd, check):
+            runs.append((command, cwd))
+            return subprocess.CompletedProcess(command, 0)
+
+        monkeypatch.setattr(watch_module.subprocess, "run", run)
+        compose_reload(str(tmp_path))(["central/dockerhub", "front/traefik", "node-1/ghcr"])
+        assert runs == [
+            (["docker", "compose", "up", "-d", "dockerhub"], os.path.join(str(tmp_path), "tiers", "central")),
+            (["docker", "compose", "up", "-d", "traefik"], os.path.join(str(tmp_path), "front")),
+        ]
+
+
+class TestWatch:
+    """Tests for the watch loop."""
+
+    def test_only_changed_services_are_reloaded(self, tmp_path, sample_config):
+        config_path = tmp_path / "config.yaml"
+        config_path.write_text(yaml.safe_dump(sample_config))
+        output_dir = tmp_path / "compose"
+        reloads = []
+        stop = threading.Event()
+        watcher = _QueueWatcher()
+        thread = threading.Thread(target=watch, kwargs={
+            "config_path": str(config_path), "output_dir": str(output_dir), "reload": reloads.append,
+            "debounce": 0.01, "stop": stop, "watcher": watcher,
+        })
+        thread.start()
+        try:
+            _wait_for(lambda: len(reloads) == 1)
+            first = sample_config["registries"][0]["name"]
+            assert first in reloads[0]
+
+            # A burst of saves results in a single run
+            sample_config["registries"][0]["ttl"] = "12h"
+            config_path.write_text(yaml.safe_dump(sample_config))
+            for _ in range(3):
+                watcher.events.put(True)
+            _wait_for(lambda: len(reloads) == 2)
+            assert reloads[1] == [first]
+
+            # An invalid config keeps the loop running, without reloading anything
+            config_path.write_text("registries: [\n")
+            watcher.events.put(True)
+            time.sleep(0.3)
+            sample_config["registries"][0]["ttl"] = "24h"
+            config_path.write_text(yaml.safe_dump(sample_config))
+            watcher.events.put(True)
+            _wait_for(lambda: len(reloads) == 3)
+            assert reloads[2] == [first]
+        finally:
+            stop.set()
+            thread.join(timeout=10)
+        assert watcher.closed
+
+    def test_unchanged_content_is_not_regenerated(self, tmp_path, sample_config):
+        config_path = tmp_path / "config.yaml"
+        config_path.write_text(yaml.safe_dump(sample_config))
+        output_dir = tmp_path / "compose"
+        reloads = []
+        stop = threading.Event()
+        watcher = _QueueWatcher()
+        thread = threading.Thread(target=watch, kwargs={
+            "config_path": str(config_path), "output_dir": str(output_dir), "reload": reloads.append,
+            "debounce": 0.01, "stop": stop, "watcher": watcher,
+        })
+        thread.start()
+        try:
+            _wait_for(lambda: len(reloads) == 1)
+            manifest_mtime = (output_dir / ".manifest.json").stat().st_mtime_ns
+            config_path.write_text(yaml.safe_dump(sample_config))
+            watcher.events.put(True)
+            time.sleep(0.3)
+        finally:
+            stop.set()
+            thread.join(timeout=10)
+        assert len(reloads) == 1
+        assert (output_dir / ".manifest.json").stat().st_mtime_ns == manifest_mtime
+
+    def test_registry_sources_are_watched(self, tmp_path, sample_config):
+        config_path = tmp_path / "config.yaml"
+        moved = sample_config["registries"].pop(0)
+        sample_config["registriesFrom"] = "registries.jsonl"
+        config_path.write_text(yaml.safe_dump(sample_config))
+        source = tmp_path / "registries.jsonl"
+        source.write_text(json.dumps(moved) + "\n")
+        output_dir = tmp_path / "compose"
+        reloads = []
+        stop = threading.Event()
+        watcher = _QueueWatcher()
+        thread = threading.Thread(target=watch, kwargs={
+            "config_path": str(config_path), "output_dir": str(output_dir), "reload": reloads.append,
+            "debounce": 0.01, "stop": stop, "watcher": watcher,
+        })
+        thread.start()
+        try:
+            _wait_for(lambda: len(reloads) == 1)
+            assert watcher.paths == [str(config_path), str(source)]
+
+            # Only the source changed
+            moved["ttl"] = "12h"
+            source.write_text(json.dumps(moved) + "\n")
+            watcher.events.put(True)
+            _wait_for(lambda: len(reloads) == 2)
+            assert reloads[1] == [moved["name"]]
+        finally:
+            stop.set()
+            thread.join(timeout=10)